@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class BaseConfig(AppConfig):
     name = 'base'
+
+    # Connects the signal handlers that keep the version stamps current
+    def ready(self):
+        from base import signals  # noqa: F401
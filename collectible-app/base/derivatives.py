@@ -0,0 +1,174 @@
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from PIL import Image, ImageOps
+from base.models import Collection, ListVersion, StoredImage
+from base.similarity import hash_file, to_signed
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'WORKERS': 2,
+    'SIZES': {'thumb': 128, 'small': 320, 'medium': 800},
+    'FORMATS': {'webp': 'WEBP', 'jpg': 'JPEG'},
+    'QUALITY': 80,
+}
+
+
+# Returns the IMAGE_DERIVATIVES setting merged over the defaults
+def get_options():
+    return {**DEFAULTS, **getattr(settings, 'IMAGE_DERIVATIVES', {})}
+
+
+# Returns the storage path of one derivative of an image, next to it
+def derivative_path(image_name, size, extension):
+    stem = os.path.splitext(image_name)[0]
+    return f'{stem}_{size}.{extension}'
+
+
+# Decodes an image once and writes every size in every format to storage,
+# returning {size: {extension: path}}. The orientation from EXIF is applied
+# to the pixels and the metadata itself is never copied over, so nothing
+# from the camera ends up in what is served. Each size is scaled down from
+# the next larger one rather than from the original. Images are stored by
+# content, so a derivative that already exists is kept as it is.
+def render_derivatives(image_name, storage=default_storage, options=None):
+    options = options or get_options()
+    sizes = sorted(options['SIZES'].items(), key=lambda size: -size[1])
+    derivatives = {}
+    with storage.open(image_name, 'rb') as f, Image.open(f) as original:
+        # Lets JPEG decode straight to a reduced scale close to the largest
+        # size instead of decoding every pixel of the original
+        largest = sizes[0][1]
+        original.draft('RGB', (largest, largest))
+        image = ImageOps.exif_transpose(original)
+        image = image.convert(
+            'RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB'
+        )
+        for size, edge in sizes:
+            image.thumbnail((edge, edge), Image.Resampling.LANCZOS)
+            derivatives[size] = {}
+            for extension, image_format in options['FORMATS'].items():
+                path = derivative_path(image_name, size, extension)
+                derivatives[size][extension] = path
+                if storage.exists(path):
+                    continue
+                encoded = image
+                if image_format == 'JPEG' and image.mode != 'RGB':
+                    encoded = image.convert('RGB')
+                buffer = io.BytesIO()
+                encoded.save(buffer, image_format,
+                             quality=options['QUALITY'], optimize=True)
+                storage.save(path, ContentFile(buffer.getvalue()))
+    return derivatives
+
+
+# Generates the derivatives of a stored image, and its perceptual hash from
+# the smallest of them, and records them on it and on every Collection
+# holding it, as long as any Collection still does by the time they are done
+def generate_derivatives(image_name):
+    try:
+        derivatives = render_derivatives(image_name)
+        smallest = min(get_options()['SIZES'].items(), key=lambda s: s[1])
+        image_hash = to_signed(hash_file(
+            default_storage,
+            next(iter(derivatives[smallest[0]].values())),
+        ))
+    except (OSError, ValueError, Image.DecompressionBombError):
+        logger.exception('Cannot generate derivatives of %s', image_name)
+        return None
+    with transaction.atomic():
+        StoredImage.objects.filter(name=image_name).update(
+            derivatives=derivatives,
+            image_hash=image_hash,
+        )
+        holders = Collection.objects.filter(image=image_name)
+        user_ids = set(holders.values_list('user_id', flat=True))
+        holders.update(
+            image_derivatives=derivatives,
+            image_hash=image_hash,
+            version=F('version') + 1,
+            modified=timezone.now(),
+        )
+        for user_id in user_ids:
+            ListVersion.objects.bump(user_id, ListVersion.COLLECTIONS)
+    if not user_ids:
+        # Replaced or deleted while the derivatives were being generated
+        for paths in derivatives.values():
+            for path in paths.values():
+                default_storage.delete(path)
+        return None
+    return derivatives
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+# Returns the process-wide worker pool, creating it on first use. Threads
+# are enough here as Pillow releases the GIL while decoding, resizing and
+# encoding.
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=get_options()['WORKERS'],
+                thread_name_prefix='image-derivatives',
+            )
+    return _executor
+
+
+# Waits for queued work and drops the worker pool, so the next use builds
+# it again from the settings
+def reset_executor(wait=True):
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait)
+
+
+# Runs generate_derivatives on a worker thread, closing the thread's own
+# database connections when it is done
+def _work(image_name):
+    try:
+        generate_derivatives(image_name)
+    except Exception:
+        logger.exception('Cannot record derivatives of %s', image_name)
+    finally:
+        connections.close_all()
+
+
+# Gives a Collection the derivatives and perceptual hash of its current
+# image. Ones generated for an earlier upload of the same content are
+# reused straight away, otherwise generation is queued for once the
+# transaction that saved the image commits.
+def queue_derivatives(collection):
+    image_name = collection.image.name
+    stored = StoredImage.objects.filter(name=image_name).values_list(
+        'derivatives', 'image_hash',
+    ).first()
+    if stored and stored[0]:
+        Collection.objects.filter(pk=collection.pk).update(
+            image_derivatives=stored[0],
+            image_hash=stored[1],
+        )
+        collection.image_derivatives, collection.image_hash = stored
+        return
+
+    def submit():
+        if get_options()['WORKERS'] <= 0:
+            generate_derivatives(image_name)
+        else:
+            get_executor().submit(_work, image_name)
+
+    transaction.on_commit(submit)
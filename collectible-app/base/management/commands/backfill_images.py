@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from base.derivatives import generate_derivatives
+from base.models import StoredImage
+
+
+# Django command that generates the derivatives and perceptual hash of
+# every image in use that does not have them yet, such as those uploaded
+# before either existed
+class Command(BaseCommand):
+    help = 'Generates missing image derivatives and perceptual hashes.'
+
+    def handle(self, *args, **options):
+        names = StoredImage.objects.filter(
+            references__gt=0, image_hash__isnull=True,
+        ).values_list('name', flat=True).order_by('id')
+        done = failed = 0
+        for name in names.iterator(chunk_size=1000):
+            if generate_derivatives(name) is None:
+                failed += 1
+            else:
+                done += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed {done} images, {failed} skipped.'
+        ))
@@ -0,0 +1,56 @@
+import time
+from django.core.management.base import BaseCommand
+from base.media_gc import collect
+
+
+# Django command that deletes Collection images no Collection references
+# any more, with their derivatives, once they have been unused for the
+# grace period. Run once it makes a single pass; with --every it keeps
+# running in the background, making a pass every so many seconds. Only one
+# instance should run against a media volume at a time.
+class Command(BaseCommand):
+    help = 'Deletes unreferenced Collection images from MEDIA_ROOT.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace', type=int,
+                            help='Seconds a file must be unused before it '
+                                 'is deleted, defaults to MEDIA_GC.')
+        parser.add_argument('--batch-size', type=int,
+                            help='Files checked per reference query.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report what would be deleted.')
+        parser.add_argument('--every', type=int, default=0,
+                            help='Keep running, a pass every N seconds.')
+        parser.add_argument('--pause', type=float, default=0,
+                            help='Seconds to sleep after every batch.')
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        while True:
+            report = collect(
+                grace=options['grace'],
+                batch_size=options['batch_size'],
+                dry_run=options['dry_run'],
+                pause=options['pause'],
+                on_batch=self._progress,
+            )
+            self._report(report, options['dry_run'])
+            if not options['every']:
+                break
+            time.sleep(options['every'])
+
+    def _progress(self, report):
+        if self.verbosity > 1:
+            self.stdout.write(
+                f'{report.files} files looked at, '
+                f'{report.deleted} deleted'
+            )
+
+    def _report(self, report, dry_run):
+        verb = 'Would reclaim' if dry_run else 'Reclaimed'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {report.reclaimed} bytes in {report.deleted} files. '
+            f'Looked at {report.files} files ({report.bytes} bytes) in '
+            f'{report.directories} directories in {report.seconds:.1f}s, '
+            f'{report.throughput:.0f} files/s.'
+        ))
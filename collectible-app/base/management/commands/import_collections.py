@@ -0,0 +1,332 @@
+import csv
+import io
+import json
+import os
+import time
+from collections import Counter
+from django.contrib.auth import get_user_model as gum
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+from base.models import (Collection, ImportCheckpoint, Item, ListVersion,
+                         Portfolio, Tag, TagPortfolio, portfolio_delta)
+
+
+# Reads a file in binary one line at a time while counting the bytes read,
+# so the offset after every parsed record can be saved and resumed from
+class _OffsetLines:
+    def __init__(self, stream, offset):
+        self.stream = stream
+        self.offset = offset
+
+    def __iter__(self):
+        for line in self.stream:
+            self.offset += len(line)
+            yield line.decode('utf-8')
+
+
+# Django command that streams Collections, with the names of their Items and
+# Tags, from a CSV or NDJSON file into the database for one User. Rows are
+# loaded in batches, with PostgreSQL COPY where available, and the byte
+# offset reached is checkpointed in the transaction of every batch so a
+# crashed import can be resumed with --resume, loading each row once.
+#
+# CSV files need a header row with title, items_in_collection, floor_price
+# and optionally link, items and tags, where items and tags hold names
+# separated by "|". NDJSON lines hold the same keys with items and tags as
+# lists of names.
+class Command(BaseCommand):
+    help = 'Imports Collections for a User from a CSV or NDJSON file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--user', required=True,
+                            help='E-mail of the User who owns the rows.')
+        parser.add_argument('--format', choices=('csv', 'ndjson'),
+                            help='Defaults to the file extension.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--offset', type=int, default=0,
+                            help='Byte offset to start reading from.')
+        parser.add_argument('--resume', action='store_true',
+                            help='Start from the saved checkpoint offset.')
+        parser.add_argument('--checkpoint',
+                            help='Checkpoint name, defaults to the absolute '
+                                 'PATH.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        try:
+            user = gum().objects.get(email=options['user'])
+        except gum().DoesNotExist:
+            raise CommandError(f'No User with e-mail {options["user"]}')
+        file_format = options['format'] or self._guess_format(path)
+        checkpoint = options['checkpoint'] or os.path.abspath(path)
+        offset = options['offset']
+        if options['resume']:
+            offset = ImportCheckpoint.objects.filter(
+                user=user, name=checkpoint,
+            ).values_list('offset', flat=True).first() or 0
+
+        self.use_copy = self._can_copy()
+        loaded = 0
+        started = time.monotonic()
+        with open(path, 'rb') as stream:
+            records = self._records(stream, file_format, offset)
+            batch = []
+            for record, end in records:
+                batch.append(record)
+                if len(batch) >= options['batch_size']:
+                    loaded += self._flush(user, batch, loaded, end,
+                                          checkpoint)
+                    self._report(loaded, end, started)
+                    batch = []
+            if batch:
+                loaded += self._flush(user, batch, loaded, end, checkpoint)
+                self._report(loaded, end, started)
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {loaded} Collections.'
+        ))
+
+    # Picks the file format from the extension
+    def _guess_format(self, path):
+        if path.endswith(('.ndjson', '.jsonl')):
+            return 'ndjson'
+        if path.endswith('.csv'):
+            return 'csv'
+        raise CommandError('Cannot tell the file format, pass --format.')
+
+    # Yields (record, byte offset after the record) from `offset` onwards,
+    # numbering the rows read in this run from 1
+    def _records(self, stream, file_format, offset):
+        number = 0
+        if file_format == 'ndjson':
+            stream.seek(offset)
+            lines = _OffsetLines(stream, offset)
+            for line in lines:
+                if not line.strip():
+                    continue
+                number += 1
+                try:
+                    row = json.loads(line)
+                except ValueError as exc:
+                    raise CommandError(
+                        f'Invalid JSON in row {number} before byte '
+                        f'{lines.offset}: {exc}'
+                    )
+                yield self._parse(row, number, lines.offset), lines.offset
+            return
+
+        header_lines = _OffsetLines(stream, 0)
+        header = next(csv.reader(header_lines))
+        stream.seek(max(offset, header_lines.offset))
+        lines = _OffsetLines(stream, max(offset, header_lines.offset))
+        for values in csv.reader(lines):
+            if not values:
+                continue
+            number += 1
+            row = dict(zip(header, values))
+            for name in ('items', 'tags'):
+                row[name] = [n for n in row.get(name, '').split('|') if n]
+            yield self._parse(row, number, lines.offset), lines.offset
+
+    # Validates a raw row with the checks of the model fields it is loaded
+    # into, so values the database would reject or cut short are reported
+    # with the row they came from, and returns the values to load
+    def _parse(self, row, number, offset):
+        if not isinstance(row, dict):
+            raise CommandError(
+                f'Row {number} before byte {offset} is not an object.'
+            )
+        record, errors = {}, {}
+        for name in ('title', 'items_in_collection', 'floor_price', 'link'):
+            field = Collection._meta.get_field(name)
+            value = row.get(name)
+            if value is None and field.blank:
+                value = ''
+            elif isinstance(value, float):
+                # Read floats as written rather than as their binary value
+                value = repr(value)
+            try:
+                record[name] = field.clean(value, None)
+            except ValidationError as exc:
+                errors[name] = exc.messages
+        for name, model in (('items', Item), ('tags', Tag)):
+            names = row.get(name) or []
+            if not isinstance(names, list):
+                errors[name] = ['Expected a list of names.']
+                continue
+            field = model._meta.get_field('name')
+            try:
+                record[name] = [field.clean(str(n), None) for n in names]
+            except ValidationError as exc:
+                errors[name] = exc.messages
+        if errors:
+            details = '; '.join(
+                f'{name}: {" ".join(messages)}'
+                for name, messages in errors.items()
+            )
+            raise CommandError(
+                f'Invalid row {number} before byte {offset}: {details} Fix '
+                f'it and resume with --offset or --resume.'
+            )
+        return record
+
+    # Loads a batch and saves the offset reached in one transaction, with
+    # the rows read before it numbered from `loaded`
+    def _flush(self, user, batch, loaded, offset, checkpoint):
+        try:
+            with transaction.atomic():
+                self._load(user, batch)
+                ImportCheckpoint.objects.update_or_create(
+                    user=user, name=checkpoint, defaults={'offset': offset},
+                )
+        except DatabaseError as exc:
+            raise CommandError(
+                f'Could not load rows {loaded + 1} to {loaded + len(batch)} '
+                f'before byte {offset}: {exc} Fix them and resume with '
+                f'--offset or --resume.'
+            )
+        return len(batch)
+
+    # Loads the Collections of a batch with their links, usage counts,
+    # portfolios and search vectors
+    def _load(self, user, batch):
+        tag_ids = Tag.objects.upsert_names(
+            user, [name for record in batch for name in record['tags']],
+        )
+        item_ids = Item.objects.upsert_names(
+            user, [name for record in batch for name in record['items']],
+        )
+        if self.use_copy:
+            collection_ids = self._copy_collections(user, batch)
+        else:
+            collection_ids = self._create_collections(user, batch)
+        links = {}
+        for model, field, ids in ((Tag, 'tags', tag_ids),
+                                  (Item, 'items', item_ids)):
+            links[field] = {
+                (collection_id, ids[name])
+                for collection_id, record in zip(collection_ids, batch)
+                for name in record[field]
+            }
+            self._load_links(field, links[field])
+            model.objects.count_usage(
+                Counter(target_id for _, target_id in links[field]),
+            )
+        self._count_portfolios(user, collection_ids, batch,
+                               links['tags'])
+        # Neither COPY nor bulk_create sends signals, so the usage counts
+        # and portfolios are added above, and the search vectors built
+        # and the lists moved on to a new version here
+        Collection.objects.reindex_search(collection_ids)
+        ListVersion.objects.bump(
+            user.pk,
+            ListVersion.COLLECTIONS,
+            ListVersion.TAGS,
+            ListVersion.ITEMS,
+        )
+
+    # Adds the loaded Collections to the portfolio of the User and to those
+    # of their Tags, given as (Collection id, Tag id) links
+    def _count_portfolios(self, user, collection_ids, batch, tag_links):
+        deltas = {
+            collection_id: portfolio_delta(record['items_in_collection'],
+                                           record['floor_price'])
+            for collection_id, record in zip(collection_ids, batch)
+        }
+        Portfolio.objects.add({
+            user.pk: tuple(map(sum, zip(*deltas.values()))),
+        })
+        tags = {}
+        for collection_id, tag_id in tag_links:
+            tags[tag_id] = tuple(map(
+                sum, zip(tags.get(tag_id, (0, 0, 0)), deltas[collection_id]),
+            ))
+        TagPortfolio.objects.add(tags, user_id=user.pk)
+
+    # Tells whether the connection supports COPY FROM STDIN
+    def _can_copy(self):
+        if connection.vendor != 'postgresql':
+            return False
+        with connection.cursor() as cursor:
+            return hasattr(cursor.cursor, 'copy_expert')
+
+    # Writes rows to a table with COPY, as CSV held in memory per batch.
+    # Strings are always quoted so that empty ones are not read as NULL.
+    def _copy(self, table, columns, rows):
+        buffer = io.StringIO()
+        csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC).writerows(rows)
+        buffer.seek(0)
+        quote = connection.ops.quote_name
+        # The raw cursor raises the driver's errors, which are turned into
+        # Django's DatabaseError like those of any other query
+        with connection.cursor() as cursor, connection.wrap_database_errors:
+            cursor.cursor.copy_expert(
+                f'COPY {quote(table)} ({", ".join(map(quote, columns))}) '
+                f'FROM STDIN WITH (FORMAT csv)',
+                buffer,
+            )
+
+    # Reserves ids from the Collection sequence and COPYs the rows in
+    def _copy_collections(self, user, batch):
+        table = Collection._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT nextval(pg_get_serial_sequence(%s, %s)) '
+                'FROM generate_series(1, %s)',
+                [table, 'id', len(batch)],
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+        modified = timezone.now().isoformat()
+        self._copy(
+            table,
+            ('id', 'user_id', 'title', 'items_in_collection',
+             'floor_price', 'link', 'version', 'modified',
+             'image_derivatives'),
+            (
+                (pk, user.pk, record['title'],
+                 record['items_in_collection'], record['floor_price'],
+                 record['link'], 1, modified, '{}')
+                for pk, record in zip(ids, batch)
+            ),
+        )
+        return ids
+
+    # Inserts the rows with bulk_create where COPY is not available
+    def _create_collections(self, user, batch):
+        collections = Collection.objects.bulk_create(
+            Collection(
+                user=user,
+                title=record['title'],
+                items_in_collection=record['items_in_collection'],
+                floor_price=record['floor_price'],
+                link=record['link'],
+            )
+            for record in batch
+        )
+        return [collection.pk for collection in collections]
+
+    # Inserts (collection id, target id) pairs into a through table
+    def _load_links(self, field, links):
+        if not links:
+            return
+        through = getattr(Collection, field).through
+        target = through._meta.get_field(field[:-1]).column
+        if self.use_copy:
+            self._copy(through._meta.db_table, ('collection_id', target),
+                       sorted(links))
+            return
+        through.objects.bulk_create(
+            (through(**{'collection_id': pk, target: target_id})
+             for pk, target_id in sorted(links)),
+            batch_size=1000,
+        )
+
+    # Writes how far the import got and how fast it is going
+    def _report(self, loaded, offset, started):
+        elapsed = max(time.monotonic() - started, 1e-9)
+        self.stdout.write(
+            f'{loaded} Collections loaded, at byte {offset}, '
+            f'{loaded / elapsed:.0f} rows/s'
+        )
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from base.models import Portfolio, TagPortfolio
+
+
+# Django command that recomputes the portfolio of every User and Tag from
+# the Collections and their links, fixing those that drifted, such as those
+# written by concurrent changes to the same Collection or by raw SQL
+class Command(BaseCommand):
+    help = 'Recomputes the portfolio statistics of Users and Tags.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000,
+                            help='Users or Tags rebuilt per transaction.')
+
+    def handle(self, *args, **options):
+        users = Portfolio.objects.rebuild(options['batch_size'])
+        tags = TagPortfolio.objects.rebuild(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt the portfolios of {users} Users and {tags} Tags.'
+        ))
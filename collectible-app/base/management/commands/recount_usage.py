@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from base.models import Item, ListVersion, Tag
+
+
+# Django command that recounts the Collections linked to every Tag and
+# Item from the link tables, fixing the collection_count of the rows that
+# drifted, such as those written by concurrent removals of the same link or
+# by raw SQL, and moving the lists of their Users on to a new version
+class Command(BaseCommand):
+    help = 'Recomputes the usage counts of Tags and Items.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000,
+                            help='Ids recounted per UPDATE.')
+
+    def handle(self, *args, **options):
+        for model in (Tag, Item):
+            # Each range commits on its own, so rows are locked briefly
+            fixed, user_ids = model.objects.recount_usage(
+                options['batch_size'],
+            )
+            for user_id in user_ids:
+                ListVersion.objects.bump(user_id, model.list_kind)
+            self.stdout.write(self.style.SUCCESS(
+                f'Fixed {fixed} {model._meta.verbose_name_plural}.'
+            ))
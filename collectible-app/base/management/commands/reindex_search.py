@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from base.models import Collection
+
+
+# Django command that rebuilds the search vector of every Collection from
+# its title, link and linked names, such as after rows were written by raw
+# SQL or the text search configuration changed. Collections keep their
+# version, as their representation does not change.
+class Command(BaseCommand):
+    help = 'Rebuilds the search vectors of Collections.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000,
+                            help='Ids rebuilt per UPDATE.')
+
+    def handle(self, *args, **options):
+        rebuilt = Collection.objects.reindex_search(
+            batch_size=options['batch_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {rebuilt} search vectors.'
+        ))
@@ -0,0 +1,213 @@
+import os
+import re
+import time
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from base.derivatives import get_options as get_derivative_options
+from base.models import Collection, StoredImage
+from base.storage import image_storage
+
+DEFAULTS = {
+    'DIRECTORY': 'uploads/collection',
+    # Seconds a file must have gone unused, and an image unreferenced,
+    # before it is deleted
+    'GRACE': 24 * 60 * 60,
+    'BATCH_SIZE': 500,
+}
+
+
+# Returns the MEDIA_GC setting merged over the defaults
+def get_options():
+    return {**DEFAULTS, **getattr(settings, 'MEDIA_GC', {})}
+
+
+# Counts what a collection pass looked at and what it removed
+class Report:
+    def __init__(self):
+        self.directories = 0
+        self.files = 0
+        self.bytes = 0
+        self.deleted = 0
+        self.reclaimed = 0
+        self.started = time.monotonic()
+        self.seconds = 0.0
+
+    def finish(self):
+        self.seconds = time.monotonic() - self.started
+        return self
+
+    # Files looked at per second
+    @property
+    def throughput(self):
+        return self.files / self.seconds if self.seconds else 0.0
+
+
+# Walks a directory tree one directory at a time with os.scandir, yielding
+# (relative directory, [DirEntry of its files]). Only the files of the
+# directory being looked at are held in memory.
+def walk(root, directory):
+    pending = [directory]
+    while pending:
+        relative = pending.pop()
+        try:
+            with os.scandir(os.path.join(root, relative)) as entries:
+                files = []
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(f'{relative}/{entry.name}')
+                    elif entry.is_file(follow_symlinks=False):
+                        files.append(entry)
+        except FileNotFoundError:
+            continue
+        yield relative, files
+
+
+# Splits the files of one directory into originals, {stem: [entries]} of
+# the derivatives written next to them, and partial or abandoned files
+# whose names start with a dot
+def classify(files, sizes):
+    derivative = re.compile(
+        rf'^(.+)_(?:{"|".join(map(re.escape, sizes))})\.\w+$'
+    )
+    originals, derivatives, partials = [], {}, []
+    for entry in files:
+        if entry.name.startswith('.'):
+            partials.append(entry)
+            continue
+        match = derivative.match(entry.name)
+        if match:
+            derivatives.setdefault(match.group(1), []).append(entry)
+        else:
+            originals.append(entry)
+    return originals, derivatives, partials
+
+
+# Returns when a file was last written, or marked as used by a save of the
+# same content through ContentAddressedStorage
+def last_used(stat):
+    return max(stat.st_mtime, stat.st_atime)
+
+
+# Returns which of the given image names are still in use, as held by a
+# Collection or counted by a StoredImage, or released too recently, in two
+# queries for the whole batch
+def in_use(names, cutoff):
+    used = set(
+        Collection.objects.filter(image__in=names)
+        .values_list('image', flat=True)
+    )
+    used.update(
+        StoredImage.objects.filter(name__in=names)
+        .filter(Q(references__gt=0) | Q(released__gt=cutoff))
+        .values_list('name', flat=True)
+    )
+    return used
+
+
+# Deletes a file unless it was used after `cutoff`. The file is first
+# renamed aside, so a concurrent ContentAddressedStorage.save either marks
+# it as used before that, and it is put back, or finds it gone and writes
+# it again. Returns the bytes reclaimed.
+def remove(path, cutoff):
+    directory, filename = os.path.split(path)
+    aside = os.path.join(directory, f'.gc-{uuid.uuid4().hex}.{filename}')
+    try:
+        os.rename(path, aside)
+    except FileNotFoundError:
+        return 0
+    stat = os.stat(aside)
+    if last_used(stat) > cutoff.timestamp():
+        # Same name, same content, so whichever copy ends up there is right
+        os.replace(aside, path)
+        return 0
+    os.unlink(aside)
+    return stat.st_size
+
+
+# Finds the files under the Collection image directory that no Collection
+# references any more, along with their derivatives and partial writes
+# left behind, and deletes them once they are older than the grace period.
+# Directories are read one at a time and their originals checked in
+# batches across directories, one pair of queries per `batch_size`, so
+# neither memory nor queries grow with the files in the tree. With
+# `dry_run` nothing is deleted and the report counts what would have been.
+# `on_batch` is called with the report after every batch, and `pause`
+# seconds are slept after it to keep the pass from competing with requests
+# for disk and database.
+def collect(grace=None, batch_size=None, dry_run=False, now=None,
+            pause=0, on_batch=None):
+    options = get_options()
+    grace = options['GRACE'] if grace is None else grace
+    batch_size = batch_size or options['BATCH_SIZE']
+    cutoff = (now or timezone.now()) - timedelta(seconds=grace)
+    sizes = get_derivative_options()['SIZES']
+    root = image_storage().location
+    report = Report()
+
+    def old(entry):
+        return last_used(entry.stat(follow_symlinks=False)) <= \
+            cutoff.timestamp()
+
+    def delete(entry):
+        if dry_run:
+            reclaimed = entry.stat(follow_symlinks=False).st_size
+        else:
+            reclaimed = remove(entry.path, cutoff)
+        if reclaimed:
+            report.deleted += 1
+            report.reclaimed += reclaimed
+
+    def flush(groups):
+        names = {
+            f'{directory}/{entry.name}': entry
+            for directory, originals, _, _ in groups
+            for entry in originals
+        }
+        # A single directory can hold more than a batch
+        listed, used = list(names), set()
+        for start in range(0, len(listed), batch_size):
+            used |= in_use(listed[start:start + batch_size], cutoff)
+        orphans = []
+        for directory, originals, derivatives, partials in groups:
+            kept = set()
+            for entry in originals:
+                name = f'{directory}/{entry.name}'
+                if name in used or not old(entry):
+                    kept.add(os.path.splitext(entry.name)[0])
+                else:
+                    orphans.append(name)
+                    delete(entry)
+            for stem, entries in derivatives.items():
+                if stem not in kept:
+                    for entry in filter(old, entries):
+                        delete(entry)
+            for entry in filter(old, partials):
+                delete(entry)
+        if orphans and not dry_run:
+            StoredImage.objects.filter(
+                name__in=orphans, references=0,
+            ).delete()
+        if on_batch is not None:
+            on_batch(report)
+        if pause:
+            time.sleep(pause)
+
+    groups, pending = [], 0
+    for directory, files in walk(root, options['DIRECTORY'].strip('/')):
+        report.directories += 1
+        report.files += len(files)
+        report.bytes += sum(
+            entry.stat(follow_symlinks=False).st_size for entry in files
+        )
+        originals, derivatives, partials = classify(files, sizes)
+        if groups and pending + len(originals) > batch_size:
+            flush(groups)
+            groups, pending = [], 0
+        groups.append((directory, originals, derivatives, partials))
+        pending += len(originals)
+    if groups:
+        flush(groups)
+    return report.finish()
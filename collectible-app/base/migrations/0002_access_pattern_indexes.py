@@ -0,0 +1,39 @@
+from django.db import migrations, models
+import base.operations
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('base', '0001_initial'),
+    ]
+
+    operations = [
+        base.operations.AddIndexConcurrentlyIfSupported(
+            model_name='tag',
+            index=models.Index(fields=['user', 'name', 'id'], name='base_tag_user_name_idx'),
+        ),
+        base.operations.AddIndexConcurrentlyIfSupported(
+            model_name='item',
+            index=models.Index(fields=['user', 'name', 'id'], name='base_item_user_name_idx'),
+        ),
+        base.operations.AddIndexConcurrentlyIfSupported(
+            model_name='collection',
+            index=models.Index(fields=['user', 'id'], name='base_collection_user_id_idx'),
+        ),
+        base.operations.AddThroughIndex(
+            model_name='collection',
+            field_name='tags',
+            fields=['tag', 'collection'],
+            name='base_collection_tags_tag_idx',
+        ),
+        base.operations.AddThroughIndex(
+            model_name='collection',
+            field_name='items',
+            fields=['item', 'collection'],
+            name='base_collection_items_item_idx',
+        ),
+    ]
@@ -0,0 +1,46 @@
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+# Folds duplicate Tag and Item names of each User into the oldest row,
+# moving their Collection links across, so the unique constraint can apply
+def merge_duplicate_names(apps, schema_editor):
+    Collection = apps.get_model('base', 'Collection')
+    for model_name, field_name in (('Tag', 'tags'), ('Item', 'items')):
+        model = apps.get_model('base', model_name)
+        through = getattr(Collection, field_name).through
+        target = f'{model_name.lower()}_id'
+        duplicates = (
+            model.objects.values('user_id', 'name')
+            .annotate(keep=Min('id'), rows=Count('id'))
+            .filter(rows__gt=1)
+        )
+        for duplicate in duplicates:
+            extra = model.objects.filter(
+                user_id=duplicate['user_id'],
+                name=duplicate['name'],
+            ).exclude(id=duplicate['keep'])
+            linked = through.objects.filter(**{f'{target}__in': extra})
+            kept = set(through.objects.filter(
+                **{target: duplicate['keep']}
+            ).values_list('collection_id', flat=True))
+            through.objects.bulk_create(
+                [
+                    through(collection_id=pk, **{target: duplicate['keep']})
+                    for pk in set(linked.values_list(
+                        'collection_id', flat=True,
+                    )) - kept
+                ],
+            )
+            extra.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0002_access_pattern_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_names, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:11
+
+from django.db import migrations, models
+import base.operations
+
+
+class Migration(migrations.Migration):
+
+    # CREATE and DROP INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('base', '0003_merge_duplicate_names'),
+    ]
+
+    operations = [
+        base.operations.AddUniqueConstraintConcurrentlyIfSupported(
+            model_name='item',
+            constraint=models.UniqueConstraint(fields=('user', 'name'), name='base_item_unique_user_name'),
+        ),
+        base.operations.AddUniqueConstraintConcurrentlyIfSupported(
+            model_name='tag',
+            constraint=models.UniqueConstraint(fields=('user', 'name'), name='base_tag_unique_user_name'),
+        ),
+        base.operations.RemoveIndexConcurrentlyIfSupported(
+            model_name='item',
+            name='base_item_user_name_idx',
+        ),
+        base.operations.RemoveIndexConcurrentlyIfSupported(
+            model_name='tag',
+            name='base_tag_user_name_idx',
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:58
+
+import base.models
+import base.storage
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Count
+
+
+# Counts the references to the images uploaded before they were stored by
+# content, so the garbage collector knows they are still in use
+def count_existing_images(apps, schema_editor):
+    Collection = apps.get_model('base', 'Collection')
+    StoredImage = apps.get_model('base', 'StoredImage')
+    counts = (
+        Collection.objects.exclude(image__isnull=True).exclude(image='')
+        .values('image').annotate(references=Count('id'))
+    )
+    StoredImage.objects.bulk_create(
+        (StoredImage(name=row['image'], references=row['references'])
+         for row in counts.iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0006_collection_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredImage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('sha256', models.CharField(blank=True, db_index=True, max_length=64)),
+                ('size', models.PositiveBigIntegerField(default=0)),
+                ('references', models.PositiveIntegerField(default=0)),
+                ('derivatives', models.JSONField(blank=True, default=dict)),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('released', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='collection',
+            name='image',
+            field=models.ImageField(null=True, storage=base.storage.image_storage, upload_to=base.models.collection_image_file_path),
+        ),
+        migrations.RunPython(
+            count_existing_images,
+            migrations.RunPython.noop,
+        ),
+    ]
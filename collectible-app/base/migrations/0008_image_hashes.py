@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:11
+
+from django.db import migrations, models
+import base.operations
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('base', '0007_stored_images'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='collection',
+            name='image_hash',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='storedimage',
+            name='image_hash',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        base.operations.AddIndexConcurrentlyIfSupported(
+            model_name='collection',
+            index=models.Index(condition=models.Q(('image_hash__isnull', False)), fields=['modified'], name='base_collection_hashed_idx'),
+        ),
+    ]
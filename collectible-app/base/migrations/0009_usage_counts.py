@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:45
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+import base.operations
+
+
+# Counts the Collections already linked to every Tag and Item
+def count_usage(apps, schema_editor):
+    Collection = apps.get_model('base', 'Collection')
+    for model_name, field_name in (('Tag', 'tags'), ('Item', 'items')):
+        model = apps.get_model('base', model_name)
+        through = getattr(Collection, field_name).through
+        target = model_name.lower()
+        model.objects.update(collection_count=Coalesce(Subquery(
+            through.objects.filter(**{target: OuterRef('pk')}).order_by()
+            .values(target).annotate(count=Count('*')).values('count')
+        ), 0))
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('base', '0008_image_hashes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='collection_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='collection_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_usage, migrations.RunPython.noop),
+        base.operations.AddIndexConcurrentlyIfSupported(
+            model_name='item',
+            index=models.Index(condition=models.Q(('collection_count__gt', 0)), fields=['user', 'name', 'id'], name='base_item_assigned_idx'),
+        ),
+        base.operations.AddIndexConcurrentlyIfSupported(
+            model_name='item',
+            index=models.Index(fields=['user', 'collection_count', 'id'], name='base_item_usage_idx'),
+        ),
+        base.operations.AddIndexConcurrentlyIfSupported(
+            model_name='tag',
+            index=models.Index(condition=models.Q(('collection_count__gt', 0)), fields=['user', 'name', 'id'], name='base_tag_assigned_idx'),
+        ),
+        base.operations.AddIndexConcurrentlyIfSupported(
+            model_name='tag',
+            index=models.Index(fields=['user', 'collection_count', 'id'], name='base_tag_usage_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations, models
+import base.operations
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('base', '0009_usage_counts'),
+    ]
+
+    operations = [
+        base.operations.AddIndexConcurrentlyIfSupported(
+            model_name='collection',
+            index=models.Index(fields=['user', 'floor_price', 'id'], name='base_collection_price_idx'),
+        ),
+        base.operations.AddIndexConcurrentlyIfSupported(
+            model_name='collection',
+            index=models.Index(fields=['user', 'items_in_collection', 'id'], name='base_collection_size_idx'),
+        ),
+        base.operations.AddIndexConcurrentlyIfSupported(
+            model_name='collection',
+            index=models.Index(fields=['user', 'title', 'id'], name='base_collection_title_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+import base.operations
+from base import search
+
+
+# Builds the search vectors of the existing Collections, one range of ids
+# at a time
+def reindex_search(apps, schema_editor):
+    if not search.has_vectors(schema_editor.connection.alias):
+        return
+    Collection = apps.get_model('base', 'Collection')
+    last = Collection.objects.order_by('-pk').values_list('pk', flat=True) \
+        .first()
+    for start in range(0, (last or 0) + 1, 10000):
+        Collection.objects.filter(
+            pk__gte=start, pk__lt=start + 10000,
+        ).update(search_vector=search.document())
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('base', '0010_collection_ordering_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='collection',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(reindex_search, migrations.RunPython.noop),
+        base.operations.AddPostgresIndexConcurrently(
+            model_name='collection',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='base_collection_search_idx'),
+        ),
+    ]
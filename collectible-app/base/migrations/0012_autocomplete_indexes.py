@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:49
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.comparison
+import django.db.models.functions.text
+from django.db import migrations, models
+import base.operations
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('base', '0011_collection_search'),
+    ]
+
+    operations = [
+        base.operations.CreateExtensionIfAvailable('pg_trgm'),
+        base.operations.AddTrigramIndexConcurrently(
+            model_name='item',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper(django.db.models.functions.comparison.Cast('name', models.TextField())), name='gin_trgm_ops'), name='base_item_name_trgm_idx'),
+        ),
+        base.operations.AddTrigramIndexConcurrently(
+            model_name='tag',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper(django.db.models.functions.comparison.Cast('name', models.TextField())), name='gin_trgm_ops'), name='base_tag_name_trgm_idx'),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+
+
+# Sums the existing Collections into the portfolios of their Users and
+# Tags, writing the rows in batches
+def build_portfolios(apps, schema_editor):
+    Collection = apps.get_model('base', 'Collection')
+    Portfolio = apps.get_model('base', 'Portfolio')
+    TagPortfolio = apps.get_model('base', 'TagPortfolio')
+    through = Collection.tags.through
+
+    def worth(prefix=''):
+        return Sum(ExpressionWrapper(
+            F(f'{prefix}floor_price') * F(f'{prefix}items_in_collection'),
+            output_field=DecimalField(max_digits=24, decimal_places=2),
+        ))
+
+    for model, rows in (
+        (Portfolio, Collection.objects.order_by().values('user_id').annotate(
+            collection_count=Count('*'),
+            items_in_collections=Sum('items_in_collection'),
+            value=worth(),
+        )),
+        (TagPortfolio, through.objects.order_by().values(
+            'tag_id', user_id=F('tag__user_id'),
+        ).annotate(
+            collection_count=Count('*'),
+            items_in_collections=Sum('collection__items_in_collection'),
+            value=worth('collection__'),
+        )),
+    ):
+        model.objects.bulk_create(
+            (model(**row) for row in rows.iterator(chunk_size=10000)),
+            batch_size=10000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0012_autocomplete_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Portfolio',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('collection_count', models.PositiveIntegerField(default=0)),
+                ('items_in_collections', models.BigIntegerField(default=0)),
+                ('value', models.DecimalField(decimal_places=2, default=0, max_digits=24)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TagPortfolio',
+            fields=[
+                ('tag', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='base.tag')),
+                ('collection_count', models.PositiveIntegerField(default=0)),
+                ('items_in_collections', models.BigIntegerField(default=0)),
+                ('value', models.DecimalField(decimal_places=2, default=0, max_digits=24)),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'value', 'tag'], name='base_tagportfolio_value_idx')],
+            },
+        ),
+        migrations.RunPython(build_portfolios, migrations.RunPython.noop),
+    ]
@@ -1,9 +1,17 @@
 import uuid
 import os
-from django.db import models
+from decimal import Decimal
+from django.db import IntegrityError, connections, models, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Cast, Coalesce, Greatest, Upper
+from django.utils import timezone
 from django.contrib.auth.models import (AbstractBaseUser, BaseUserManager,
                                         PermissionsMixin)
 from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVectorField
+from base import search
+from base.storage import image_storage
 
 
 # Generates the file path for a new Collection image
@@ -42,32 +50,202 @@ class User(AbstractBaseUser, PermissionsMixin):
     USERNAME_FIELD = 'email'
 
 
+# Manages models that are unique by name for each User
+class UserNamedManager(models.Manager):
+    # Inserts the names a User does not have yet, in batches, and returns a
+    # {name: id} map for every name, whether it was created or already there
+    def upsert_names(self, user, names, batch_size=1000):
+        names = list(dict.fromkeys(names))
+        if not names:
+            return {}
+        # bulk_create sends no signals, so the list version is bumped here
+        ListVersion.objects.bump(user.pk, self.model.list_kind)
+        # Names the User already has are skipped rather than rewritten, and
+        # ignored rows get no id back, so every id is read by name after
+        self.bulk_create(
+            [self.model(user=user, name=name) for name in names],
+            batch_size=batch_size,
+            ignore_conflicts=True,
+        )
+        ids = {}
+        for start in range(0, len(names), batch_size):
+            ids.update(self.filter(
+                user=user,
+                name__in=names[start:start + batch_size],
+            ).values_list('name', 'id'))
+        return ids
+
+    # Adds {id: delta} to the collection_count of the given rows, with one
+    # UPDATE per distinct delta and batch
+    def count_usage(self, deltas, batch_size=1000):
+        by_delta = {}
+        for pk, delta in deltas.items():
+            if delta:
+                by_delta.setdefault(delta, []).append(pk)
+        for delta, pks in by_delta.items():
+            for start in range(0, len(pks), batch_size):
+                self.filter(pk__in=pks[start:start + batch_size]).update(
+                    collection_count=Greatest(
+                        F('collection_count') + delta, 0,
+                    ),
+                )
+
+    # Takes one off the collection_count of the rows linked to a
+    # Collection, or of those among `pks` that are, in one UPDATE
+    def uncount_links(self, collection_id, pks=None):
+        rows = self.filter(collection=collection_id)
+        if pks is not None:
+            rows = rows.filter(pk__in=pks)
+        rows.update(collection_count=Greatest(F('collection_count') - 1, 0))
+
+    # Sets collection_count from the links that exist, one range of ids
+    # at a time, and returns (rows that were off, ids of their Users)
+    def recount_usage(self, batch_size=10000):
+        through = self.model.collection_set.through
+        column = self.model._meta.model_name
+        actual = Coalesce(Subquery(
+            through.objects.filter(**{column: OuterRef('pk')}).order_by()
+            .values(column).annotate(count=Count('*')).values('count')
+        ), 0)
+        last = self.order_by('-pk').values_list('pk', flat=True).first()
+        fixed, user_ids = 0, set()
+        for start in range(0, (last or 0) + 1, batch_size):
+            off = self.filter(
+                pk__gte=start, pk__lt=start + batch_size,
+            ).alias(actual=actual).exclude(collection_count=F('actual'))
+            users = set(off.values_list('user_id', flat=True).distinct())
+            if users:
+                fixed += off.update(collection_count=actual)
+                user_ids |= users
+        return fixed, user_ids
+
+
+# Keeps collection_count, which the link signals in base.signals update in
+# the database, out of saves of an existing row, so a row loaded before
+# links changed cannot write back an older count
+class UsageCountedMixin:
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'collection_count'
+            ]
+        super().save(*args, **kwargs)
+
+
 # Creates a Tag to be used on a Collection
-class Tag(models.Model):
+class Tag(UsageCountedMixin, models.Model):
+    list_kind = 'tags'
     name = models.CharField(max_length=255)
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
     )
+    # Number of Collections linked to the Tag
+    collection_count = models.PositiveIntegerField(default=0)
+    objects = UserNamedManager()
+
+    class Meta:
+        constraints = [
+            # Also serves the per-User Tag list ordered by name
+            models.UniqueConstraint(
+                fields=['user', 'name'],
+                name='base_tag_unique_user_name',
+            ),
+        ]
+        indexes = [
+            # Serves the list of the Tags in use, ordered by name
+            models.Index(
+                fields=['user', 'name', 'id'],
+                condition=models.Q(collection_count__gt=0),
+                name='base_tag_assigned_idx',
+            ),
+            # Serves the list ordered by usage
+            models.Index(
+                fields=['user', 'collection_count', 'id'],
+                name='base_tag_usage_idx',
+            ),
+            # Serves autocompleting names by prefix and by similarity,
+            # case-insensitively, on PostgreSQL servers shipping pg_trgm
+            GinIndex(
+                OpClass(Upper(Cast('name', models.TextField())),
+                        name='gin_trgm_ops'),
+                name='base_tag_name_trgm_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
 
 # Creates an Item to be listed in a Collection
-class Item(models.Model):
+class Item(UsageCountedMixin, models.Model):
+    list_kind = 'items'
     name = models.CharField(max_length=255)
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE
     )
+    # Number of Collections linked to the Item
+    collection_count = models.PositiveIntegerField(default=0)
+    objects = UserNamedManager()
+
+    class Meta:
+        constraints = [
+            # Also serves the per-User Item list ordered by name
+            models.UniqueConstraint(
+                fields=['user', 'name'],
+                name='base_item_unique_user_name',
+            ),
+        ]
+        indexes = [
+            # Serves the list of the Items in use, ordered by name
+            models.Index(
+                fields=['user', 'name', 'id'],
+                condition=models.Q(collection_count__gt=0),
+                name='base_item_assigned_idx',
+            ),
+            # Serves the list ordered by usage
+            models.Index(
+                fields=['user', 'collection_count', 'id'],
+                name='base_item_usage_idx',
+            ),
+            # Serves autocompleting names by prefix and by similarity,
+            # case-insensitively, on PostgreSQL servers shipping pg_trgm
+            GinIndex(
+                OpClass(Upper(Cast('name', models.TextField())),
+                        name='gin_trgm_ops'),
+                name='base_item_name_trgm_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
 
+# Manages Collections
+class CollectionManager(models.Manager):
+    # Rebuilds the search vectors of the given Collections, or of all of
+    # them one range of ids at a time, and returns how many were rebuilt
+    def reindex_search(self, pks=None, batch_size=10000):
+        if not search.has_vectors(self.db):
+            return 0
+        if pks is not None:
+            return self.filter(pk__in=pks).update(
+                search_vector=search.document(),
+            )
+        last = self.order_by('-pk').values_list('pk', flat=True).first()
+        rebuilt = 0
+        for start in range(0, (last or 0) + 1, batch_size):
+            rebuilt += self.filter(
+                pk__gte=start, pk__lt=start + batch_size,
+            ).update(search_vector=search.document())
+        return rebuilt
+
+
 # Creates a Collection that is composed of Items with Tags.
 class Collection(models.Model):
+    list_kind = 'collections'
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
@@ -78,7 +256,450 @@ class Collection(models.Model):
     link = models.CharField(max_length=255, blank=True)
     items = models.ManyToManyField('Item')
     tags = models.ManyToManyField('Tag')
-    image = models.ImageField(null=True, upload_to=collection_image_file_path)
+    image = models.ImageField(
+        null=True,
+        upload_to=collection_image_file_path,
+        storage=image_storage,
+    )
+    # {size: {format: path}} of the resized copies of the image, filled in
+    # by base.derivatives once they have been generated
+    image_derivatives = models.JSONField(default=dict, blank=True)
+    # Perceptual hash of the image, filled in along with its derivatives
+    # and searched by base.similarity
+    image_hash = models.BigIntegerField(null=True, blank=True)
+    # Bumped on every change to the Collection or to what it renders, and
+    # used to answer conditional requests for its detail route
+    version = models.PositiveIntegerField(default=1)
+    modified = models.DateTimeField(default=timezone.now)
+    # Words of the title, link and linked names, kept by base.search on
+    # PostgreSQL wherever the version is bumped, and empty elsewhere
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = CollectionManager()
+
+    class Meta:
+        indexes = [
+            # Serves the per-User Collection list ordered by id
+            models.Index(
+                fields=['user', 'id'],
+                name='base_collection_user_id_idx',
+            ),
+            # Serve the per-User Collection list ordered, and filtered by
+            # range, on the fields clients sort by
+            models.Index(
+                fields=['user', 'floor_price', 'id'],
+                name='base_collection_price_idx',
+            ),
+            models.Index(
+                fields=['user', 'items_in_collection', 'id'],
+                name='base_collection_size_idx',
+            ),
+            models.Index(
+                fields=['user', 'title', 'id'],
+                name='base_collection_title_idx',
+            ),
+            # Serves the incremental refreshes of base.similarity
+            models.Index(
+                fields=['modified'],
+                condition=models.Q(image_hash__isnull=False),
+                name='base_collection_hashed_idx',
+            ),
+            # Serves ?search= of the Collection list, on PostgreSQL only
+            GinIndex(
+                fields=['search_vector'],
+                name='base_collection_search_idx',
+            ),
+        ]
+
+    # Remembers the image name, size and floor price loaded from the
+    # database, so a save can tell whether they changed without querying
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        loaded = instance.__dict__
+        if 'image' in loaded:
+            instance._loaded_image = loaded['image'] or ''
+        if 'items_in_collection' in loaded and 'floor_price' in loaded:
+            instance._loaded_worth = (loaded['items_in_collection'],
+                                      loaded['floor_price'])
+        return instance
+
+    # Bumps the version of a Collection that is being changed, and writes
+    # its search vector in the same statement
+    def save(self, *args, **kwargs):
+        using = kwargs.get('using') or self._state.db or 'default'
+        indexed = search.has_vectors(using)
+        if self._state.adding:
+            if indexed:
+                self.search_vector = search.new_document(self.title,
+                                                         self.link)
+        else:
+            self.version += 1
+            self.modified = timezone.now()
+            if indexed:
+                self.search_vector = search.document(
+                    models.Value(self.title), models.Value(self.link),
+                )
+        super().save(*args, **kwargs)
+        if indexed:
+            # Read back only if asked for
+            self.__dict__.pop('search_vector', None)
 
     def __str__(self):
         return self.title
+
+
+# Manages the reference counts of stored images
+class StoredImageManager(models.Manager):
+    # Counts one more reference to the image stored under `name`
+    def acquire(self, name, size=0):
+        if self.filter(name=name).update(references=F('references') + 1):
+            return
+        sha256 = os.path.splitext(os.path.basename(name))[0]
+        try:
+            with transaction.atomic(using=self.db):
+                self.create(
+                    name=name,
+                    sha256=sha256 if len(sha256) == 64 else '',
+                    size=size,
+                    references=1,
+                )
+        except IntegrityError:
+            self.filter(name=name).update(references=F('references') + 1)
+
+    # Counts one reference less to the image stored under `name`
+    def release(self, name):
+        self.filter(name=name, references__gt=0).update(
+            references=F('references') - 1,
+            released=timezone.now(),
+        )
+
+
+# A file in image storage, shared by every Collection whose image has the
+# same content. `references` counts those Collections, and the derivatives
+# generated for the file and its perceptual hash are kept here so later
+# uploads can reuse them.
+class StoredImage(models.Model):
+    name = models.CharField(max_length=255, unique=True)
+    sha256 = models.CharField(max_length=64, blank=True, db_index=True)
+    size = models.PositiveBigIntegerField(default=0)
+    references = models.PositiveIntegerField(default=0)
+    derivatives = models.JSONField(default=dict, blank=True)
+    image_hash = models.BigIntegerField(null=True, blank=True)
+    created = models.DateTimeField(default=timezone.now)
+    # When the last reference was released, for the garbage collector
+    released = models.DateTimeField(null=True, blank=True)
+    objects = StoredImageManager()
+
+    def __str__(self):
+        return self.name
+
+
+# Manages the version stamps of each User's lists
+class ListVersionManager(models.Manager):
+    # Returns (version, modified) for one of a User's lists, or (0, None)
+    # when the list has never been written to
+    def current(self, user, kind):
+        row = self.filter(user=user, kind=kind).values_list(
+            'version', 'modified',
+        ).first()
+        return row or (0, None)
+
+    # Moves the given lists of a User on to a new version, creating the
+    # version rows on first use, in a single upsert where supported
+    def bump(self, user_id, *kinds):
+        kinds = sorted(set(kinds))
+        now = timezone.now()
+        connection = connections[self.db]
+        if not connection.features.supports_update_conflicts_with_target:
+            for kind in kinds:
+                self._bump_one(user_id, kind, now)
+            return
+        quote = connection.ops.quote_name
+        table = quote(self.model._meta.db_table)
+        modified = self.model._meta.get_field('modified').get_db_prep_save(
+            now, connection,
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} '
+                f'({quote("user_id")}, {quote("kind")}, {quote("version")}, '
+                f'{quote("modified")}) '
+                f'VALUES {", ".join(["(%s, %s, 1, %s)"] * len(kinds))} '
+                f'ON CONFLICT ({quote("user_id")}, {quote("kind")}) '
+                f'DO UPDATE SET {quote("version")} = '
+                f'{table}.{quote("version")} + 1, '
+                f'{quote("modified")} = EXCLUDED.{quote("modified")}',
+                [value for kind in kinds
+                 for value in (user_id, kind, modified)],
+            )
+
+    def _bump_one(self, user_id, kind, now):
+        versions = self.filter(user_id=user_id, kind=kind)
+        if versions.update(version=F('version') + 1, modified=now):
+            return
+        try:
+            with transaction.atomic(using=self.db):
+                self.create(user_id=user_id, kind=kind, modified=now)
+        except IntegrityError:
+            versions.update(version=F('version') + 1, modified=now)
+
+
+# Counts the changes made to each of a User's lists, so a client holding a
+# copy of a list can revalidate it without the list being read again
+class ListVersion(models.Model):
+    COLLECTIONS = 'collections'
+    TAGS = 'tags'
+    ITEMS = 'items'
+    KIND_CHOICES = (
+        (COLLECTIONS, 'Collections'),
+        (TAGS, 'Tags'),
+        (ITEMS, 'Items'),
+    )
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+    )
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    version = models.PositiveBigIntegerField(default=1)
+    modified = models.DateTimeField(default=timezone.now)
+    objects = ListVersionManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'kind'],
+                name='base_listversion_unique_user_kind',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} v{self.version}'
+
+
+# How far an import of a file has got for a User, as the byte offset after
+# the last batch it loaded. It is saved in the transaction loading the
+# batch, so a resumed import starts right after the last batch committed.
+class ImportCheckpoint(models.Model):
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+    )
+    name = models.CharField(max_length=1024)
+    offset = models.PositiveBigIntegerField(default=0)
+    modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'name'],
+                name='base_importcheckpoint_unique_user_name',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.name} at {self.offset}'
+
+
+# Returns the worth at floor price of the Collections summed over, read
+# through `prefix` from a link table
+def worth(prefix=''):
+    return models.ExpressionWrapper(
+        F(f'{prefix}floor_price') * F(f'{prefix}items_in_collection'),
+        output_field=models.DecimalField(max_digits=24, decimal_places=2),
+    )
+
+
+# Returns what a Collection of the given size and floor price adds to the
+# portfolios holding it: itself, its items and their worth
+def portfolio_delta(items, floor_price, sign=1):
+    items = int(items)
+    return (sign, sign * items, sign * items * Decimal(str(floor_price)))
+
+
+# Manages summaries of Collections: how many there are, the items they hold
+# and their worth, which base.signals keeps in step as Collections and their
+# Tags change. Each subclass names the `source` model whose rows are summed,
+# the `key` field grouping them into summaries, the `collection` path from a
+# row to its Collection and the `extra` values copied onto every summary.
+class PortfolioManager(models.Manager):
+    totals = ('collection_count', 'items_in_collections', 'value')
+
+    # Adds {pk: (collections, items, value)} to the summaries with those
+    # keys, creating the missing rows with the other `fields`. Rows that
+    # gain Collections are upserted in a single statement per batch where
+    # supported; those that lose some are updated one at a time, so their
+    # count is kept from dropping below zero the same way whether they
+    # exist yet or not.
+    def add(self, deltas, batch_size=1000, **fields):
+        rows = []
+        for pk, delta in deltas.items():
+            if delta[0] < 0:
+                self._add_one(pk, delta, fields)
+            elif any(delta):
+                rows.append((pk, delta))
+        connection = connections[self.db]
+        if not connection.features.supports_update_conflicts_with_target:
+            for pk, delta in rows:
+                self._add_one(pk, delta, fields)
+            return
+        meta = self.model._meta
+        quote = connection.ops.quote_name
+        table = quote(meta.db_table)
+        names = [*fields, *self.totals]
+        columns = [meta.pk.column, *(meta.get_field(name).column
+                                     for name in names)]
+        updates = ', '.join(
+            f'{column} = {table}.{column} + EXCLUDED.{column}'
+            for column in map(quote, columns[-len(self.totals):])
+        )
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            params = []
+            for pk, delta in batch:
+                params.append(pk)
+                for name, value in zip(names, (*fields.values(), *delta)):
+                    params.append(meta.get_field(name).get_db_prep_save(
+                        value, connection,
+                    ))
+            placeholders = f'({", ".join(["%s"] * len(columns))})'
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'INSERT INTO {table} '
+                    f'({", ".join(map(quote, columns))}) '
+                    f'VALUES {", ".join([placeholders] * len(batch))} '
+                    f'ON CONFLICT ({quote(meta.pk.column)}) DO UPDATE SET '
+                    f'{updates}',
+                    params,
+                )
+
+    # Adds one delta to a summary, creating it from zero when missing
+    def _add_one(self, pk, delta, fields):
+        rows = self.filter(pk=pk)
+        if rows.update(**self.changes(delta)):
+            return
+        totals = dict(zip(self.totals, delta))
+        totals['collection_count'] = max(totals['collection_count'], 0)
+        try:
+            with transaction.atomic(using=self.db):
+                self.create(pk=pk, **fields, **totals)
+        except IntegrityError:
+            rows.update(**self.changes(delta))
+
+    # Returns the UPDATE values adding one delta to every row
+    def changes(self, delta):
+        values = {
+            name: F(name) + models.Value(
+                change, output_field=self.model._meta.get_field(name),
+            )
+            for name, change in zip(self.totals, delta)
+        }
+        values['collection_count'] = Greatest(values['collection_count'], 0)
+        return values
+
+    # Recomputes every summary from the Collections, one range of keys at a
+    # time, each in its own transaction, and returns how many rows hold
+    # Collections
+    def rebuild(self, batch_size=10000):
+        keys = self.model._meta.pk.related_model.objects
+        last = keys.order_by('-pk').values_list('pk', flat=True).first()
+        rebuilt = 0
+        for start in range(0, (last or 0) + 1, batch_size):
+            with transaction.atomic(using=self.db):
+                rows = [self.model(**row) for row in self.summarize(
+                    start, start + batch_size,
+                )]
+                self.filter(
+                    pk__gte=start, pk__lt=start + batch_size,
+                ).exclude(pk__in=[row.pk for row in rows]).delete()
+                self.bulk_create(
+                    rows,
+                    update_conflicts=True,
+                    unique_fields=[self.model._meta.pk.name],
+                    update_fields=self.totals,
+                )
+            rebuilt += len(rows)
+        return rebuilt
+
+    # Returns the totals of the keys from `start` up to `end`, as rows of
+    # field values
+    def summarize(self, start, end):
+        return self.source.objects.filter(**{
+            f'{self.key}__gte': start, f'{self.key}__lt': end,
+        }).order_by().values(self.key, **self.extra).annotate(
+            collection_count=Count('*'),
+            items_in_collections=Sum(f'{self.collection}items_in_collection'),
+            value=Sum(worth(self.collection)),
+        )
+
+
+# Manages the summaries of each User's Collections
+class PortfolioSummaryManager(PortfolioManager):
+    source = Collection
+    key = 'user_id'
+    collection = ''
+    extra = {}
+
+
+# Manages the summaries of the Collections holding each Tag
+class TagPortfolioManager(PortfolioManager):
+    source = Collection.tags.through
+    key = 'tag_id'
+    collection = 'collection__'
+    extra = {'user_id': F('tag__user_id')}
+
+    # Returns the summaries of the Tags a Collection holds
+    def holding(self, collection_id):
+        return self.filter(pk__in=Collection.tags.through.objects.filter(
+            collection_id=collection_id,
+        ).values('tag_id'))
+
+
+# Sums over a User's Collections, so their statistics are read from one row
+class Portfolio(models.Model):
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+    )
+    collection_count = models.PositiveIntegerField(default=0)
+    items_in_collections = models.BigIntegerField(default=0)
+    # Sum of floor_price x items_in_collection
+    value = models.DecimalField(max_digits=24, decimal_places=2, default=0)
+    objects = PortfolioSummaryManager()
+
+    def __str__(self):
+        return f'{self.collection_count} Collections worth {self.value}'
+
+
+# Sums over the Collections holding a Tag, for the breakdown of a User's
+# statistics by Tag
+class TagPortfolio(models.Model):
+    tag = models.OneToOneField(
+        'Tag',
+        on_delete=models.CASCADE,
+        primary_key=True,
+    )
+    # Served by the value index
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        db_index=False,
+    )
+    collection_count = models.PositiveIntegerField(default=0)
+    items_in_collections = models.BigIntegerField(default=0)
+    value = models.DecimalField(max_digits=24, decimal_places=2, default=0)
+    objects = TagPortfolioManager()
+
+    class Meta:
+        indexes = [
+            # Serves the per-User breakdown, worth most first
+            models.Index(
+                fields=['user', 'value', 'tag'],
+                name='base_tagportfolio_value_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.collection_count} Collections worth {self.value}'
@@ -0,0 +1,235 @@
+from django.contrib.postgres.operations import (
+    AddIndexConcurrently, CreateExtension, NotInTransactionMixin,
+    RemoveIndexConcurrently,
+)
+from django.db.migrations.operations import AddConstraint
+from django.db.migrations.operations.base import Operation
+from base.search import has_extension
+
+
+# Builds a model index with CREATE INDEX CONCURRENTLY on PostgreSQL so the
+# table stays writable, and with a plain CREATE INDEX on other databases
+class AddIndexConcurrentlyIfSupported(AddIndexConcurrently):
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            return super().database_forwards(
+                app_label, schema_editor, from_state, to_state,
+            )
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.add_index(model, self.index)
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            return super().database_backwards(
+                app_label, schema_editor, from_state, to_state,
+            )
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.remove_index(model, self.index)
+
+
+# Builds a model index that only PostgreSQL supports, such as a GIN index,
+# with CREATE INDEX CONCURRENTLY, and leaves other databases without it
+class AddPostgresIndexConcurrently(AddIndexConcurrently):
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            return super().database_forwards(
+                app_label, schema_editor, from_state, to_state,
+            )
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            return super().database_backwards(
+                app_label, schema_editor, from_state, to_state,
+            )
+
+
+# Builds a model index that needs the pg_trgm extension, e.g. with the
+# gin_trgm_ops operator class, on PostgreSQL servers that have it installed
+class AddTrigramIndexConcurrently(AddPostgresIndexConcurrently):
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        if has_extension(schema_editor.connection, 'pg_trgm'):
+            return super().database_forwards(
+                app_label, schema_editor, from_state, to_state,
+            )
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        if has_extension(schema_editor.connection, 'pg_trgm'):
+            return super().database_backwards(
+                app_label, schema_editor, from_state, to_state,
+            )
+
+
+# Installs a PostgreSQL extension when the server ships it, and otherwise
+# leaves the database without it, as features relying on it fall back
+class CreateExtensionIfAvailable(CreateExtension):
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT 1 FROM pg_available_extensions WHERE name = %s',
+                [self.name],
+            )
+            if cursor.fetchone() is None:
+                return
+        super().database_forwards(
+            app_label, schema_editor, from_state, to_state,
+        )
+
+
+# Drops a model index with DROP INDEX CONCURRENTLY on PostgreSQL and with a
+# plain DROP INDEX on other databases
+class RemoveIndexConcurrentlyIfSupported(RemoveIndexConcurrently):
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            return super().database_forwards(
+                app_label, schema_editor, from_state, to_state,
+            )
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            model_state = from_state.models[app_label, self.model_name_lower]
+            index = model_state.get_index_by_name(self.name)
+            schema_editor.remove_index(model, index)
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            return super().database_backwards(
+                app_label, schema_editor, from_state, to_state,
+            )
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            model_state = to_state.models[app_label, self.model_name_lower]
+            index = model_state.get_index_by_name(self.name)
+            schema_editor.add_index(model, index)
+
+
+# Adds a unique constraint over model fields without blocking writes on
+# PostgreSQL: its index is built with CREATE UNIQUE INDEX CONCURRENTLY and
+# then attached with ADD CONSTRAINT ... USING INDEX, which only takes the
+# table lock briefly. Other databases add the constraint as usual.
+class AddUniqueConstraintConcurrentlyIfSupported(NotInTransactionMixin,
+                                                 AddConstraint):
+    atomic = False
+
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_forwards(
+                app_label, schema_editor, from_state, to_state,
+            )
+        self._ensure_not_in_transaction(schema_editor)
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(
+                schema_editor.connection.alias, model):
+            return
+        quote = schema_editor.quote_name
+        table = quote(model._meta.db_table)
+        name = quote(self.constraint.name)
+        columns = ', '.join(
+            quote(model._meta.get_field(field).column)
+            for field in self.constraint.fields
+        )
+        schema_editor.execute(
+            f'CREATE UNIQUE INDEX CONCURRENTLY {name} ON {table} ({columns})'
+        )
+        schema_editor.execute(
+            f'ALTER TABLE {table} ADD CONSTRAINT {name} UNIQUE USING INDEX '
+            f'{name}'
+        )
+
+
+# Indexes columns of the table Django creates for a ManyToManyField, which
+# has no model of its own to declare Meta.indexes on. Columns are given as
+# the through model's field names, e.g. ('tag', 'collection').
+class AddThroughIndex(NotInTransactionMixin, Operation):
+    reduces_to_sql = True
+    reversible = True
+    atomic = False
+
+    def __init__(self, model_name, field_name, fields, name):
+        self.model_name = model_name
+        self.field_name = field_name
+        self.fields = tuple(fields)
+        self.name = name
+
+    def deconstruct(self):
+        return (
+            self.__class__.__name__,
+            [],
+            {
+                'model_name': self.model_name,
+                'field_name': self.field_name,
+                'fields': self.fields,
+                'name': self.name,
+            },
+        )
+
+    def state_forwards(self, app_label, state):
+        pass
+
+    def describe(self):
+        return (
+            f'Create index {self.name} on the {self.model_name}.'
+            f'{self.field_name} through table'
+        )
+
+    @property
+    def migration_name_fragment(self):
+        return self.name.lower()
+
+    # Returns the quoted through table and column names for this index
+    def _table_and_columns(self, apps, app_label, schema_editor):
+        model = apps.get_model(app_label, self.model_name)
+        through = model._meta.get_field(self.field_name).remote_field.through
+        quote = schema_editor.quote_name
+        columns = ', '.join(
+            quote(through._meta.get_field(field).column)
+            for field in self.fields
+        )
+        return through, quote(through._meta.db_table), columns
+
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        through, table, columns = self._table_and_columns(
+            to_state.apps, app_label, schema_editor,
+        )
+        if not self.allow_migrate_model(
+                schema_editor.connection.alias, through):
+            return
+        concurrently = self._concurrently(schema_editor)
+        schema_editor.execute(
+            f'CREATE INDEX {concurrently}IF NOT EXISTS '
+            f'{schema_editor.quote_name(self.name)} ON {table} ({columns})'
+        )
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        through, _, _ = self._table_and_columns(
+            from_state.apps, app_label, schema_editor,
+        )
+        if not self.allow_migrate_model(
+                schema_editor.connection.alias, through):
+            return
+        concurrently = self._concurrently(schema_editor)
+        schema_editor.execute(
+            f'DROP INDEX {concurrently}IF EXISTS '
+            f'{schema_editor.quote_name(self.name)}'
+        )
+
+    # Returns the CONCURRENTLY keyword when building on PostgreSQL
+    def _concurrently(self, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return ''
+        self._ensure_not_in_transaction(schema_editor)
+        return 'CONCURRENTLY '
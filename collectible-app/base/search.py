@@ -0,0 +1,111 @@
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connections
+from django.db.models import (Case, Exists, F, FloatField, OuterRef, Q,
+                              Subquery, Value, When)
+from django.db.models.functions import Cast
+
+# Text search configuration of the stored vectors and of the queries. Titles
+# and names are mostly proper names and codes, so words are only lowercased,
+# not stemmed.
+CONFIG = 'simple'
+
+# Many-to-many fields of Collection whose names are searched, with the name
+# field of the linked model
+LINKED_NAMES = (('tags', 'tag__name'), ('items', 'item__name'))
+
+
+# Tells whether a database keeps search vectors. Elsewhere search falls
+# back to matching substrings, and the vectors are left empty.
+def has_vectors(using):
+    return connections[using].vendor == 'postgresql'
+
+
+# Tells whether a PostgreSQL database has an extension installed, such as
+# pg_trgm, which not every server ships
+def has_extension(connection, name):
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1 FROM pg_extension WHERE extname = %s',
+                       [name])
+        return cursor.fetchone() is not None
+
+
+# Returns the names linked to the outer Collection through `field`, joined
+# by spaces
+def _linked_names(field, name):
+    from base.models import Collection
+    through = Collection._meta.get_field(field).remote_field.through
+    return Subquery(
+        through.objects.filter(collection_id=OuterRef('pk')).order_by()
+        .values('collection_id').annotate(names=StringAgg(name, ' '))
+        .values('names')
+    )
+
+
+# Returns the expression of a Collection's search vector: its title weighs
+# most, then the names of its Tags and Items, then its link. The title and
+# link are given as values when they are being written in the same
+# statement, as SQL reads the old ones otherwise. Names are read from the
+# links, so the expression can only be used on a row that exists.
+def document(title=F('title'), link=F('link')):
+    return (
+        SearchVector(title, weight='A', config=CONFIG) +
+        SearchVector(
+            *(_linked_names(field, name) for field, name in LINKED_NAMES),
+            weight='B', config=CONFIG,
+        ) +
+        SearchVector(link, weight='C', config=CONFIG)
+    )
+
+
+# Returns the search vector of a Collection being inserted, which has no
+# links yet
+def new_document(title, link):
+    return (
+        SearchVector(Value(title), weight='A', config=CONFIG) +
+        SearchVector(Value(link), weight='C', config=CONFIG)
+    )
+
+
+# Filters Collections to those matching a search and annotates them with
+# their rank, from the search vectors where the database keeps them
+def search(queryset, text):
+    if has_vectors(queryset.db):
+        return vector_search(queryset, text)
+    return substring_search(queryset, text)
+
+
+# Matches a web search style query, e.g. `ape "dead avatar" -pins`, against
+# the search vectors through their GIN index
+def vector_search(queryset, text):
+    query = SearchQuery(text, config=CONFIG, search_type='websearch')
+    # The rank is widened to double precision, as single precision values
+    # read back do not compare equal once sent in a cursor
+    return queryset.filter(search_vector=query).annotate(
+        rank=Cast(SearchRank(F('search_vector'), query), FloatField()),
+    )
+
+
+# Requires every word, quoted or not, to appear in the title, link or a
+# linked name, and ranks Collections holding the whole search in their
+# title first. Each Collection is read in full, so this is only meant for
+# small tables.
+def substring_search(queryset, text):
+    from base.models import Collection
+    for word in text.replace('"', ' ').split():
+        matches = Q(title__icontains=word) | Q(link__icontains=word)
+        for field, name in LINKED_NAMES:
+            through = Collection._meta.get_field(field).remote_field.through
+            matches |= Exists(through.objects.filter(**{
+                'collection_id': OuterRef('pk'),
+                f'{name}__icontains': word,
+            }))
+        queryset = queryset.filter(matches)
+    return queryset.annotate(rank=Case(
+        When(title__icontains=text, then=Value(1.0)),
+        default=Value(0.0),
+        output_field=FloatField(),
+    ))
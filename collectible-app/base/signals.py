@@ -0,0 +1,295 @@
+from django.contrib.auth import get_user_model as gum
+from django.db.models import Count, F, Sum
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+from django.utils import timezone
+from base import search
+from base.models import (Collection, Item, ListVersion, Portfolio,
+                         StoredImage, Tag, TagPortfolio, portfolio_delta,
+                         worth)
+
+
+# Moves the given Collections on to a new version, rebuilding their search
+# vectors from their current links and names in the same statement, and
+# returns how many there were
+def bump_collections(ids):
+    collections = Collection.objects.filter(pk__in=ids)
+    vector = {}
+    if search.has_vectors(collections.db):
+        vector['search_vector'] = search.document()
+    return collections.update(
+        version=F('version') + 1,
+        modified=timezone.now(),
+        **vector,
+    )
+
+
+# Bumps the list a saved Tag, Item or Collection shows up in. A renamed Tag
+# or Item also changes how the Collections holding it are rendered, and
+# which of them a search of the Collection list finds.
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Item)
+@receiver(post_save, sender=Collection)
+def bump_saved(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    kinds = [sender.list_kind]
+    if sender is not Collection and not created and bump_collections(
+        instance.collection_set.values_list('pk', flat=True),
+    ):
+        kinds.append(ListVersion.COLLECTIONS)
+    ListVersion.objects.bump(instance.user_id, *kinds)
+
+
+# Bumps the Collections holding a Tag or Item before it is deleted, while
+# the links to them still exist, and remembers them so their search vectors
+# can be rebuilt once the links are gone
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Item)
+def bump_holders(sender, instance, **kwargs):
+    holders = instance.collection_set.values_list('pk', flat=True)
+    if search.has_vectors(holders.db):
+        holders = instance._unlinked = list(holders)
+    bump_collections(holders)
+
+
+# Rebuilds the search vectors of the Collections that held a deleted Tag or
+# Item
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Item)
+def reindex_holders(sender, instance, **kwargs):
+    unlinked = instance.__dict__.pop('_unlinked', None)
+    if unlinked:
+        Collection.objects.reindex_search(unlinked)
+
+
+# Bumps the lists that change when a Tag, Item or Collection goes away
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Item)
+@receiver(post_delete, sender=Collection)
+def bump_deleted(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, gum()):
+        # The User and their lists are going away together
+        return
+    ListVersion.objects.bump(
+        instance.user_id,
+        ListVersion.COLLECTIONS,
+        ListVersion.TAGS,
+        ListVersion.ITEMS,
+    )
+
+
+# Bumps the Collections and the lists touched by adding or removing Tags or
+# Items, from either side of the relation
+@receiver(m2m_changed, sender=Collection.tags.through)
+@receiver(m2m_changed, sender=Collection.items.through)
+def bump_links(sender, instance, action, reverse, model, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if action != 'pre_clear' and not pk_set:
+        return
+    target = Item if sender is Collection.items.through else Tag
+    if reverse:
+        if action == 'pre_clear':
+            pk_set = instance.collection_set.values_list('pk', flat=True)
+        bump_collections(pk_set)
+    else:
+        bump_collections([instance.pk])
+        # Keep the instance in step with the row, so saving it again
+        # cannot write back an older version
+        instance.version += 1
+        instance.modified = timezone.now()
+    ListVersion.objects.bump(
+        instance.user_id, ListVersion.COLLECTIONS, target.list_kind,
+    )
+
+
+# Rebuilds the search vectors of Collections whose links were cleared. The
+# version is bumped before the links go, while the Collections of a Tag or
+# Item can still be found, so the vectors are rebuilt afterwards.
+@receiver(m2m_changed, sender=Collection.tags.through)
+@receiver(m2m_changed, sender=Collection.items.through)
+def reindex_cleared(sender, instance, action, reverse, **kwargs):
+    if action not in ('pre_clear', 'post_clear') or \
+            not search.has_vectors(instance._state.db):
+        return
+    if action == 'pre_clear':
+        instance._unlinked = list(
+            instance.collection_set.values_list('pk', flat=True)
+        ) if reverse else [instance.pk]
+        return
+    unlinked = instance.__dict__.pop('_unlinked', None)
+    if unlinked:
+        Collection.objects.reindex_search(unlinked)
+
+
+# Keeps the collection_count of Tags and Items in step with their links, in
+# the transaction that changes them. Additions only report the links that
+# were new, while removals report whatever was asked for, so removed links
+# are counted out while they still exist.
+@receiver(m2m_changed, sender=Collection.tags.through)
+@receiver(m2m_changed, sender=Collection.items.through)
+def count_links(sender, instance, action, reverse, model, pk_set, **kwargs):
+    if action not in ('post_add', 'pre_remove', 'pre_clear'):
+        return
+    target = Item if sender is Collection.items.through else Tag
+    if not reverse:
+        if action == 'post_add':
+            target.objects.count_usage(dict.fromkeys(pk_set, 1))
+        else:
+            target.objects.uncount_links(
+                instance.pk, pk_set if action == 'pre_remove' else None,
+            )
+        return
+    if action == 'post_add':
+        delta = len(pk_set)
+    else:
+        links = sender.objects.filter(
+            **{target._meta.model_name: instance.pk},
+        )
+        if action == 'pre_remove':
+            links = links.filter(collection_id__in=pk_set)
+        delta = -links.count()
+    target.objects.count_usage({instance.pk: delta})
+    instance.collection_count = max(0, instance.collection_count + delta)
+
+
+# Counts a Collection that is being deleted out of its Tags and Items, as
+# the database drops its links without sending m2m_changed
+@receiver(pre_delete, sender=Collection)
+def uncount_links(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, gum()):
+        # The User's Tags and Items are going away too
+        return
+    Tag.objects.uncount_links(instance.pk)
+    Item.objects.uncount_links(instance.pk)
+
+
+# Finds out which image a Collection held before this save, when it was
+# not loaded along with the Collection
+@receiver(pre_save, sender=Collection)
+def remember_image(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    if instance._state.adding:
+        instance._loaded_image = ''
+    elif not hasattr(instance, '_loaded_image'):
+        instance._loaded_image = Collection.objects.filter(
+            pk=instance.pk,
+        ).values_list('image', flat=True).first() or ''
+
+
+# Moves a reference from the image a Collection held to its new one
+@receiver(post_save, sender=Collection)
+def count_image_references(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    old = instance._loaded_image or ''
+    new = instance.image.name or ''
+    if old == new:
+        return
+    if new:
+        StoredImage.objects.acquire(new, instance.image.size)
+    if old:
+        StoredImage.objects.release(old)
+    instance._loaded_image = new
+
+
+# Releases the image of a deleted Collection
+@receiver(post_delete, sender=Collection)
+def release_image(sender, instance, **kwargs):
+    if instance.image.name:
+        StoredImage.objects.release(instance.image.name)
+
+
+# Finds out the size and floor price a Collection had before this save,
+# when they were not loaded along with it
+@receiver(pre_save, sender=Collection)
+def remember_worth(sender, instance, raw=False, **kwargs):
+    if raw or instance._state.adding or hasattr(instance, '_loaded_worth'):
+        return
+    instance._loaded_worth = Collection.objects.filter(
+        pk=instance.pk,
+    ).values_list('items_in_collection', 'floor_price').first()
+
+
+# Adds a saved Collection, or the change in its size and floor price, to
+# the portfolio of its User and to those of its Tags
+@receiver(post_save, sender=Collection)
+def count_worth(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    new = portfolio_delta(instance.items_in_collection, instance.floor_price)
+    old = (0, 0, 0)
+    if not created and instance._loaded_worth:
+        old = portfolio_delta(*instance._loaded_worth)
+    instance._loaded_worth = (instance.items_in_collection,
+                              instance.floor_price)
+    delta = tuple(after - before for after, before in zip(new, old))
+    if not any(delta):
+        return
+    Portfolio.objects.add({instance.user_id: delta})
+    if not created:
+        TagPortfolio.objects.holding(instance.pk).update(
+            **TagPortfolio.objects.changes(delta),
+        )
+
+
+# Takes a Collection that is being deleted out of the portfolios of its
+# User and its Tags, while its links still exist
+@receiver(pre_delete, sender=Collection)
+def uncount_worth(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, gum()):
+        # The portfolios are going away with the User
+        return
+    delta = portfolio_delta(
+        *getattr(instance, '_loaded_worth', None) or
+        (instance.items_in_collection, instance.floor_price),
+        sign=-1,
+    )
+    Portfolio.objects.add({instance.user_id: delta})
+    TagPortfolio.objects.holding(instance.pk).update(
+        **TagPortfolio.objects.changes(delta),
+    )
+
+
+# Keeps the portfolios of Tags in step with their links, from either side
+# of the relation. As with collection_count, removed links are taken out
+# while they still exist.
+@receiver(m2m_changed, sender=Collection.tags.through)
+def count_tag_worth(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'pre_remove', 'pre_clear'):
+        return
+    if not reverse:
+        sign = 1 if action == 'post_add' else -1
+        delta = portfolio_delta(instance.items_in_collection,
+                                instance.floor_price, sign)
+        if action == 'post_add':
+            TagPortfolio.objects.add(dict.fromkeys(pk_set, delta),
+                                     user_id=instance.user_id)
+            return
+        rows = TagPortfolio.objects.holding(instance.pk)
+        if action == 'pre_remove':
+            rows = rows.filter(pk__in=pk_set)
+        rows.update(**TagPortfolio.objects.changes(delta))
+        return
+    if action == 'pre_clear':
+        TagPortfolio.objects.filter(pk=instance.pk).update(
+            collection_count=0, items_in_collections=0, value=0,
+        )
+        return
+    collections = Collection.objects.filter(pk__in=pk_set)
+    sign = 1
+    if action == 'pre_remove':
+        collections, sign = collections.filter(tags=instance), -1
+    totals = collections.aggregate(
+        count=Count('*'),
+        items=Sum('items_in_collection'),
+        value=Sum(worth()),
+    )
+    TagPortfolio.objects.add({instance.pk: (
+        sign * totals['count'],
+        sign * (totals['items'] or 0),
+        sign * (totals['value'] or 0),
+    )}, user_id=instance.user_id)
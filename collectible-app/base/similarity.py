@@ -0,0 +1,273 @@
+import itertools
+import threading
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from PIL import Image, ImageOps
+from base.models import Collection
+
+DEFAULTS = {
+    # Distance used when a request does not ask for one, and the most a
+    # request may ask for
+    'DISTANCE': 6,
+    'MAX_DISTANCE': 12,
+    'LIMIT': 50,
+    # Seconds between looking for Collections hashed since the last look,
+    # and between rebuilding the index from scratch
+    'REFRESH': 5,
+    'REBUILD': 60 * 60,
+    # How far back each look reaches past the newest change seen, so rows
+    # committed late with an earlier `modified` are still picked up
+    'LAG': 60,
+}
+
+BITS = 64
+
+
+# Returns the IMAGE_SIMILARITY setting merged over the defaults
+def get_options():
+    return {**DEFAULTS, **getattr(settings, 'IMAGE_SIMILARITY', {})}
+
+
+# Returns the number of bits set in an integer
+if hasattr(int, 'bit_count'):
+    popcount = int.bit_count
+else:
+    def popcount(value):
+        return bin(value).count('1')
+
+
+# Returns the 64 bit difference hash of an image: each bit tells whether a
+# pixel of a 9x8 grayscale copy is brighter than its right neighbour, so
+# it survives rescaling, recompression and small edits to the image
+def dhash(image):
+    small = image.convert('L').resize((9, 8), Image.Resampling.LANCZOS)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(8):
+        for column in range(8):
+            left = pixels[row * 9 + column]
+            value = value << 1 | (left > pixels[row * 9 + column + 1])
+    return value
+
+
+# Returns the difference hash of an image in storage, upright as EXIF says
+def hash_file(storage, name):
+    with storage.open(name, 'rb') as f, Image.open(f) as image:
+        image.draft('L', (64, 64))
+        return dhash(ImageOps.exif_transpose(image))
+
+
+# Converts a hash to and from the signed 64 bit integer it is stored as
+def to_signed(value):
+    return value - (1 << BITS) if value >= 1 << (BITS - 1) else value
+
+
+def to_unsigned(value):
+    return value + (1 << BITS) if value < 0 else value
+
+
+# Multi-index hashing over 64 bit hashes. Each hash is split into `chunks`
+# substrings, each with a table of the hashes by that substring. Two hashes
+# within distance k have at least one substring within k // chunks of each
+# other, so a search only looks up the few substrings that close to those
+# of the query and checks the hashes filed under them, rather than every
+# hash in the index.
+class MultiIndexHash:
+    def __init__(self, chunks=4):
+        self.chunks = chunks
+        self.width = BITS // chunks
+        self.mask = (1 << self.width) - 1
+        self.tables = [{} for _ in range(chunks)]
+        # {hash: key, or [keys] when several share it} and {key: hash}
+        self.keys = {}
+        self.hashes = {}
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def _substrings(self, value):
+        for chunk in range(self.chunks):
+            yield chunk, value >> (chunk * self.width) & self.mask
+
+    # Files `key` under `value`, replacing what it was filed under before
+    def add(self, key, value):
+        old = self.hashes.get(key)
+        if old == value:
+            return
+        if old is not None:
+            self.discard(key)
+        self.hashes[key] = value
+        keys = self.keys.get(value)
+        if keys is None:
+            self.keys[value] = key
+            for chunk, substring in self._substrings(value):
+                self.tables[chunk].setdefault(substring, []).append(value)
+        elif isinstance(keys, list):
+            keys.append(key)
+        else:
+            self.keys[value] = [keys, key]
+
+    # Removes `key` from the index
+    def discard(self, key):
+        value = self.hashes.pop(key, None)
+        if value is None:
+            return
+        keys = self.keys[value]
+        if isinstance(keys, list):
+            keys.remove(key)
+            if len(keys) == 1:
+                self.keys[value] = keys[0]
+            return
+        del self.keys[value]
+        for chunk, substring in self._substrings(value):
+            bucket = self.tables[chunk][substring]
+            bucket.remove(value)
+            if not bucket:
+                del self.tables[chunk][substring]
+
+    # Returns [(distance, key)] of every key whose hash is within
+    # `distance` of `value`, closest first
+    def search(self, value, distance):
+        radius = distance // self.chunks
+        flips = [0] + [
+            sum(1 << bit for bit in bits)
+            for flipped in range(1, radius + 1)
+            for bits in itertools.combinations(range(self.width), flipped)
+        ]
+        seen = set()
+        found = []
+        for chunk, substring in self._substrings(value):
+            table = self.tables[chunk]
+            for flip in flips:
+                for candidate in table.get(substring ^ flip, ()):
+                    if candidate in seen:
+                        continue
+                    seen.add(candidate)
+                    apart = popcount(candidate ^ value)
+                    if apart > distance:
+                        continue
+                    keys = self.keys[candidate]
+                    if isinstance(keys, list):
+                        found.extend((apart, key) for key in keys)
+                    else:
+                        found.append((apart, keys))
+        found.sort()
+        return found
+
+
+# The image hashes of every Collection, held in memory by each process.
+# It is built from the database on first use and then kept up to date by
+# reading only the Collections changed since the last look, every REFRESH
+# seconds, and rebuilt from scratch every REBUILD seconds to drop what was
+# deleted. Entries can be out of date by that much, so callers check the
+# matches against the database. Rows are read without holding the lock
+# searches take: a rebuild fills a new index and swaps it in, and a refresh
+# only holds the lock while it adds the rows it read. One thread refreshes
+# at a time while the others search the index as it is.
+class SimilarityIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.refreshing = threading.Lock()
+        self.index = None
+        self.watermark = None
+        self.built = self.refreshed = 0.0
+
+    # Brings the index up to date if it is due
+    def refresh(self, force=False):
+        if not force and not self._due(get_options(), time.monotonic()):
+            return
+        # Only the first build is waited for
+        if not self.refreshing.acquire(blocking=force or self.index is None):
+            return
+        try:
+            options = get_options()
+            now = time.monotonic()
+            if self.index is None or force or \
+                    now - self.built >= options['REBUILD']:
+                index = MultiIndexHash()
+                newest = self._load(index, self._rows(Collection.objects))
+                with self.lock:
+                    self.index = index
+                self.watermark = newest or self.watermark or timezone.now()
+                self.built = self.refreshed = now
+            elif now - self.refreshed >= options['REFRESH']:
+                since = self.watermark - timedelta(seconds=options['LAG'])
+                rows = list(self._rows(
+                    Collection.objects.filter(modified__gte=since),
+                ))
+                with self.lock:
+                    newest = self._load(self.index, rows)
+                if newest is not None and newest > self.watermark:
+                    self.watermark = newest
+                self.refreshed = now
+        finally:
+            self.refreshing.release()
+
+    # Tells whether the index is missing or due for a refresh
+    def _due(self, options, now):
+        return self.index is None or \
+            now - self.built >= options['REBUILD'] or \
+            now - self.refreshed >= options['REFRESH']
+
+    # Yields (id, unsigned hash, modified) of the hashed Collections
+    def _rows(self, queryset):
+        rows = queryset.filter(image_hash__isnull=False).values_list(
+            'id', 'image_hash', 'modified',
+        ).order_by().iterator(chunk_size=10000)
+        for pk, image_hash, modified in rows:
+            yield pk, to_unsigned(image_hash), modified
+
+    # Files the rows in an index and returns the newest change among them
+    def _load(self, index, rows):
+        newest = None
+        for pk, value, modified in rows:
+            index.add(pk, value)
+            if newest is None or modified > newest:
+                newest = modified
+        return newest
+
+    # Returns [(distance, Collection id)] of the Collections whose image is
+    # within `distance` of `image_hash`, as the index last saw them
+    def search(self, image_hash, distance):
+        self.refresh()
+        # Refreshes add hashes to the index in place, so a search waits
+        # for them rather than reading its tables while they change
+        with self.lock:
+            return self.index.search(to_unsigned(image_hash), distance)
+
+
+_index = SimilarityIndex()
+
+
+# Drops the process-wide index, so the next search builds it again
+def reset_index():
+    global _index
+    _index = SimilarityIndex()
+
+
+# Returns [(distance, id, user id)] of the Collections other than
+# `collection` whose image is within `distance` of its own, closest first,
+# checked against the hashes they hold now
+def similar_collections(collection, distance, limit=None):
+    if collection.image_hash is None:
+        return []
+    limit = limit or get_options()['LIMIT']
+    candidates = [
+        pk for _, pk in _index.search(collection.image_hash, distance)
+        if pk != collection.pk
+    ]
+    value = to_unsigned(collection.image_hash)
+    matches = []
+    for start in range(0, len(candidates), 1000):
+        rows = Collection.objects.filter(
+            pk__in=candidates[start:start + 1000],
+            image_hash__isnull=False,
+        ).values_list('id', 'user_id', 'image_hash')
+        for pk, user_id, image_hash in rows:
+            apart = popcount(to_unsigned(image_hash) ^ value)
+            if apart <= distance:
+                matches.append((apart, pk, user_id))
+    matches.sort()
+    return matches[:limit]
@@ -0,0 +1,70 @@
+import hashlib
+import os
+import time
+import uuid
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+
+# Returns the SHA-256 of a file. Uploads streamed in through
+# collection.uploads.ImageUploadHandler already carry it, anything else is
+# read once in chunks.
+def content_digest(content):
+    digest = getattr(content, 'sha256', None)
+    if digest is None:
+        hasher = hashlib.sha256()
+        for chunk in content.chunks():
+            hasher.update(chunk)
+        digest = hasher.hexdigest()
+    return digest
+
+
+# Returns the name a file is stored under: its digest, fanned out into a
+# directory named after the first two hex digits, in the directory and with
+# the extension of the name it was given
+def content_addressed_name(name, digest):
+    directory, filename = os.path.split(name)
+    extension = os.path.splitext(filename)[1].lower()
+    return os.path.join(directory, digest[:2], f'{digest}{extension}')
+
+
+# Stores every file under the hash of its content, so identical uploads are
+# written once and then shared by name. Saving content that is already
+# stored only returns its name, after marking the file as used now by its
+# access time so base.media_gc sees it as new again, keeping the
+# modification time it is served with. New files are written under a
+# temporary name and renamed into place, so a name never points to a
+# partial file.
+class ContentAddressedStorage(FileSystemStorage):
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = content_addressed_name(name, content_digest(content))
+        path = self.path(name)
+        try:
+            stat = os.stat(path)
+            os.utime(path, ns=(time.time_ns(), stat.st_mtime_ns))
+            return name
+        except FileNotFoundError:
+            pass
+        return super().save(name, content, max_length)
+
+    # Names are unique by content, so the given one is always kept
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        if self.exists(name):
+            return name
+        directory, filename = os.path.split(name)
+        partial = os.path.join(directory, f'.{uuid.uuid4().hex}.{filename}')
+        partial = super()._save(partial, content)
+        os.replace(self.path(partial), self.path(name))
+        return name
+
+
+# Returns the storage of Collection images
+def image_storage():
+    return ContentAddressedStorage()
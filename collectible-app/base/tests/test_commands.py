@@ -1,7 +1,19 @@
+import json
+import os
+import tempfile
+from decimal import Decimal
+from io import StringIO
 from unittest.mock import patch
+from django.contrib.auth import get_user_model as gum
+from django.contrib.postgres.search import SearchQuery
 from django.core.management import call_command
-from django.db.utils import OperationalError
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.utils import DataError, OperationalError
 from django.test import TestCase
+from base import search
+from base.models import (Collection, ImportCheckpoint, Tag, Item,
+                         ListVersion, Portfolio, TagPortfolio)
 
 
 class CommandTests(TestCase):
@@ -19,3 +31,273 @@ class CommandTests(TestCase):
             gi.side_effect = [OperationalError] * 5 + [True]
             call_command('wait_for_db')
             self.assertEqual(gi.call_count, 6)
+
+
+# Tests the import_collections command
+class ImportCollectionsCommandTests(TestCase):
+    def setUp(self):
+        self.user = gum().objects.create_user(
+            'loremipsum@gmail.com',
+            'Tbin5041',
+        )
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    # Writes `content` to a file in the temporary directory
+    def write(self, name, content):
+        path = os.path.join(self.dir.name, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    # Runs the import and returns its output
+    def run_import(self, path, **options):
+        out = StringIO()
+        call_command(
+            'import_collections', path,
+            user=self.user.email, stdout=out, **options,
+        )
+        return out.getvalue()
+
+    # Tests importing Collections with their Items and Tags from NDJSON
+    def test_import_ndjson(self):
+        rows = [
+            {'title': 'Dead Avatar Project', 'items_in_collection': 10000,
+             'floor_price': '0.50', 'items': ['DeadAvatar001'],
+             'tags': ['NFTs', 'Pins']},
+            {'title': 'bayc', 'items_in_collection': 5,
+             'floor_price': 8.67, 'tags': ['NFTs']},
+        ]
+        path = self.write(
+            'collections.ndjson',
+            ''.join(json.dumps(row) + '\n' for row in rows),
+        )
+        out = self.run_import(path, batch_size=1)
+        self.assertIn('Imported 2 Collections.', out)
+        collection = Collection.objects.get(title='Dead Avatar Project')
+        self.assertEqual(collection.user, self.user)
+        self.assertEqual(
+            sorted(collection.tags.values_list('name', flat=True)),
+            ['NFTs', 'Pins'],
+        )
+        self.assertEqual(
+            list(collection.items.values_list('name', flat=True)),
+            ['DeadAvatar001'],
+        )
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(
+            ListVersion.objects.current(self.user, 'collections')[0], 2,
+        )
+        portfolio = Portfolio.objects.get(user=self.user)
+        self.assertEqual(
+            (portfolio.collection_count, portfolio.items_in_collections,
+             portfolio.value),
+            (2, 10005, Decimal('5043.35')),
+        )
+        self.assertEqual(
+            TagPortfolio.objects.get(tag__name='NFTs').value,
+            Decimal('5043.35'),
+        )
+
+    # Tests importing from CSV reuses the User's existing Tags and Items
+    def test_import_csv_reuses_names(self):
+        tag = Tag.objects.create(user=self.user, name='NFTs')
+        path = self.write(
+            'collections.csv',
+            'title,items_in_collection,floor_price,link,items,tags\n'
+            'Dead Avatar Project,10000,0.50,,DeadAvatar001|Founder,NFTs\n'
+            '"Comic-Con, 2019",3,1.00,https://x.test,,NFTs|Pins\n',
+        )
+        self.run_import(path)
+        self.assertEqual(Collection.objects.count(), 2)
+        comic = Collection.objects.get(title='Comic-Con, 2019')
+        self.assertEqual(comic.link, 'https://x.test')
+        self.assertIn(tag, comic.tags.all())
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(Item.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(
+            dict(Tag.objects.values_list('name', 'collection_count')),
+            {'NFTs': 2, 'Pins': 1},
+        )
+
+    # Tests resuming an import from the saved checkpoint after a bad row
+    def test_import_resume_from_checkpoint(self):
+        header = 'title,items_in_collection,floor_price\n'
+        path = self.write(
+            'collections.csv',
+            header + 'First,1,1.00\nSecond,1,1.00\nBroken,x,1.00\n',
+        )
+        with self.assertRaises(CommandError):
+            self.run_import(path, batch_size=1)
+        self.assertEqual(Collection.objects.count(), 2)
+        offset = ImportCheckpoint.objects.get(user=self.user).offset
+        loaded = 'First,1,1.00\nSecond,1,1.00\n'
+        self.assertEqual(offset, len(header) + len(loaded))
+        with open(path, 'r+') as f:
+            f.seek(offset)
+            f.write('Third,1,1.00\n')
+            f.truncate()
+        self.run_import(path, resume=True)
+        self.assertEqual(
+            sorted(Collection.objects.values_list('title', flat=True)),
+            ['First', 'Second', 'Third'],
+        )
+
+    # Tests a batch that fails to load leaves the checkpoint where the last
+    # committed batch put it, so resuming loads every row once
+    def test_import_checkpoint_follows_commits(self):
+        header = 'title,items_in_collection,floor_price\n'
+        path = self.write(
+            'collections.csv',
+            header + 'First,1,1.00\nSecond,1,1.00\nThird,1,1.00\n',
+        )
+        reindex = Collection.objects.reindex_search
+        calls = []
+
+        def fail_second(ids):
+            calls.append(ids)
+            if len(calls) == 2:
+                raise RuntimeError('Crashed')
+            return reindex(ids)
+
+        with patch.object(Collection.objects, 'reindex_search',
+                          side_effect=fail_second):
+            with self.assertRaises(RuntimeError):
+                self.run_import(path, batch_size=1)
+        self.assertEqual(
+            ImportCheckpoint.objects.get(user=self.user).offset,
+            len(header + 'First,1,1.00\n'),
+        )
+        self.run_import(path, resume=True)
+        self.assertEqual(
+            sorted(Collection.objects.values_list('title', flat=True)),
+            ['First', 'Second', 'Third'],
+        )
+
+    # Tests values the Collection fields would reject or cut short stop the
+    # import at their row instead of being loaded
+    def test_import_rejects_invalid_values(self):
+        rows = [
+            {'floor_price': 'NaN'},
+            {'floor_price': 'Infinity'},
+            {'floor_price': '1234567.00'},
+            {'floor_price': '1.005'},
+            {'items_in_collection': 2 ** 70},
+            {'title': 'x' * 256},
+            {'link': 'x' * 256},
+            {'tags': ['x' * 256]},
+            {'title': ''},
+        ]
+        valid = {'title': 'bayc', 'items_in_collection': 5,
+                 'floor_price': '8.67'}
+        for row in rows:
+            path = self.write(
+                'collections.ndjson',
+                json.dumps(valid) + '\n' + json.dumps({**valid, **row}) + '\n',
+            )
+            with self.subTest(row=row):
+                with self.assertRaisesMessage(CommandError, 'Invalid row 2'):
+                    self.run_import(path, batch_size=1)
+        self.assertEqual(Collection.objects.count(), len(rows))
+        self.assertFalse(Collection.objects.exclude(title='bayc').exists())
+
+    # Tests a batch the database rejects names its rows and keeps the
+    # checkpoint before them
+    def test_import_database_error(self):
+        header = 'title,items_in_collection,floor_price\n'
+        path = self.write(
+            'collections.csv',
+            header + 'First,1,1.00\nSecond,1,1.00\n',
+        )
+        fail = patch.object(Collection.objects, 'reindex_search', side_effect=[
+            None, DataError('value too long'),
+        ])
+        with fail, self.assertRaisesMessage(CommandError, 'rows 2 to 2'):
+            self.run_import(path, batch_size=1)
+        self.assertEqual(
+            ImportCheckpoint.objects.get(user=self.user).offset,
+            len(header + 'First,1,1.00\n'),
+        )
+
+    # Tests that an unknown User is rejected
+    def test_import_unknown_user(self):
+        path = self.write('collections.ndjson', '')
+        with self.assertRaises(CommandError):
+            call_command('import_collections', path, user='nobody@x.test')
+
+
+# Tests the recount_usage command
+class RecountUsageCommandTests(TestCase):
+    # Tests drifted counts are fixed and the User's list moves on
+    def test_recount_usage(self):
+        user = gum().objects.create_user('loremipsum@gmail.com', 'Tbin5041')
+        collection = Collection.objects.create(
+            user=user,
+            title='Dead Avatar Project',
+            items_in_collection=10000,
+            floor_price=0.50,
+        )
+        collection.items.add(Item.objects.create(user=user, name='Ape'))
+        Item.objects.update(collection_count=0)
+        version = ListVersion.objects.current(user, 'items')[0]
+        out = StringIO()
+        call_command('recount_usage', stdout=out)
+        self.assertIn('Fixed 1 items.', out.getvalue())
+        self.assertEqual(Item.objects.get().collection_count, 1)
+        self.assertEqual(
+            ListVersion.objects.current(user, 'items')[0], version + 1,
+        )
+
+
+class ReindexSearchCommandTests(TestCase):
+    # Tests vectors written around the signals are rebuilt, on PostgreSQL
+    # only
+    def test_reindex_search(self):
+        user = gum().objects.create_user('loremipsum@gmail.com', 'Tbin5041')
+        collection = Collection.objects.create(
+            user=user,
+            title='Dead Avatar Project',
+            items_in_collection=10000,
+            floor_price=0.50,
+        )
+        collection.tags.add(Tag.objects.create(user=user, name='Pins'))
+        Collection.objects.update(search_vector=None)
+        out = StringIO()
+        call_command('reindex_search', stdout=out)
+        indexed = connection.vendor == 'postgresql'
+        self.assertIn(f'Rebuilt {int(indexed)} search vectors.',
+                      out.getvalue())
+        if indexed:
+            self.assertTrue(Collection.objects.filter(
+                search_vector=SearchQuery('pins', config=search.CONFIG),
+            ).exists())
+
+
+# Tests the rebuild_portfolios command
+class RebuildPortfoliosCommandTests(TestCase):
+    # Tests drifted portfolios are recomputed and emptied ones dropped
+    def test_rebuild_portfolios(self):
+        user = gum().objects.create_user('loremipsum@gmail.com', 'Tbin5041')
+        collection = Collection.objects.create(
+            user=user,
+            title='Dead Avatar Project',
+            items_in_collection=10000,
+            floor_price=0.50,
+        )
+        collection.tags.add(Tag.objects.create(user=user, name='Pins'))
+        unused = Tag.objects.create(user=user, name='Unused')
+        Portfolio.objects.update(value=0, collection_count=7)
+        TagPortfolio.objects.create(tag=unused, user=user, value=1)
+        out = StringIO()
+        call_command('rebuild_portfolios', stdout=out)
+        self.assertIn('Rebuilt the portfolios of 1 Users and 1 Tags.',
+                      out.getvalue())
+        portfolio = Portfolio.objects.get(user=user)
+        self.assertEqual((portfolio.collection_count, portfolio.value),
+                         (1, Decimal('5000.00')))
+        self.assertEqual(
+            list(TagPortfolio.objects.values_list('tag__name', 'value')),
+            [('Pins', Decimal('5000.00'))],
+        )
@@ -0,0 +1,103 @@
+import io
+import tempfile
+from PIL import Image
+from django.contrib.auth import get_user_model as gum
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from base import derivatives
+from base.models import Collection, ListVersion, StoredImage
+
+
+# Returns an encoded image of the given size, with an EXIF orientation
+def sample_image(size=(1200, 800), image_format='JPEG', orientation=None):
+    buffer = io.BytesIO()
+    exif = Image.Exif()
+    if orientation:
+        exif[0x0112] = orientation
+    Image.new('RGB', size, 'red').save(buffer, image_format, exif=exif)
+    return buffer.getvalue()
+
+
+# Tests the generation of resized copies of Collection images
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class DerivativeTests(TestCase):
+    def setUp(self):
+        self.user = gum().objects.create_user(
+            'loremipsum@gmail.com',
+            'Tbin5041',
+        )
+        self.collection = Collection.objects.create(
+            user=self.user,
+            title='Dead Avatar Project',
+            items_in_collection=10000,
+            floor_price=0.50,
+        )
+
+    # Saves `content` as the Collection's image
+    def set_image(self, content, name='original.jpg'):
+        self.collection.image.save(name, ContentFile(content))
+        return self.collection.image.name
+
+    # Tests every size is written in every format within its bounds, turned
+    # upright and without the EXIF metadata of the original
+    def test_render_derivatives(self):
+        name = self.set_image(sample_image(orientation=6))
+        rendered = derivatives.render_derivatives(name)
+        self.assertEqual(set(rendered), {'thumb', 'small', 'medium'})
+        for size, edge in derivatives.DEFAULTS['SIZES'].items():
+            for extension, path in rendered[size].items():
+                with default_storage.open(path) as f, Image.open(f) as image:
+                    self.assertEqual(max(image.size), edge)
+                    # 1200x800 rotated by the EXIF orientation
+                    self.assertGreater(image.height, image.width)
+                    self.assertNotIn(0x0112, image.getexif())
+                    self.assertEqual(
+                        image.format,
+                        derivatives.DEFAULTS['FORMATS'][extension],
+                    )
+
+    # Tests images with an alpha channel are still encoded as JPEG
+    def test_render_derivatives_with_alpha(self):
+        buffer = io.BytesIO()
+        Image.new('RGBA', (300, 300)).save(buffer, 'PNG')
+        name = self.set_image(buffer.getvalue(), 'original.png')
+        rendered = derivatives.render_derivatives(name)
+        self.assertTrue(default_storage.exists(rendered['thumb']['jpg']))
+
+    # Tests generated derivatives are recorded and bump the versions
+    def test_generate_derivatives(self):
+        name = self.set_image(sample_image())
+        version = Collection.objects.get(pk=self.collection.pk).version
+        derivatives.generate_derivatives(name)
+        collection = Collection.objects.get(pk=self.collection.pk)
+        self.assertIn('thumb', collection.image_derivatives)
+        self.assertIsNotNone(collection.image_hash)
+        self.assertEqual(
+            StoredImage.objects.get(name=name).image_hash,
+            collection.image_hash,
+        )
+        self.assertEqual(collection.version, version + 1)
+        self.assertGreater(
+            ListVersion.objects.current(self.user, 'collections')[0], 0,
+        )
+
+    # Tests derivatives of an image replaced in the meantime are discarded
+    def test_generate_derivatives_of_replaced_image(self):
+        old = self.set_image(sample_image())
+        self.set_image(sample_image((600, 400)), 'newer.jpg')
+        self.assertIsNone(
+            derivatives.generate_derivatives(old),
+        )
+        path = derivatives.derivative_path(old, 'thumb', 'webp')
+        self.assertFalse(default_storage.exists(path))
+        self.collection.refresh_from_db()
+        self.assertEqual(self.collection.image_derivatives, {})
+
+    # Tests an image Pillow cannot read is skipped
+    def test_generate_derivatives_of_broken_image(self):
+        name = self.set_image(b'not an image')
+        with self.assertLogs('base.derivatives', 'ERROR'):
+            self.assertIsNone(
+                derivatives.generate_derivatives(name),
+            )
@@ -0,0 +1,182 @@
+import io
+import os
+import shutil
+import tempfile
+import time
+from io import StringIO
+from django.contrib.auth import get_user_model as gum
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+from base import media_gc
+from base.derivatives import render_derivatives
+from base.models import Collection, StoredImage
+from base.storage import image_storage
+
+DAY = 24 * 60 * 60
+
+
+# Returns a PNG of the given size
+def sample_png(size=(10, 10)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+# Tests the garbage collection of unreferenced Collection images
+class MediaGarbageCollectorTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        media = override_settings(MEDIA_ROOT=self.root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.user = gum().objects.create_user(
+            'loremipsum@gmail.com',
+            'Tbin5041',
+        )
+
+    # Creates a Collection holding an image with `content`
+    def sample_collection(self, content):
+        collection = Collection.objects.create(
+            user=self.user,
+            title='Dead Avatar Project',
+            items_in_collection=10000,
+            floor_price=0.50,
+        )
+        collection.image.save('upload.png', ContentFile(content))
+        return collection
+
+    # Dates every file under MEDIA_ROOT back by `seconds`
+    def age_files(self, seconds=2 * DAY):
+        then = time.time() - seconds
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                os.utime(os.path.join(directory, name), (then, then))
+
+    # Returns every file under MEDIA_ROOT, relative to it
+    def stored_files(self):
+        return {
+            os.path.relpath(os.path.join(directory, name), self.root)
+            for directory, _, files in os.walk(self.root)
+            for name in files
+        }
+
+    # Tests a replaced image is deleted with its derivatives, and the image
+    # still in use is kept with its own
+    def test_collect_replaced_image(self):
+        collection = self.sample_collection(sample_png())
+        old = collection.image.name
+        old_derivatives = render_derivatives(old)
+        collection.image.save('upload.png', ContentFile(sample_png((20, 20))))
+        render_derivatives(collection.image.name)
+        StoredImage.objects.filter(name=old).update(
+            released=timezone.now() - timezone.timedelta(days=2),
+        )
+        self.age_files()
+        before = self.stored_files()
+        size = sum(
+            os.path.getsize(os.path.join(self.root, path))
+            for path in before
+            if path.startswith(os.path.splitext(old)[0])
+        )
+
+        report = media_gc.collect()
+
+        self.assertEqual(report.deleted, 7)
+        self.assertEqual(report.reclaimed, size)
+        self.assertEqual(report.files, 14)
+        self.assertFalse(default_storage.exists(old))
+        for paths in old_derivatives.values():
+            for path in paths.values():
+                self.assertFalse(default_storage.exists(path))
+        self.assertEqual(len(self.stored_files()), 7)
+        self.assertTrue(default_storage.exists(collection.image.name))
+        self.assertFalse(StoredImage.objects.filter(name=old).exists())
+
+    # Tests files are kept while they are inside the grace period
+    def test_collect_respects_grace(self):
+        collection = self.sample_collection(sample_png())
+        collection.delete()
+        # Released just now, although the file itself is old
+        self.age_files()
+        self.assertEqual(media_gc.collect().deleted, 0)
+        # Unreferenced long ago, although the file was just written
+        StoredImage.objects.update(
+            released=timezone.now() - timezone.timedelta(days=2),
+        )
+        self.age_files(0)
+        self.assertEqual(media_gc.collect().deleted, 0)
+        self.age_files()
+        self.assertEqual(media_gc.collect().deleted, 1)
+        self.assertEqual(self.stored_files(), set())
+
+    # Tests an unreferenced file saved again with the same content is kept
+    # without changing its modification time
+    def test_collect_keeps_saved_again(self):
+        content = sample_png()
+        self.sample_collection(content).delete()
+        StoredImage.objects.update(
+            released=timezone.now() - timezone.timedelta(days=2),
+        )
+        self.age_files()
+        name = StoredImage.objects.get().name
+        mtime = os.stat(default_storage.path(name)).st_mtime_ns
+        self.assertEqual(
+            image_storage().save('uploads/collection/again.png',
+                                 ContentFile(content)),
+            name,
+        )
+        self.assertEqual(media_gc.collect().deleted, 0)
+        self.assertEqual(os.stat(default_storage.path(name)).st_mtime_ns,
+                         mtime)
+
+    # Tests leftover partial writes are deleted once they are old
+    def test_collect_partial_writes(self):
+        directory = os.path.join(self.root, 'uploads', 'collection', 'ab')
+        os.makedirs(directory)
+        with open(os.path.join(directory, '.1234.ab.png'), 'wb') as f:
+            f.write(b'partial')
+        self.assertEqual(media_gc.collect().deleted, 0)
+        self.age_files()
+        self.assertEqual(media_gc.collect().reclaimed, len(b'partial'))
+
+    # Tests a file touched by a new upload of the same content while it is
+    # being collected is put back
+    def test_remove_touched_file(self):
+        collection = self.sample_collection(sample_png())
+        path = default_storage.path(collection.image.name)
+        cutoff = timezone.now() - timezone.timedelta(days=1)
+        self.assertEqual(media_gc.remove(path, cutoff), 0)
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(len(self.stored_files()), 1)
+
+    # Tests references are checked in one pair of queries per batch,
+    # however many directories the images are spread over
+    def test_collect_batches_queries(self):
+        for i in range(6):
+            self.sample_collection(sample_png((10 + i, 10)))
+        self.age_files()
+        with self.assertNumQueries(2):
+            report = media_gc.collect(batch_size=10)
+        self.assertEqual(report.deleted, 0)
+        with self.assertNumQueries(6):
+            media_gc.collect(batch_size=2)
+
+    # Tests the command reports without deleting on a dry run
+    def test_collect_media_command(self):
+        self.sample_collection(sample_png()).delete()
+        StoredImage.objects.update(
+            released=timezone.now() - timezone.timedelta(days=2),
+        )
+        self.age_files()
+        out = StringIO()
+        call_command('collect_media', '--dry-run', stdout=out)
+        self.assertIn('Would reclaim', out.getvalue())
+        self.assertIn('in 1 files', out.getvalue())
+        self.assertEqual(len(self.stored_files()), 1)
+        call_command('collect_media', stdout=out)
+        self.assertEqual(self.stored_files(), set())
@@ -77,3 +77,141 @@ class ModelTests(TestCase):
         file_path = models.collection_image_file_path(None, 'testImage.png')
         expected_path = f'uploads/collection/{uuid}.png'
         self.assertEqual(file_path, expected_path)
+
+    # Tests that bumping creates the version rows and then increments them
+    def test_list_version_bump(self):
+        user = sample_user()
+        LV = models.ListVersion
+        self.assertEqual(LV.objects.current(user, LV.TAGS), (0, None))
+        LV.objects.bump(user.pk, LV.TAGS)
+        LV.objects.bump(user.pk, LV.TAGS, LV.ITEMS)
+        self.assertEqual(LV.objects.current(user, LV.TAGS)[0], 2)
+        self.assertEqual(LV.objects.current(user, LV.ITEMS)[0], 1)
+
+    # Tests upserting names returns the ids of existing and new rows while
+    # leaving the existing ones as they were
+    def test_upsert_names(self):
+        user = sample_user()
+        tag = models.Tag.objects.create(user=user, name='Pins')
+        models.Tag.objects.filter(pk=tag.pk).update(collection_count=3)
+        ids = models.Tag.objects.upsert_names(user, ['Pins', 'NFTs', 'Pins'])
+        self.assertEqual(ids['Pins'], tag.pk)
+        self.assertEqual(
+            dict(models.Tag.objects.values_list('name', 'collection_count')),
+            {'Pins': 3, 'NFTs': 0},
+        )
+        self.assertEqual(ids['NFTs'], models.Tag.objects.get(name='NFTs').pk)
+
+    # Tests that saving a Collection and changing its Tags bump its version
+    def test_collection_version_bumped(self):
+        user = sample_user()
+        collection = models.Collection.objects.create(
+            user=user,
+            title='Dead Avatar Project',
+            items_in_collection=10000,
+            floor_price=0.50,
+        )
+        tag = models.Tag.objects.create(user=user, name='NFTs')
+        collection.tags.add(tag)
+        collection.refresh_from_db()
+        self.assertEqual(collection.version, 2)
+        tag.name = 'Pins'
+        tag.save()
+        collection.refresh_from_db()
+        self.assertEqual(collection.version, 3)
+        collection.save()
+        collection.refresh_from_db()
+        self.assertEqual(collection.version, 4)
+
+    # Tests a User can be deleted along with their Collections
+    def test_delete_user_with_collections(self):
+        user = sample_user()
+        collection = models.Collection.objects.create(
+            user=user,
+            title='Dead Avatar Project',
+            items_in_collection=10000,
+            floor_price=0.50,
+        )
+        collection.tags.add(models.Tag.objects.create(user=user, name='NFTs'))
+        user.delete()
+        self.assertFalse(models.ListVersion.objects.exists())
+
+
+# Tests the usage counts of Tags and Items follow their links
+class UsageCountTests(TestCase):
+    def setUp(self):
+        self.user = sample_user()
+        self.tags = [
+            models.Tag.objects.create(user=self.user, name=f'Tag{i}')
+            for i in range(3)
+        ]
+        self.collections = [
+            models.Collection.objects.create(
+                user=self.user,
+                title=f'Collection{i}',
+                items_in_collection=10,
+                floor_price=0.50,
+            )
+            for i in range(2)
+        ]
+
+    def counts(self):
+        return list(
+            models.Tag.objects.order_by('id')
+            .values_list('collection_count', flat=True)
+        )
+
+    # Tests adding, removing and clearing from the Collection side, where
+    # links that already exist or never existed are not counted
+    def test_forward_changes(self):
+        first, second = self.collections
+        first.tags.add(*self.tags)
+        first.tags.add(self.tags[0])
+        second.tags.add(self.tags[0])
+        self.assertEqual(self.counts(), [2, 1, 1])
+        second.tags.remove(self.tags[0], self.tags[1])
+        self.assertEqual(self.counts(), [1, 1, 1])
+        first.tags.set([self.tags[2]])
+        self.assertEqual(self.counts(), [0, 0, 1])
+        first.tags.clear()
+        self.assertEqual(self.counts(), [0, 0, 0])
+
+    # Tests adding, removing and clearing from the Tag side
+    def test_reverse_changes(self):
+        tag = self.tags[0]
+        tag.collection_set.add(*self.collections)
+        self.assertEqual(tag.collection_count, 2)
+        tag.collection_set.remove(self.collections[0], self.collections[0])
+        self.assertEqual(self.counts()[0], 1)
+        tag.collection_set.clear()
+        self.assertEqual(self.counts()[0], 0)
+
+    # Tests deleting a Collection counts it out of its Tags and Items
+    def test_delete_collection(self):
+        item = models.Item.objects.create(user=self.user, name='Ape')
+        for collection in self.collections:
+            collection.tags.add(self.tags[0])
+            collection.items.add(item)
+        self.collections[0].delete()
+        self.assertEqual(self.counts()[0], 1)
+        item.refresh_from_db()
+        self.assertEqual(item.collection_count, 1)
+
+    # Tests saving a Tag loaded before its links changed keeps the count
+    def test_save_keeps_count(self):
+        tag = models.Tag.objects.get(pk=self.tags[0].pk)
+        self.collections[0].tags.add(tag)
+        tag.name = 'Renamed'
+        tag.save()
+        tag.refresh_from_db()
+        self.assertEqual((tag.name, tag.collection_count), ('Renamed', 1))
+
+    # Tests recounting fixes only the rows that drifted
+    def test_recount_usage(self):
+        self.collections[0].tags.add(self.tags[0])
+        models.Tag.objects.filter(pk=self.tags[1].pk).update(
+            collection_count=5,
+        )
+        fixed, user_ids = models.Tag.objects.recount_usage(batch_size=2)
+        self.assertEqual((fixed, user_ids), (1, {self.user.pk}))
+        self.assertEqual(self.counts(), [1, 0, 0])
@@ -0,0 +1,168 @@
+import io
+import random
+import threading
+import time
+from unittest.mock import patch
+from django.contrib.auth import get_user_model as gum
+from django.test import TestCase, override_settings
+from PIL import Image, ImageDraw
+from base import similarity
+from base.models import Collection
+
+
+# Returns an image with a few shapes on it, different for every seed
+def sample_image(seed, size=(256, 256)):
+    rng = random.Random(seed)
+    image = Image.new('RGB', size, 'white')
+    draw = ImageDraw.Draw(image)
+    for _ in range(6):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        draw.ellipse(
+            (x, y, x + size[0] // 3, y + size[1] // 3),
+            fill=tuple(rng.randrange(256) for _ in range(3)),
+        )
+    return image
+
+
+# Tests perceptual hashing and the multi-index hash
+class SimilarityTests(TestCase):
+    # Tests a resized, recompressed copy hashes close to the original and
+    # another image does not
+    def test_dhash(self):
+        original = similarity.dhash(sample_image(1))
+        buffer = io.BytesIO()
+        sample_image(1).resize((120, 120)).save(buffer, 'JPEG', quality=40)
+        copy = similarity.dhash(Image.open(buffer))
+        other = similarity.dhash(sample_image(2))
+        self.assertLessEqual(similarity.popcount(original ^ copy), 4)
+        self.assertGreater(similarity.popcount(original ^ other), 12)
+
+    # Tests hashes survive the round trip through a signed 64 bit column
+    def test_signed_round_trip(self):
+        for value in (0, 1, 2 ** 63 - 1, 2 ** 63, 2 ** 64 - 1):
+            signed = similarity.to_signed(value)
+            self.assertGreaterEqual(signed, -2 ** 63)
+            self.assertLess(signed, 2 ** 63)
+            self.assertEqual(similarity.to_unsigned(signed), value)
+
+    # Tests searches find exactly what a linear scan finds
+    def test_search_matches_scan(self):
+        rng = random.Random(0)
+        hashes = [rng.getrandbits(64) for _ in range(2000)]
+        # Near copies of the first hashes, up to 10 bits apart
+        for i in range(200):
+            value = hashes[i]
+            for bit in rng.sample(range(64), i % 11):
+                value ^= 1 << bit
+            hashes.append(value)
+        index = similarity.MultiIndexHash()
+        for key, value in enumerate(hashes):
+            index.add(key, value)
+        for distance in (0, 3, 6, 10):
+            for value in hashes[:50]:
+                expected = sorted(
+                    (similarity.popcount(value ^ other), key)
+                    for key, other in enumerate(hashes)
+                    if similarity.popcount(value ^ other) <= distance
+                )
+                self.assertEqual(index.search(value, distance), expected)
+
+    # Tests keys can be moved to another hash, share one and be removed
+    def test_add_and_discard(self):
+        index = similarity.MultiIndexHash()
+        index.add(1, 0b1011)
+        index.add(2, 0b1011)
+        index.add(3, 0b1010)
+        self.assertEqual(index.search(0b1011, 1), [(0, 1), (0, 2), (1, 3)])
+        index.add(2, 2 ** 63)
+        index.discard(1)
+        self.assertEqual(index.search(0b1011, 1), [(1, 3)])
+        self.assertEqual(index.search(2 ** 63, 0), [(0, 2)])
+        index.discard(3)
+        index.discard(2)
+        self.assertEqual(len(index), 0)
+        self.assertEqual(index.tables, [{}, {}, {}, {}])
+
+
+# Tests the process-wide index over Collections
+@override_settings(IMAGE_SIMILARITY={'REFRESH': 0})
+class SimilarCollectionsTests(TestCase):
+    def setUp(self):
+        similarity.reset_index()
+        self.addCleanup(similarity.reset_index)
+        self.user = gum().objects.create_user(
+            'loremipsum@gmail.com',
+            'Tbin5041',
+        )
+
+    def sample_collection(self, image_hash):
+        return Collection.objects.create(
+            user=self.user,
+            title='Dead Avatar Project',
+            items_in_collection=10000,
+            floor_price=0.50,
+            image_hash=similarity.to_signed(image_hash),
+        )
+
+    # Tests Collections hashed after the index was built are found, and
+    # ones whose hash changed or that were deleted are not
+    def test_similar_collections(self):
+        first = self.sample_collection(2 ** 64 - 1)
+        second = self.sample_collection(2 ** 64 - 2)
+        self.assertEqual(
+            similarity.similar_collections(first, 1),
+            [(1, second.pk, self.user.pk)],
+        )
+        third = self.sample_collection(2 ** 64 - 1 - 2 ** 40)
+        self.assertEqual(
+            [pk for _, pk, _ in similarity.similar_collections(first, 1)],
+            [second.pk, third.pk],
+        )
+        second.delete()
+        Collection.objects.filter(pk=third.pk).update(image_hash=0)
+        self.assertEqual(similarity.similar_collections(first, 1), [])
+
+    # Tests a Collection without a hash has no matches
+    def test_unhashed_collection(self):
+        collection = self.sample_collection(0)
+        collection.image_hash = None
+        self.assertEqual(similarity.similar_collections(collection, 6), [])
+
+    # Tests a search waits for a refresh changing the index to finish
+    @override_settings(IMAGE_SIMILARITY={})
+    def test_search_waits_for_refresh(self):
+        index = similarity.SimilarityIndex()
+        index.index = similarity.MultiIndexHash()
+        index.built = index.refreshed = time.monotonic()
+        found = []
+        searcher = threading.Thread(
+            target=lambda: found.append(index.search(0, 1)),
+        )
+        with index.lock:
+            searcher.start()
+            searcher.join(0.2)
+            self.assertTrue(searcher.is_alive())
+            index.index.add(1, 1)
+        searcher.join()
+        self.assertEqual(found, [[(1, 1)]])
+
+    # Tests rebuilds and refreshes read the rows without holding the lock
+    # searches take, and only the first build is waited for
+    def test_reads_outside_search_lock(self):
+        first = self.sample_collection(1)
+        index = similarity.SimilarityIndex()
+        rows = similarity.SimilarityIndex._rows
+        reads = []
+
+        def read(this, queryset):
+            reads.append(index.lock.locked())
+            return rows(this, queryset)
+
+        with patch.object(similarity.SimilarityIndex, '_rows', read):
+            index.refresh()
+            second = self.sample_collection(3)
+            index.refresh()
+            with index.refreshing:
+                index.refresh()
+        self.assertEqual(reads, [False, False])
+        self.assertEqual(index.search(1, 1), [(0, first.pk), (1, second.pk)])
@@ -0,0 +1,95 @@
+import hashlib
+import io
+import os
+import tempfile
+from django.contrib.auth import get_user_model as gum
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+from PIL import Image
+from base.models import Collection, StoredImage
+from base.storage import ContentAddressedStorage
+
+
+# Returns a PNG of the given size
+def sample_png(size=(10, 10)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+# Tests storing Collection images by content with reference counts
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ContentAddressedStorageTests(TestCase):
+    def setUp(self):
+        self.user = gum().objects.create_user(
+            'loremipsum@gmail.com',
+            'Tbin5041',
+        )
+
+    # Creates a Collection holding an image with `content`
+    def sample_collection(self, content=None):
+        collection = Collection.objects.create(
+            user=self.user,
+            title='Dead Avatar Project',
+            items_in_collection=10000,
+            floor_price=0.50,
+        )
+        if content is not None:
+            collection.image.save('upload.PNG', ContentFile(content))
+        return collection
+
+    # Tests identical content is written once under its hash
+    def test_identical_content_shared(self):
+        content = sample_png()
+        digest = hashlib.sha256(content).hexdigest()
+        storage = ContentAddressedStorage()
+        name = storage.save('uploads/collection/a.png', ContentFile(content))
+        self.assertEqual(
+            name, f'uploads/collection/{digest[:2]}/{digest}.png',
+        )
+        self.assertEqual(
+            storage.save('uploads/collection/b.PNG', ContentFile(content)),
+            name,
+        )
+        self.assertEqual(os.listdir(os.path.dirname(storage.path(name))),
+                         [os.path.basename(name)])
+        other = storage.save(
+            'uploads/collection/c.png', ContentFile(sample_png((20, 20))),
+        )
+        self.assertNotEqual(other, name)
+
+    # Tests every Collection holding an image counts as one reference
+    def test_reference_counts(self):
+        content = sample_png()
+        first = self.sample_collection(content)
+        second = self.sample_collection(content)
+        self.assertEqual(first.image.name, second.image.name)
+        stored = StoredImage.objects.get(name=first.image.name)
+        self.assertEqual(stored.references, 2)
+        self.assertEqual(stored.sha256, hashlib.sha256(content).hexdigest())
+        self.assertEqual(stored.size, len(content))
+
+        second = Collection.objects.get(pk=second.pk)
+        second.image.save('other.png', ContentFile(sample_png((20, 20))))
+        stored.refresh_from_db()
+        self.assertEqual(stored.references, 1)
+        self.assertEqual(
+            StoredImage.objects.get(name=second.image.name).references, 1,
+        )
+
+        first.delete()
+        stored.refresh_from_db()
+        self.assertEqual(stored.references, 0)
+        self.assertIsNotNone(stored.released)
+
+    # Tests saving a Collection without touching its image keeps the count
+    def test_unchanged_image_keeps_count(self):
+        collection = self.sample_collection(sample_png())
+        collection = Collection.objects.defer('image').get(pk=collection.pk)
+        collection.title = 'bayc'
+        collection.save()
+        collection = Collection.objects.get(pk=collection.pk)
+        collection.save()
+        self.assertEqual(
+            StoredImage.objects.get(name=collection.image.name).references, 1,
+        )
@@ -131,3 +131,114 @@ MEDIA_ROOT = '/volume/web/media'
 STATIC_ROOT = 'volume/web/static'
 
 AUTH_USER_MODEL = 'base.User'
+
+REST_FRAMEWORK = {
+    'DEFAULT_PAGINATION_CLASS': 'collection.pagination.KeysetPagination',
+    # Default number of rows per page on the paginated list endpoints
+    'PAGE_SIZE': int(os.environ.get('API_PAGE_SIZE', 100)),
+    # JSON written by collection.fragments.FragmentJSONRenderer copies
+    # cached fragments into the body instead of encoding them again
+    'DEFAULT_RENDERER_CLASSES': (
+        'collection.fragments.FragmentJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+}
+
+# Rendered Collections cached by collection.fragments, by id and version
+FRAGMENT_CACHE = {
+    # 'local', 'shared' or 'none'
+    'BACKEND': os.environ.get('FRAGMENT_CACHE_BACKEND', 'local'),
+    # Size of each worker's own cache
+    'MAX_BYTES': int(os.environ.get('FRAGMENT_CACHE_MAX_BYTES', 64 * 2 ** 20)),
+    # CACHES alias of the shared cache, and its entry lifetime
+    'SHARED_CACHE': os.environ.get('FRAGMENT_CACHE_SHARED_CACHE', 'default'),
+    'SHARED_TTL': 24 * 60 * 60,
+}
+
+# Token -> User lookups cached by user.authentication.CachedTokenAuthentication
+TOKEN_AUTH_CACHE = {
+    'MAX_ENTRIES': 10000,
+    # Optional CACHES alias shared by every worker, and its entry lifetime.
+    # Revoked tokens are marked there, so every worker turns them away on
+    # the next request.
+    'SHARED_CACHE': os.environ.get('TOKEN_AUTH_SHARED_CACHE') or None,
+    'SHARED_TTL': 300,
+}
+# Seconds an entry lives in each worker's own memory. Without a shared
+# cache other workers only see a revoked token once their entry expires.
+TOKEN_AUTH_CACHE['LOCAL_TTL'] = int(os.environ.get(
+    'TOKEN_AUTH_LOCAL_TTL', 60 if TOKEN_AUTH_CACHE['SHARED_CACHE'] else 1,
+))
+
+# Resized copies made of every uploaded Collection image by base.derivatives
+IMAGE_DERIVATIVES = {
+    # Threads generating derivatives in each worker, 0 runs them inline
+    'WORKERS': int(os.environ.get('IMAGE_DERIVATIVE_WORKERS', 2)),
+    # Longest edge in pixels of each size
+    'SIZES': {'thumb': 128, 'small': 320, 'medium': 800},
+    # Formats each size is encoded in, as {extension: Pillow format}
+    'FORMATS': {'webp': 'WEBP', 'jpg': 'JPEG'},
+    'QUALITY': 80,
+}
+
+# How base.similarity matches Collection images by perceptual hash
+IMAGE_SIMILARITY = {
+    # Hamming distance out of 64 bits used by default, and the most a
+    # request may ask for
+    'DISTANCE': 6,
+    'MAX_DISTANCE': 12,
+    'LIMIT': 50,
+    # Seconds between incremental refreshes and full rebuilds of the index
+    'REFRESH': 5,
+    'REBUILD': 60 * 60,
+    'LAG': 60,
+}
+
+# Tag and Item names held in memory by collection.autocomplete
+AUTOCOMPLETE = {
+    # Users whose names each worker holds, per model; 0 answers every
+    # lookup from the database
+    'MAX_USERS': int(os.environ.get('AUTOCOMPLETE_MAX_USERS', 1000)),
+    # Users with more names are always answered from the database
+    'MAX_NAMES': 20000,
+    'LIMIT': 10,
+    'MAX_LIMIT': 50,
+}
+
+# Limits checked by collection.uploads while an image upload streams in
+IMAGE_UPLOADS = {
+    'MAX_BYTES': int(os.environ.get('IMAGE_UPLOAD_MAX_BYTES', 20 * 2 ** 20)),
+    'MAX_PIXELS': int(os.environ.get('IMAGE_UPLOAD_MAX_PIXELS', 40000000)),
+    'FORMATS': ('JPEG', 'PNG', 'WEBP', 'GIF'),
+}
+
+# Sizes and disk cache of the images resized on request by collection.resize
+IMAGE_RESIZE = {
+    # Boxes images may be resized to fit, as (width, height)
+    'SIZES': ((64, 64), (128, 128), (320, 320), (640, 640), (1280, 1280)),
+    'CACHE_DIR': 'cache/resize',
+    'MAX_BYTES': int(os.environ.get('IMAGE_RESIZE_CACHE_BYTES', 512 * 2 ** 20)),
+    'TRIM_TO': 0.8,
+    'TOUCH_INTERVAL': 60,
+    'QUALITY': 80,
+}
+
+# How base.media_gc deletes Collection images no longer referenced
+MEDIA_GC = {
+    'DIRECTORY': 'uploads/collection',
+    # Seconds a file must have gone untouched, and an image unreferenced,
+    # before it is deleted
+    'GRACE': int(os.environ.get('MEDIA_GC_GRACE', 24 * 60 * 60)),
+    # Images whose references are checked per query
+    'BATCH_SIZE': 500,
+}
+
+# How collection.media.serve_media hands files from MEDIA_ROOT out
+MEDIA_SERVING = {
+    # "django" streams them with FileResponse, "x-accel-redirect" hands them
+    # to nginx under ACCEL_PREFIX and "x-sendfile" to Apache or lighttpd
+    'BACKEND': os.environ.get('MEDIA_SERVING_BACKEND', 'django'),
+    'ACCEL_PREFIX': os.environ.get('MEDIA_ACCEL_PREFIX', '/protected-media/'),
+    # Cache lifetime of the uploads whose names are never reused
+    'IMMUTABLE_MAX_AGE': 365 * 24 * 60 * 60,
+}
@@ -15,8 +15,9 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
-from django.conf.urls.static import static
 from django.conf import settings
+from collection.media import serve_media
+from collection.resize import serve_resized
 import os
 
 app_name = os.environ.get('PROJECT_NAME') + '-django'
@@ -25,7 +26,15 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/user/', include('user.urls')),
     path('api/collection/', include('collection.urls')),
-] + static(
-        settings.MEDIA_URL,
-        document_root=settings.MEDIA_ROOT,
-        )
+    path(
+        f'{settings.MEDIA_URL.lstrip("/")}resize/<int:width>x<int:height>/'
+        f'<path:path>',
+        serve_resized,
+        name='media-resize',
+    ),
+    path(
+        f'{settings.MEDIA_URL.lstrip("/")}<path:path>',
+        serve_media,
+        name='media',
+    ),
+]
@@ -0,0 +1,248 @@
+import bisect
+import heapq
+import re
+import threading
+from collections import Counter, OrderedDict
+from django.conf import settings
+from django.contrib.postgres.lookups import TrigramSimilar
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connections
+from django.db.models import TextField
+from django.db.models.functions import Cast, Upper
+from base.models import ListVersion
+from base.search import has_extension
+
+DEFAULTS = {
+    # Users whose names each process holds in memory, per model. The least
+    # recently used are dropped first, and 0 keeps none.
+    'MAX_USERS': 1000,
+    # Users with more names than this are always answered by the database
+    'MAX_NAMES': 20000,
+    # Lookups of a User's names, since they last changed, answered by the
+    # database before the names are loaded into memory. One-off lookups
+    # never load them; a User typing does so on the next keystroke.
+    'WARM_AFTER': 1,
+    'LIMIT': 10,
+    'MAX_LIMIT': 50,
+    # Shortest text close matches are looked for
+    'FUZZY_MIN_LENGTH': 3,
+}
+
+# Trigram similarity close matches need, pg_trgm's default threshold, so
+# both paths find the same names
+SIMILARITY = 0.3
+
+# Names starting with a prefix beyond which the ranking of the prefix is kept
+RANKED_SLICE = 1000
+
+# Words trigrams are taken from, as pg_trgm splits them
+WORD = re.compile(r'[^\W_]+')
+
+
+# Returns the AUTOCOMPLETE setting merged over the defaults
+def get_options():
+    return {**DEFAULTS, **getattr(settings, 'AUTOCOMPLETE', {})}
+
+
+# Returns the trigrams of a text the way pg_trgm takes them: from each
+# lowercased word, padded with two spaces in front and one behind
+def trigrams(text):
+    grams = set()
+    for word in WORD.findall(text.lower()):
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+# The names of one User as an array sorted by lowercased name, so the names
+# starting with a prefix are a slice found by bisection, and an inverted
+# index of their trigrams, so close matches are counted from the few lists
+# of the trigrams of the text rather than from every name
+class NameIndex:
+    def __init__(self, rows):
+        rows = sorted(rows, key=lambda row: (row[1].lower(), row[0]))
+        self.keys = [name.lower() for _, name, _ in rows]
+        self.rows = rows
+        self.sizes = []
+        self.grams = {}
+        self._ranked = {}
+        for position, (_, name, _) in enumerate(rows):
+            grams = trigrams(name)
+            self.sizes.append(len(grams))
+            for gram in grams:
+                self.grams.setdefault(gram, []).append(position)
+
+    def __len__(self):
+        return len(self.rows)
+
+    # Returns the positions of up to `limit` names starting with `text`,
+    # most used first. The first keystrokes match large slices, so their
+    # ranking is kept for up to `max_limit` names.
+    def prefix(self, text, limit, max_limit):
+        key = text.lower()
+        if key in self._ranked:
+            return self._ranked[key][:limit]
+        start = bisect.bisect_left(self.keys, key)
+        end = bisect.bisect_left(self.keys, key + '\U0010ffff', start)
+        ranked = heapq.nsmallest(
+            max_limit if end - start > RANKED_SLICE else limit,
+            range(start, end),
+            key=lambda i: (-self.rows[i][2], self.rows[i][0]),
+        )
+        if end - start > RANKED_SLICE:
+            self._ranked[key] = ranked
+        return ranked[:limit]
+
+    # Returns the positions of up to `limit` names close to `text`, other
+    # than those in `exclude`, closest and then most used first
+    def fuzzy(self, text, limit, exclude=()):
+        grams = trigrams(text)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.grams.get(gram, ()))
+        scored = []
+        # Share of trigrams in common, as pg_trgm's similarity()
+        for position, count in shared.items():
+            score = count / (len(grams) + self.sizes[position] - count)
+            if score >= SIMILARITY and position not in exclude:
+                scored.append((score, position))
+        return [position for _, position in heapq.nsmallest(
+            limit, scored,
+            key=lambda pair: (-pair[0], -self.rows[pair[1]][2],
+                              self.rows[pair[1]][0]),
+        )]
+
+    # Returns up to `limit` matches of `text`: names starting with it, and
+    # then names close to it
+    def complete(self, text, limit, options):
+        found = self.prefix(text, limit, options['MAX_LIMIT'])
+        if len(found) < limit and len(text) >= options['FUZZY_MIN_LENGTH']:
+            found += self.fuzzy(text, limit - len(found), set(found))
+        return [self.row(position) for position in found]
+
+    def row(self, position):
+        pk, name, count = self.rows[position]
+        return {'id': pk, 'name': name, 'collection_count': count}
+
+
+# Whether each database has pg_trgm, by alias, as looked up once per process
+_trigrams = {}
+
+
+# Tells whether a database can match names by trigram similarity
+def has_trigrams(using):
+    if using not in _trigrams:
+        _trigrams[using] = has_extension(connections[using], 'pg_trgm')
+    return _trigrams[using]
+
+
+# Answers from the database: names starting with the text through the
+# pg_trgm index on their uppercased form, and then names close to it by
+# trigram similarity through the same index. Databases without pg_trgm
+# find the names starting with or holding the text instead.
+def database_matches(model, user, text, limit, fuzzy_min_length):
+    names = model.objects.filter(user=user)
+    fields = ('id', 'name', 'collection_count')
+    found = list(names.filter(name__istartswith=text).order_by(
+        '-collection_count', 'id',
+    ).values(*fields)[:limit])
+    if len(found) >= limit or len(text) < fuzzy_min_length:
+        return found
+    names = names.exclude(pk__in=[row['id'] for row in found])
+    if has_trigrams(names.db):
+        key = Upper(Cast('name', output_field=TextField()))
+        close = names.filter(TrigramSimilar(key, text.upper())).annotate(
+            similarity=TrigramSimilarity(key, text.upper()),
+        ).filter(similarity__gte=SIMILARITY).order_by(
+            '-similarity', '-collection_count', 'id',
+        )
+    else:
+        close = names.filter(name__icontains=text).order_by(
+            '-collection_count', 'id',
+        )
+    return found + list(close.values(*fields)[:limit - len(found)])
+
+
+# Autocompletes Tag and Item names from per-User indexes held in memory.
+# Each index is kept with the version of the User's list it was read at,
+# which every write to the names or their usage moves on, so a lookup costs
+# reading that version and an index is never served out of date, in any
+# process. Missing or outdated indexes are answered by the database, and
+# loaded once the User has looked up WARM_AFTER times without one.
+class Autocompleter:
+    def __init__(self, options):
+        self.options = options
+        self.hits = 0
+        self.misses = 0
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def complete(self, model, user, text, limit):
+        stamp = ListVersion.objects.current(user, model.list_kind)
+        key = (model._meta.label, user.pk)
+        with self._lock:
+            entry = self._indexes.get(key)
+            if entry is not None and entry[0] == stamp:
+                self._indexes.move_to_end(key)
+                index, lookups = entry[1], entry[2]
+            else:
+                index, lookups = None, 0
+            if isinstance(index, NameIndex):
+                self.hits += 1
+            else:
+                self.misses += 1
+                self._store(key, (stamp, index, lookups + 1))
+        if index is None and lookups >= self.options['WARM_AFTER']:
+            index = self._load(model, user)
+            with self._lock:
+                self._store(key, (stamp, index, lookups + 1))
+        if isinstance(index, NameIndex):
+            return index.complete(text, limit, self.options)
+        return database_matches(model, user, text, limit,
+                                self.options['FUZZY_MIN_LENGTH'])
+
+    # Reads a User's names into an index, or returns False when there are
+    # too many of them to hold
+    def _load(self, model, user):
+        rows = list(model.objects.filter(user=user).values_list(
+            'id', 'name', 'collection_count',
+        )[:self.options['MAX_NAMES'] + 1])
+        if len(rows) > self.options['MAX_NAMES']:
+            return False
+        return NameIndex(rows)
+
+    def _store(self, key, entry):
+        self._indexes[key] = entry
+        self._indexes.move_to_end(key)
+        while len(self._indexes) > self.options['MAX_USERS']:
+            self._indexes.popitem(last=False)
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'users': sum(isinstance(entry[1], NameIndex)
+                         for entry in self._indexes.values()),
+        }
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+            self.hits = self.misses = 0
+
+
+_autocompleter = None
+
+
+# Returns the process-wide Autocompleter
+def get_autocompleter():
+    global _autocompleter
+    if _autocompleter is None:
+        _autocompleter = Autocompleter(get_options())
+    return _autocompleter
+
+
+# Drops the process-wide Autocompleter so it is rebuilt from settings
+def reset_autocompleter():
+    global _autocompleter
+    _autocompleter = None
@@ -0,0 +1,114 @@
+import hashlib
+from django.core.exceptions import ValidationError
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+from base.models import ListVersion
+
+
+# Builds the ETag of a response from the version stamp of what it renders
+# and everything else the body depends on: the User, the full path with its
+# filters and cursor, and the negotiated format
+def make_etag(request, *stamp):
+    key = '|'.join(str(part) for part in (
+        request.user.pk,
+        request.get_full_path(),
+        request.accepted_renderer.format,
+        *stamp,
+    ))
+    return quote_etag(hashlib.sha1(key.encode()).hexdigest())
+
+
+# Tells whether a request carries any conditional request headers
+def has_validators(request):
+    return any(header in request.META for header in (
+        'HTTP_IF_NONE_MATCH',
+        'HTTP_IF_MODIFIED_SINCE',
+        'HTTP_IF_MATCH',
+        'HTTP_IF_UNMODIFIED_SINCE',
+    ))
+
+
+# Answers a GET with 304 when the client's copy is current, and otherwise
+# runs `handler` and stamps its response with the validators
+def conditional(request, etag, modified, handler, *args, **kwargs):
+    last_modified = int(modified.timestamp()) if modified else None
+    response = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=last_modified,
+    )
+    if response is None:
+        response = handler(request, *args, **kwargs)
+        if response.status_code != 200:
+            return response
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ('Authorization',))
+    return response
+
+
+# Answers conditional list requests from the per-User ListVersion of the
+# viewset's model, so an unchanged list costs one indexed lookup and the
+# list query and serializer never run
+class ConditionalListMixin:
+    def list(self, request, *args, **kwargs):
+        version, modified = ListVersion.objects.current(
+            request.user,
+            self.queryset.model.list_kind,
+        )
+        return conditional(
+            request,
+            make_etag(request, 'list', version, modified),
+            modified,
+            super().list,
+            *args,
+            **kwargs,
+        )
+
+
+# Answers conditional detail requests from the version of the object
+# itself. Only requests that carry validators pay for the separate version
+# lookup; the others read the version off the object being rendered.
+class ConditionalRetrieveMixin:
+    def retrieve(self, request, *args, **kwargs):
+        if not has_validators(request):
+            instance = self.get_object()
+            return conditional(
+                request,
+                make_etag(request, 'detail', instance.version,
+                          instance.modified),
+                instance.modified,
+                self._render_detail,
+                instance,
+            )
+        stamp = self._read_stamp(request, kwargs)
+        if stamp is None:
+            return super().retrieve(request, *args, **kwargs)
+        _, version, modified = stamp
+        return conditional(
+            request,
+            make_etag(request, 'detail', version, modified),
+            modified,
+            super().retrieve,
+            *args,
+            **kwargs,
+        )
+
+    # Returns (pk, version, modified) of the requested object, or None when
+    # the usual lookup is left to answer with a 404
+    def _read_stamp(self, request, kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            return self.queryset.filter(
+                user=request.user,
+                **{self.lookup_field: kwargs[lookup_url_kwarg]},
+            ).values_list('pk', 'version', 'modified').first()
+        except (TypeError, ValueError, ValidationError):
+            return None
+
+    def _render_detail(self, request, instance):
+        return Response(self.get_serializer(instance).data)
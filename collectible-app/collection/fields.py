@@ -0,0 +1,152 @@
+import os
+import re
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import connections
+from django.utils.encoding import filepath_to_uri
+from django.utils.translation import gettext_lazy as _
+from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
+from base.models import StoredImage
+from collection.uploads import (ImageUploadHandler, format_extension,
+                                get_limits, inspect_header, verify_image)
+
+
+# Matches the ids sent as strings, by forms
+DIGITS = re.compile('[0-9]+')
+
+
+# Resolves every submitted primary key with one id__in query instead of one
+# get() per id, and reports all of the invalid ids in a single error
+class BulkManyRelatedField(serializers.ManyRelatedField):
+    default_error_messages = {
+        'does_not_exist': _(
+            'Invalid pk(s) {pk_values} - object(s) do not exist.'
+        ),
+        'incorrect_type': _(
+            'Incorrect type. Expected pk values, received {data_type}.'
+        ),
+    }
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+
+        pk_values = []
+        for value in data:
+            # Only whole numbers are ids; int() would also read floats, bools
+            # and strings such as ' 7 ' or '1_0'
+            if isinstance(value, str) and DIGITS.fullmatch(value):
+                pk_values.append(int(value))
+            elif isinstance(value, int) and not isinstance(value, bool):
+                pk_values.append(value)
+            else:
+                self.fail('incorrect_type', data_type=type(value).__name__)
+        pk_values = list(dict.fromkeys(pk_values))
+        if not pk_values:
+            return []
+
+        queryset = self.child_relation.get_queryset()
+        # Ids beyond the range of the primary key column cannot exist, and
+        # are left out of the query the database would fail on
+        low, high = connections[queryset.db].ops.integer_field_range(
+            queryset.model._meta.pk.get_internal_type(),
+        )
+        found = queryset.in_bulk([
+            pk for pk in pk_values
+            if (low is None or pk >= low) and (high is None or pk <= high)
+        ])
+        missing = [pk for pk in pk_values if pk not in found]
+        if missing:
+            self.fail(
+                'does_not_exist',
+                pk_values=', '.join(str(pk) for pk in missing),
+            )
+        return [found[pk] for pk in pk_values]
+
+
+# A primary key relation limited to the rows owned by the requesting User.
+# With many=True the ids are validated together by BulkManyRelatedField.
+class UserPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
+
+    # Returns the queryset filtered to the requesting User's rows
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        request = self.context.get('request')
+        if request is None:
+            return queryset
+        return queryset.filter(user=request.user)
+
+
+# Renders the {size: {format: path}} map of an image's derivatives as URLs,
+# absolute when there is a request to build them from, like ImageField does.
+# With files on the local filesystem every URL starts with the same
+# MEDIA_URL, so its absolute form is built once per request and the paths
+# are only appended to it.
+class DerivativesField(serializers.ReadOnlyField):
+    def to_representation(self, value):
+        if not value:
+            return {}
+        prefix = self._url_prefix()
+        urls = {}
+        for size, paths in value.items():
+            urls[size] = {}
+            for extension, path in paths.items():
+                if prefix is None:
+                    url = self._url(path)
+                else:
+                    url = prefix + filepath_to_uri(path)
+                urls[size][extension] = url
+        return urls
+
+    def _url(self, path):
+        url = default_storage.url(path)
+        request = self.context.get('request')
+        if request is not None:
+            url = request.build_absolute_uri(url)
+        return url
+
+    # Returns the URL every file URL starts with, or None if the storage
+    # does not build them that way
+    def _url_prefix(self):
+        if not isinstance(default_storage, FileSystemStorage):
+            return None
+        request = self.context.get('request')
+        cached = getattr(self, '_prefix', None)
+        if cached is None or cached[0] is not request:
+            cached = self._prefix = (request, self._url(''))
+        return cached[1]
+
+
+# Validates an uploaded image from its header and a reduced decode instead
+# of Django's full open and verify, reusing what ImageUploadHandler already
+# read from the header while the file was streamed in. The file is renamed
+# with the extension of the format its header shows, whatever the client
+# called it. Content that is already stored passed validation when it was
+# first uploaded, so it is not decoded again.
+class ImageUploadField(serializers.ImageField):
+    def to_internal_value(self, data):
+        file = serializers.FileField.to_internal_value(self, data)
+        info = getattr(file, 'image_info', None)
+        if info is None:
+            file.seek(0)
+            header = file.read(ImageUploadHandler.max_header_bytes)
+            file.seek(0)
+            info = inspect_header(header, get_limits())
+            if info is None:
+                self.fail('invalid_image')
+        stem = os.path.splitext(os.path.basename(file.name))[0]
+        file.name = f'{stem or "image"}{format_extension(info[0])}'
+        sha256 = getattr(file, 'sha256', None)
+        if sha256 and StoredImage.objects.filter(sha256=sha256).exists():
+            return file
+        verify_image(file)
+        return file
@@ -0,0 +1,366 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from collection.conditional import (ConditionalRetrieveMixin, conditional,
+                                    make_etag)
+
+DEFAULTS = {
+    # 'local' keeps the fragments in each worker's memory, 'shared' in the
+    # CACHES alias below so every worker sees them, and None turns the
+    # cache off
+    'BACKEND': 'local',
+    # Size of the local cache, counting the keys and rendered JSON
+    'MAX_BYTES': 64 * 2 ** 20,
+    'SHARED_CACHE': 'default',
+    # Seconds a fragment lives in the shared cache. Fragments of versions
+    # that moved on are never read again, so this only bounds their space.
+    'SHARED_TTL': 24 * 60 * 60,
+}
+
+# Bytes of bookkeeping counted for each entry of the local cache on top of
+# its key and content
+ENTRY_OVERHEAD = 200
+
+
+# Returns the FRAGMENT_CACHE setting merged over the defaults
+def get_options():
+    return {**DEFAULTS, **getattr(settings, 'FRAGMENT_CACHE', {})}
+
+
+# The representation of one object together with the compact JSON it
+# renders to. It reads like any other representation, and
+# FragmentJSONRenderer writes out the JSON as it is instead of encoding the
+# representation again.
+class Fragment(dict):
+    __slots__ = ('raw',)
+
+    # Builds a fragment from a representation
+    @classmethod
+    def render(cls, data):
+        fragment = cls(data)
+        fragment.raw = _encoder.render(data)
+        return fragment
+
+    # Builds a fragment from the JSON cached for it
+    @classmethod
+    def load(cls, raw):
+        fragment = cls(json.loads(raw))
+        fragment.raw = raw
+        return fragment
+
+
+# Tells whether a response body holds fragments, looking only as deep as
+# the results of a paginated list
+def has_fragments(data):
+    if isinstance(data, Fragment):
+        return True
+    if isinstance(data, list):
+        return bool(data) and isinstance(data[0], Fragment)
+    if isinstance(data, dict):
+        return any(
+            isinstance(value, list) and has_fragments(value)
+            for value in data.values()
+        )
+    return False
+
+
+# Renders JSON like JSONRenderer, copying the JSON of fragments into the
+# body as it is. Indented output, asked for by the browsable API or by the
+# Accept header, encodes them again like any other data.
+class FragmentJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if not has_fragments(data) or self.get_indent(
+            accepted_media_type, renderer_context or {},
+        ) is not None:
+            return super().render(data, accepted_media_type,
+                                  renderer_context)
+        return self._splice(data)
+
+    def _splice(self, value):
+        if isinstance(value, Fragment):
+            return value.raw
+        if isinstance(value, list) and has_fragments(value):
+            return b'[' + b','.join(map(self._splice, value)) + b']'
+        if isinstance(value, dict) and has_fragments(value):
+            return b'{' + b','.join(
+                super(FragmentJSONRenderer, self).render(str(key)) + b':' +
+                self._splice(item)
+                for key, item in value.items()
+            ) + b'}'
+        if value is None:
+            return b'null'
+        return super().render(value)
+
+
+# Encodes the fragments themselves, which hold no fragments to look for
+_encoder = JSONRenderer()
+
+
+# Keeps fragments in this process's memory, dropping the least recently
+# used once they take more than `max_bytes`
+class LocalBackend:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        found = {}
+        with self._lock:
+            for key in keys:
+                raw = self._entries.get(key)
+                if raw is not None:
+                    self._entries.move_to_end(key)
+                    found[key] = raw
+        return found
+
+    def set_many(self, mapping):
+        with self._lock:
+            for key, raw in mapping.items():
+                old = self._entries.pop(key, None)
+                if old is not None:
+                    self.size -= self._cost(key, old)
+                self._entries[key] = raw
+                self.size += self._cost(key, raw)
+            while self.size > self.max_bytes and self._entries:
+                key, raw = self._entries.popitem(last=False)
+                self.size -= self._cost(key, raw)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _cost(key, raw):
+        return len(key) + len(raw) + ENTRY_OVERHEAD
+
+
+# Keeps fragments in a Django cache shared by every worker
+class SharedBackend:
+    def __init__(self, alias, ttl):
+        self.alias = alias
+        self.ttl = ttl
+
+    def get_many(self, keys):
+        return caches[self.alias].get_many(keys)
+
+    def set_many(self, mapping):
+        caches[self.alias].set_many(mapping, self.ttl)
+
+    # Entries of the shared cache expire on their own
+    def clear(self):
+        pass
+
+
+# Caches the rendered representation of objects by shape, id and version.
+# Every change to a Collection moves its version on, including changes to
+# its links and to the names of its Items and Tags, so a cached fragment
+# never needs to be invalidated: it is simply never asked for again. The
+# cache counts its hits and misses, which stats() reports along with the
+# size of a local backend.
+class FragmentCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    # Builds the cache from the FRAGMENT_CACHE setting, or returns None
+    # when it is turned off
+    @classmethod
+    def from_settings(cls):
+        options = get_options()
+        if options['BACKEND'] == 'local':
+            return cls(LocalBackend(options['MAX_BYTES']))
+        if options['BACKEND'] == 'shared':
+            return cls(SharedBackend(
+                options['SHARED_CACHE'], options['SHARED_TTL'],
+            ))
+        return None
+
+    # Returns what the keys of a request's fragments of one shape start
+    # with. URLs in a representation are absolute, so the host the request
+    # was made to is part of it.
+    def prefix(self, request, shape):
+        origin = hashlib.sha1(
+            request.build_absolute_uri('/').encode()
+        ).hexdigest()[:12]
+        return f'fragment:{shape}:{origin}:'
+
+    # Returns the key of an object's fragment. The modification time tells
+    # apart objects that got the id of a row rolled back.
+    @staticmethod
+    def key(prefix, pk, version, modified):
+        stamp = modified.timestamp() if modified else ''
+        return f'{prefix}{pk}:{version}:{stamp}'
+
+    # Returns {key: Fragment} of the given keys that are cached
+    def get_many(self, keys):
+        found = self.backend.get_many(keys) if keys else {}
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return {key: Fragment.load(raw) for key, raw in found.items()}
+
+    # Caches {key: Fragment}
+    def set_many(self, fragments):
+        if fragments:
+            self.backend.set_many({
+                key: fragment.raw for key, fragment in fragments.items()
+            })
+
+    # Share of lookups answered from the cache
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        stats = {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hit_rate,
+        }
+        if isinstance(self.backend, LocalBackend):
+            stats.update(
+                entries=len(self.backend),
+                bytes=self.backend.size,
+                evictions=self.backend.evictions,
+            )
+        return stats
+
+    # Empties the local backend and resets the counters
+    def clear(self):
+        self.backend.clear()
+        with self._lock:
+            self.hits = self.misses = 0
+
+
+_fragment_cache = None
+_configured = False
+
+
+# Returns the process-wide FragmentCache, or None when it is turned off
+def get_fragment_cache():
+    global _fragment_cache, _configured
+    if not _configured:
+        _fragment_cache = FragmentCache.from_settings()
+        _configured = True
+    return _fragment_cache
+
+
+# Drops the process-wide FragmentCache so it is rebuilt from settings
+def reset_fragment_cache():
+    global _fragment_cache, _configured
+    _fragment_cache = None
+    _configured = False
+
+
+# Lists from cached fragments. The page is read as (id, version) stamps,
+# the fragments of those versions are looked up in one go, and only the
+# misses are read and serialized, in a single batch through the
+# serializer's values_representation, and cached for the next request.
+class FragmentListMixin:
+    fragment_shape = 'list'
+
+    def list(self, request, *args, **kwargs):
+        cache = get_fragment_cache()
+        serializer_class = self.get_serializer_class()
+        if cache is None or \
+                not hasattr(serializer_class, 'values_representation'):
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        fields = {'id', 'version', 'modified'}
+        fields.update(field.lstrip('-') for field in self.ordering)
+        stamps = queryset.prefetch_related(None).values(*fields)
+        page = self.paginate_queryset(stamps)
+        rows = list(stamps) if page is None else page
+
+        prefix = cache.prefix(request, self.fragment_shape)
+        keys = [
+            cache.key(prefix, row['id'], row['version'], row['modified'])
+            for row in rows
+        ]
+        fragments = cache.get_many(keys)
+        missing = [row['id'] for row, key in zip(rows, keys)
+                   if key not in fragments]
+        rendered = {}
+        if missing:
+            fresh = list(serializer_class.values_queryset(
+                self.queryset.model.objects.filter(pk__in=missing),
+                'version', 'modified',
+            ))
+            serializer = serializer_class(
+                context=self.get_serializer_context(),
+            )
+            data = serializer.values_representation(fresh)
+            stored = {}
+            for row, representation in zip(fresh, data):
+                fragment = rendered[row['id']] = \
+                    Fragment.render(representation)
+                stored[cache.key(prefix, row['id'], row['version'],
+                                 row['modified'])] = fragment
+            cache.set_many(stored)
+
+        results = []
+        for row, key in zip(rows, keys):
+            fragment = fragments.get(key) or rendered.get(row['id'])
+            # Deleted since the page was read
+            if fragment is not None:
+                results.append(fragment)
+        if page is not None:
+            return self.get_paginated_response(results)
+        return Response(results)
+
+
+# Retrieves from a cached fragment. The version stamp read for the ETag
+# also picks the fragment, so a hit costs that one lookup; a miss renders
+# the object as usual and caches it.
+class FragmentRetrieveMixin(ConditionalRetrieveMixin):
+    fragment_detail_shape = 'detail'
+
+    def retrieve(self, request, *args, **kwargs):
+        cache = get_fragment_cache()
+        if cache is None:
+            return super().retrieve(request, *args, **kwargs)
+        stamp = self._read_stamp(request, kwargs)
+        if stamp is None:
+            return super().retrieve(request, *args, **kwargs)
+        pk, version, modified = stamp
+        return conditional(
+            request,
+            make_etag(request, 'detail', version, modified),
+            modified,
+            self._render_fragment,
+            cache,
+            cache.prefix(request, self.fragment_detail_shape),
+            pk,
+            version,
+            modified,
+        )
+
+    def _render_fragment(self, request, cache, prefix, *stamp):
+        key = cache.key(prefix, *stamp)
+        fragment = cache.get_many([key]).get(key)
+        if fragment is not None:
+            return Response(fragment)
+        instance = self.get_object()
+        data = self.get_serializer(instance).data
+        cache.set_many({
+            cache.key(prefix, instance.pk, instance.version,
+                      instance.modified):
+            Fragment.render(data),
+        })
+        return Response(data)
@@ -0,0 +1,47 @@
+import time
+import uuid
+from contextlib import contextmanager
+from django.contrib.auth import get_user_model as gum
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory
+
+
+# Runs the block in a transaction that is always rolled back, so benchmarks
+# can seed data against a real database without leaving anything behind
+@contextmanager
+def rolled_back():
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+# Creates a throwaway User for a benchmark run
+def bench_user():
+    return gum().objects.create_user(
+        f'bench-{uuid.uuid4().hex}@example.com',
+        'Tbin5041',
+    )
+
+
+# Returns a request factory whose host passes the ALLOWED_HOSTS check
+def bench_factory():
+    return APIRequestFactory(SERVER_NAME='localhost')
+
+
+# Calls `fn` `repeat` times and returns (timings in ms, queries per call)
+def measure(fn, repeat=20):
+    timings = []
+    with CaptureQueriesContext(connection) as ctx:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - start) * 1000)
+    return timings, len(ctx.captured_queries) / repeat
+
+
+# Returns the given percentile of a list of timings
+def percentile(timings, pct):
+    ordered = sorted(timings)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
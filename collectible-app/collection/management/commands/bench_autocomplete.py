@@ -0,0 +1,88 @@
+import time
+from django.core.management.base import BaseCommand
+from base.models import ListVersion, Tag
+from collection.autocomplete import Autocompleter, get_options, has_trigrams
+from collection.management.commands._bench import (
+    bench_user, measure, percentile, rolled_back,
+)
+
+# Words Tag names are made of
+WORDS = ('dead', 'avatar', 'bored', 'ape', 'pixel', 'punk', 'cool', 'cat',
+         'doodle', 'azuki', 'moon', 'bird', 'clone', 'world', 'pudgy',
+         'penguin')
+
+# Keystrokes of a User typing, ending on a typo only close matches find
+KEYSTROKES = ('p', 'pu', 'pun', 'punk', 'punk c', 'punk co',
+              'punk kool')
+
+
+# Django command that times autocompleting Tag names per keystroke from the
+# names held in memory against the database, and against reading the whole
+# Tag list as clients did before
+class Command(BaseCommand):
+    help = 'Benchmarks autocompleting Tag names.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tags', type=int, default=20000)
+        parser.add_argument('--limit', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        with rolled_back():
+            user = bench_user()
+            Tag.objects.bulk_create(
+                (
+                    Tag(
+                        user=user,
+                        name=(f'{WORDS[i % len(WORDS)]} '
+                              f'{WORDS[i // 16 % len(WORDS)]} {i}').title(),
+                        collection_count=i % 97,
+                    )
+                    for i in range(options['tags'])
+                ),
+                batch_size=5000,
+            )
+            ListVersion.objects.bump(user.pk, 'tags')
+            self.stdout.write(
+                f'{options["tags"]} Tags, pg_trgm '
+                f'{"installed" if has_trigrams(Tag.objects.db) else "missing"}'
+            )
+            memory = Autocompleter(get_options())
+            database = Autocompleter({**get_options(), 'MAX_USERS': 0})
+            started = time.perf_counter()
+            for _ in range(2):
+                memory.complete(Tag, user, 'p', options['limit'])
+            self.stdout.write(
+                f'Loaded the names in '
+                f'{(time.perf_counter() - started) * 1000:.1f} ms'
+            )
+            timings, _ = measure(
+                lambda: list(Tag.objects.filter(user=user).values(
+                    'id', 'name', 'collection_count',
+                )),
+                max(1, options['repeat'] // 10),
+            )
+            self.stdout.write(
+                f'Reading the whole list took '
+                f'{percentile(timings, 50):.2f} ms'
+            )
+            self.stdout.write(f'{"text":>10} {"path":>9} {"found":>6} '
+                              f'{"p50 ms":>7} {"p99 ms":>7} {"queries":>8}')
+            for text in KEYSTROKES:
+                for name, autocompleter in (('memory', memory),
+                                            ('database', database)):
+                    self.run(text, name, autocompleter, user, options)
+
+    def run(self, text, name, autocompleter, user, options):
+        found = autocompleter.complete(Tag, user, text, options['limit'])
+        timings, queries = measure(
+            lambda: autocompleter.complete(
+                Tag, user, text, options['limit'],
+            ),
+            options['repeat'],
+        )
+        self.stdout.write(
+            f'{text:>10} {name:>9} {len(found):>6} '
+            f'{percentile(timings, 50):>7.2f} '
+            f'{percentile(timings, 99):>7.2f} {queries:>8.1f}'
+        )
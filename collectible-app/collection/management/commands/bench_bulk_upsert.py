@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from rest_framework.test import force_authenticate
+from collection import views
+from collection.management.commands._bench import (
+    bench_factory, bench_user, measure, percentile, rolled_back,
+)
+
+
+# Django command that times list-body POSTs to the Tag and Item endpoints
+class Command(BaseCommand):
+    help = 'Benchmarks bulk Tag and Item upserts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        size = options['size']
+        self.stdout.write(f'{"endpoint":>8} {"rows":>8} {"queries":>8} '
+                          f'{"p50 ms":>8} {"max ms":>8}')
+        for name, viewset in (('tags', views.TagViewSet),
+                              ('items', views.ItemViewSet)):
+            with rolled_back():
+                timings, queries = self.run_viewset(
+                    viewset, size, options['repeat'],
+                )
+            self.stdout.write(
+                f'{name:>8} {size:>8} {queries:>8.1f} '
+                f'{percentile(timings, 50):>8.1f} {max(timings):>8.1f}'
+            )
+
+    # Posts `size` new names per call, so every call inserts real rows
+    def run_viewset(self, viewset, size, repeat):
+        user = bench_user()
+        view = viewset.as_view({'post': 'create'})
+        factory = bench_factory()
+        state = {'turn': 0}
+
+        def post():
+            state['turn'] += 1
+            payload = [
+                {'name': f'Bench{state["turn"]}-{i}'} for i in range(size)
+            ]
+            request = factory.post('/', payload, format='json')
+            force_authenticate(request, user=user)
+            response = view(request)
+            assert response.status_code == 201, response.data
+
+        return measure(post, repeat)
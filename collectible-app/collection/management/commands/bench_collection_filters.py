@@ -0,0 +1,118 @@
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.db import connection
+from rest_framework.request import Request
+from base.models import Collection, Tag
+from collection import views
+from collection.management.commands._bench import (
+    bench_factory, bench_user, measure, percentile, rolled_back,
+)
+
+
+# Django command that compares filtering the Collection list by Tags through
+# a join, with and without DISTINCT, against the "any" and "all" subqueries
+# of CollectionViewSet, timing a first page and a count of the matches
+class Command(BaseCommand):
+    help = 'Benchmarks the Collection Tag filters.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000)
+        parser.add_argument('--tags-per-row', type=int, default=50)
+        parser.add_argument('--pool', type=int, default=1000)
+        parser.add_argument('--filter-tags', type=int, default=3)
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=10)
+
+    def handle(self, *args, **options):
+        with rolled_back():
+            user, tags = self.seed(
+                options['rows'], options['tags_per_row'], options['pool'],
+            )
+            # Tags picked apart by the stride of the seed, so some
+            # Collections hold all of them
+            stride = max(1, options['pool'] // options['tags_per_row'])
+            ids = [tags[i * stride % len(tags)]
+                   for i in range(options['filter_tags'])]
+            join = Collection.objects.filter(
+                user=user, tags__id__in=ids,
+            ).order_by('-id')
+            querysets = (
+                ('join', join),
+                ('join distinct', join.distinct()),
+                ('any', self.viewset_queryset(user, ids, 'any')),
+                ('all', self.viewset_queryset(user, ids, 'all')),
+            )
+            self.stdout.write(f'{"filter":>14} {"rows":>8} {"unique":>8} '
+                              f'{"page ms":>8} {"count ms":>9}')
+            for name, queryset in querysets:
+                self.run(name, queryset, options)
+
+    # Returns the Collection list queryset of CollectionViewSet filtered by
+    # the Tags in the given mode
+    def viewset_queryset(self, user, ids, mode):
+        request = Request(bench_factory().get('/', {
+            'tags': ','.join(map(str, ids)),
+            'tags_mode': mode,
+        }))
+        request.user = user
+        view = views.CollectionViewSet(
+            request=request, action='list', format_kwarg=None,
+        )
+        return view.get_queryset().prefetch_related(None)
+
+    def run(self, name, queryset, options):
+        ids = list(queryset.values_list('id', flat=True))
+        page_timings, _ = measure(
+            lambda: list(queryset[:options['page_size']]), options['repeat'],
+        )
+        count_timings, _ = measure(queryset.count, options['repeat'])
+        self.stdout.write(
+            f'{name:>14} {len(ids):>8} {len(set(ids)):>8} '
+            f'{percentile(page_timings, 50):>8.2f} '
+            f'{percentile(count_timings, 50):>9.2f}'
+        )
+
+    # Creates `rows` Collections holding `tags_per_row` Tags each out of a
+    # pool of `pool`, and returns the User and the ids of the pool
+    def seed(self, rows, tags_per_row, pool):
+        user = bench_user()
+        tags = [tag.pk for tag in Tag.objects.bulk_create(
+            Tag(user=user, name=f'Tag{i}') for i in range(pool)
+        )]
+        collections = [collection.pk for collection in
+                       Collection.objects.bulk_create(
+                           Collection(
+                               user=user,
+                               title=f'Collection{i}',
+                               items_in_collection=i,
+                               floor_price=Decimal(i % 1000) / 4,
+                           )
+                           for i in range(rows)
+                       )]
+        stride = max(1, pool // tags_per_row)
+        if connection.vendor == 'postgresql':
+            # Millions of links are generated by the database itself
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'INSERT INTO base_collection_tags (collection_id, tag_id) '
+                    'SELECT c.id, '
+                    '(%s::bigint[])[1 + (c.n * 7 + j * %s) %% %s] '
+                    'FROM unnest(%s::bigint[]) WITH ORDINALITY AS c(id, n), '
+                    'generate_series(0, %s) AS j',
+                    [tags, stride, pool, collections, tags_per_row - 1],
+                )
+                cursor.execute('ANALYZE base_collection_tags')
+                cursor.execute('ANALYZE base_collection')
+        else:
+            Collection.tags.through.objects.bulk_create(
+                (
+                    Collection.tags.through(
+                        collection_id=pk,
+                        tag_id=tags[(n * 7 + j * stride) % pool],
+                    )
+                    for n, pk in enumerate(collections, 1)
+                    for j in range(tags_per_row)
+                ),
+                batch_size=10000,
+            )
+        return user, tags
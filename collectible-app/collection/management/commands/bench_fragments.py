@@ -0,0 +1,107 @@
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from rest_framework.test import force_authenticate
+from base.models import Collection, Item, Tag
+from collection import views
+from collection.fragments import get_fragment_cache, reset_fragment_cache
+from collection.management.commands._bench import (
+    bench_factory, bench_user, measure, percentile, rolled_back,
+)
+
+
+# Django command that times Collection list pages and details with the
+# fragment cache off, cold and warm, checking every body is the same, and
+# reports the hit rate and memory of the local cache afterwards
+class Command(BaseCommand):
+    help = 'Benchmarks the Collection fragment cache.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=2000)
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with rolled_back():
+            user, collection = self.seed(options['rows'])
+            list_view = views.CollectionViewSet.as_view({'get': 'list'})
+            detail_view = views.CollectionViewSet.as_view(
+                {'get': 'retrieve'},
+            )
+            factory = bench_factory()
+            page_size = options['page_size']
+            bodies = set()
+
+            def get_list():
+                request = factory.get('/', {'page_size': page_size})
+                force_authenticate(request, user)
+                response = list_view(request)
+                bodies.add(('list', response.render().content))
+
+            def get_detail():
+                request = factory.get('/')
+                force_authenticate(request, user)
+                response = detail_view(request, pk=collection.pk)
+                bodies.add(('detail', response.render().content))
+
+            self.stdout.write(f'{"endpoint":>8} {"cache":>6} '
+                              f'{"queries":>8} {"p50 ms":>8} {"p99 ms":>8}')
+            for name, fn in (('list', get_list), ('detail', get_detail)):
+                for label in ('off', 'cold', 'warm'):
+                    self.run(name, label, fn, options['repeat'])
+            assert len(bodies) == 2, 'Bodies differ'
+            self.stdout.write(str(get_fragment_cache().stats()))
+        reset_fragment_cache()
+
+    def run(self, name, label, fn, repeat):
+        backend = None if label == 'off' else 'local'
+        with override_settings(FRAGMENT_CACHE={'BACKEND': backend}):
+            reset_fragment_cache()
+            if label == 'cold':
+                def call():
+                    get_fragment_cache().clear()
+                    fn()
+            else:
+                fn()
+                call = fn
+            timings, queries = measure(call, repeat)
+        self.stdout.write(
+            f'{name:>8} {label:>6} {queries:>8.1f} '
+            f'{percentile(timings, 50):>8.2f} {percentile(timings, 99):>8.2f}'
+        )
+
+    # Creates `rows` Collections with a few Items and Tags each
+    def seed(self, rows):
+        user = bench_user()
+        items = Item.objects.bulk_create(
+            Item(user=user, name=f'Item{i}') for i in range(50)
+        )
+        tags = Tag.objects.bulk_create(
+            Tag(user=user, name=f'Tag{i}') for i in range(50)
+        )
+        derivatives = {'thumb': {'webp': 'uploads/collection/a_thumb.webp',
+                                 'jpg': 'uploads/collection/a_thumb.jpg'}}
+        collections = Collection.objects.bulk_create(
+            Collection(
+                user=user,
+                title=f'Collection{i}',
+                items_in_collection=i,
+                floor_price=Decimal(i % 1000) / 4,
+                link='https://example.com/',
+                image_derivatives=derivatives,
+            )
+            for i in range(rows)
+        )
+        Collection.items.through.objects.bulk_create(
+            Collection.items.through(
+                collection_id=collection.pk, item_id=items[(i + j) % 50].pk,
+            )
+            for i, collection in enumerate(collections) for j in range(3)
+        )
+        Collection.tags.through.objects.bulk_create(
+            Collection.tags.through(
+                collection_id=collection.pk, tag_id=tags[(i + j) % 50].pk,
+            )
+            for i, collection in enumerate(collections) for j in range(2)
+        )
+        return user, collections[-1]
@@ -0,0 +1,96 @@
+import io
+import tempfile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from PIL import Image
+from rest_framework.test import force_authenticate
+from base import derivatives
+from base.models import Collection
+from collection import views
+from collection.management.commands._bench import (
+    bench_factory, bench_user, measure, percentile,
+)
+
+
+# Django command that compares upload_image latency with the derivatives
+# generated inline against queued on the worker pool, and the image bytes a
+# client downloads for one list page with originals against thumbnails.
+# Runs in autocommit against a temporary MEDIA_ROOT, so that the uploads
+# really commit and queue their work, and removes its rows afterwards.
+class Command(BaseCommand):
+    help = 'Benchmarks image uploads with inline and queued derivatives.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=10)
+        parser.add_argument('--width', type=int, default=2400)
+        parser.add_argument('--height', type=int, default=1600)
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--page-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        content = self.sample_png(options['width'], options['height'])
+        self.stdout.write(
+            f'{options["width"]}x{options["height"]} PNG, '
+            f'{len(content)} bytes'
+        )
+        with tempfile.TemporaryDirectory() as media, \
+                override_settings(MEDIA_ROOT=media):
+            user = bench_user()
+            try:
+                self.run(user, content, options)
+            finally:
+                derivatives.reset_executor()
+                user.delete()
+
+    def run(self, user, content, options):
+        collection = Collection.objects.create(
+            user=user,
+            title='Bench',
+            items_in_collection=1,
+            floor_price=1,
+        )
+        view = views.CollectionViewSet.as_view({'post': 'upload_image'})
+        factory = bench_factory()
+
+        def upload():
+            request = factory.post(
+                '/',
+                {'image': SimpleUploadedFile('bench.png', content)},
+                format='multipart',
+            )
+            force_authenticate(request, user)
+            response = view(request, pk=collection.pk)
+            assert response.status_code == 200, response.data
+
+        self.stdout.write(f'{"derivatives":>12} {"p50 ms":>8} '
+                          f'{"p99 ms":>8}')
+        for label, workers in (('inline', 0), ('queued', options['workers'])):
+            derivatives.reset_executor()
+            with override_settings(IMAGE_DERIVATIVES={'WORKERS': workers}):
+                timings, _ = measure(upload, options['repeat'])
+                derivatives.reset_executor()
+            self.stdout.write(
+                f'{label:>12} {percentile(timings, 50):>8.1f} '
+                f'{percentile(timings, 99):>8.1f}'
+            )
+
+        collection.refresh_from_db()
+        page = options['page_size']
+        served = {'original': default_storage.size(collection.image.name)}
+        for extension, path in collection.image_derivatives['thumb'].items():
+            served[f'thumb.{extension}'] = default_storage.size(path)
+        self.stdout.write(f'{"image":>12} {"bytes per page":>16}')
+        for label, size in served.items():
+            self.stdout.write(f'{label:>12} {size * page:>16}')
+
+    # Encodes a noisy PNG, which compresses about as badly as a photo
+    def sample_png(self, width, height):
+        image = Image.merge('RGB', [
+            Image.effect_noise((width, height), sigma)
+            for sigma in (40, 60, 80)
+        ])
+        buffer = io.BytesIO()
+        image.save(buffer, 'PNG')
+        return buffer.getvalue()
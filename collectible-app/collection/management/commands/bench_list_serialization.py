@@ -0,0 +1,107 @@
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.db.models import Prefetch
+from rest_framework.renderers import JSONRenderer
+from base.models import Collection, Item, Tag
+from collection.management.commands._bench import (
+    bench_factory, bench_user, measure, percentile, rolled_back,
+)
+from collection.serializers import CollectionSerializer, TagSerializer
+
+
+# Django command that compares rendering a list of Collections and of Tags
+# through ModelSerializer with rendering it from .values() rows, checking
+# both give the same JSON
+class Command(BaseCommand):
+    help = 'Benchmarks the .values() list serialization path.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with rolled_back():
+            user = self.seed(options['rows'])
+            context = {'request': bench_factory().get('/')}
+            self.stdout.write(f'{"serializer":>22} {"path":>14} '
+                              f'{"queries":>8} {"p50 ms":>8} {"speedup":>8}')
+            collections = Collection.objects.filter(user=user).order_by('-id')
+            tags = Tag.objects.filter(user=user).order_by('-name', '-id')
+            self.compare(
+                CollectionSerializer, context, options['repeat'],
+                collections.prefetch_related(
+                    Prefetch('items',
+                             queryset=Item.objects.only('id').order_by('id')),
+                    Prefetch('tags',
+                             queryset=Tag.objects.only('id').order_by('id')),
+                ),
+                collections,
+            )
+            self.compare(TagSerializer, context, options['repeat'], tags,
+                         tags)
+
+    # Creates `rows` Collections with a few Items and Tags each, and `rows`
+    # Tags
+    def seed(self, rows):
+        user = bench_user()
+        items = Item.objects.bulk_create(
+            Item(user=user, name=f'Item{i}') for i in range(50)
+        )
+        tags = Tag.objects.bulk_create(
+            Tag(user=user, name=f'Tag{i}') for i in range(rows)
+        )
+        derivatives = {'thumb': {'webp': 'uploads/collection/a_thumb.webp',
+                                 'jpg': 'uploads/collection/a_thumb.jpg'}}
+        collections = Collection.objects.bulk_create(
+            Collection(
+                user=user,
+                title=f'Collection{i}',
+                items_in_collection=i,
+                floor_price=Decimal(i % 1000) / 4,
+                link='https://example.com/',
+                image_derivatives=derivatives if i % 2 else {},
+            )
+            for i in range(rows)
+        )
+        Collection.items.through.objects.bulk_create(
+            Collection.items.through(
+                collection_id=collection.pk, item_id=items[(i + j) % 50].pk,
+            )
+            for i, collection in enumerate(collections) for j in range(3)
+        )
+        Collection.tags.through.objects.bulk_create(
+            Collection.tags.through(
+                collection_id=collection.pk, tag_id=tags[(i + j) % rows].pk,
+            )
+            for i, collection in enumerate(collections) for j in range(2)
+        )
+        return user
+
+    # Times both paths over the same rows and checks their JSON matches
+    def compare(self, serializer_class, context, repeat, instances, rows):
+        renderer = JSONRenderer()
+        results = {}
+
+        def model_path():
+            data = serializer_class(instances.all(), many=True,
+                                    context=context).data
+            results['model'] = renderer.render(data)
+
+        def values_path():
+            serializer = serializer_class(context=context)
+            page = list(serializer_class.values_queryset(rows.all()))
+            data = serializer.values_representation(page)
+            results['values'] = renderer.render(data)
+
+        timings = {}
+        for name, fn in (('ModelSerializer', model_path),
+                         ('values', values_path)):
+            timings[name] = measure(fn, repeat)
+        assert results['model'] == results['values'], 'JSON differs'
+        base = percentile(timings['ModelSerializer'][0], 50)
+        for name, (times, queries) in timings.items():
+            p50 = percentile(times, 50)
+            self.stdout.write(
+                f'{serializer_class.__name__:>22} {name:>14} '
+                f'{queries:>8.0f} {p50:>8.1f} {base / p50:>7.1f}x'
+            )
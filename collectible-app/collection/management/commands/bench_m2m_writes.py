@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand
+from base.models import Collection, Item, Tag
+from collection.management.commands._bench import (
+    bench_user, measure, percentile, rolled_back,
+)
+from collection.serializers import CollectionSerializer
+
+
+# Django command that shows the cost of changing one Tag on Collections with
+# more and more Items, which should stay flat as the Collection grows
+class Command(BaseCommand):
+    help = 'Benchmarks Collection updates that change a single Tag.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', default='10,100,1000,5000',
+            help='Comma separated numbers of Items per Collection.',
+        )
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        self.stdout.write(f'{"items":>8} {"queries":>8} {"p50 ms":>8} '
+                          f'{"p99 ms":>8}')
+        for size in sizes:
+            with rolled_back():
+                timings, queries = self.run_size(size, options['repeat'])
+            self.stdout.write(
+                f'{size:>8} {queries:>8.1f} {percentile(timings, 50):>8.2f} '
+                f'{percentile(timings, 99):>8.2f}'
+            )
+
+    # Seeds a Collection of `size` Items and times flipping one of its Tags
+    def run_size(self, size, repeat):
+        user = bench_user()
+        items = Item.objects.bulk_create(
+            Item(user=user, name=f'Item{i}') for i in range(size)
+        )
+        tags = Tag.objects.bulk_create(
+            Tag(user=user, name=f'Tag{i}') for i in range(3)
+        )
+        collection = Collection.objects.create(
+            user=user,
+            title='Benchmark',
+            items_in_collection=size,
+            floor_price=1,
+        )
+        collection.items.add(*items)
+        collection.tags.add(*tags[:2])
+        choices = [[tags[0], tags[1]], [tags[0], tags[2]]]
+        state = {'turn': 0}
+
+        # Resubmits every Item and swaps the second Tag on each call
+        def update():
+            state['turn'] += 1
+            CollectionSerializer(collection).update(collection, {
+                'title': 'Benchmark',
+                'items': items,
+                'tags': choices[state['turn'] % 2],
+            })
+
+        return measure(update, repeat)
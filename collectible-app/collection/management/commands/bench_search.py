@@ -0,0 +1,148 @@
+import time
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.db import connection
+from base import search
+from base.models import Collection, Tag
+from collection.management.commands._bench import (
+    bench_user, measure, percentile, rolled_back,
+)
+
+# Words titles are made of, so searches match a known share of Collections
+WORDS = ('dead', 'avatar', 'bored', 'ape', 'pixel', 'punk', 'cool', 'cat',
+         'doodle', 'azuki', 'moon', 'bird', 'clone', 'world', 'pudgy',
+         'penguin')
+
+
+# Django command that compares searching Collections through the stored
+# vectors and their GIN index with matching substrings, and times how long
+# renaming a Tag takes to reach the vectors of the Collections holding it
+class Command(BaseCommand):
+    help = 'Benchmarks the Collection search.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000)
+        parser.add_argument('--tags', type=int, default=1000)
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--skip-substring', action='store_true',
+                            help='Only time the vector search.')
+
+    def handle(self, *args, **options):
+        with rolled_back():
+            started = time.perf_counter()
+            user, tags = self.seed(options['rows'], options['tags'])
+            self.stdout.write(
+                f'Seeded {options["rows"]} Collections in '
+                f'{time.perf_counter() - started:.1f} s'
+            )
+            if search.has_vectors(connection.alias):
+                started = time.perf_counter()
+                Collection.objects.reindex_search()
+                self.stdout.write(
+                    f'Built the vectors in '
+                    f'{time.perf_counter() - started:.1f} s'
+                )
+                paths = [('vector', search.vector_search)]
+            else:
+                paths = []
+            if not options['skip_substring']:
+                paths.append(('substring', search.substring_search))
+
+            collections = Collection.objects.filter(user=user)
+            self.stdout.write(f'{"search":>22} {"path":>10} {"matches":>8} '
+                              f'{"page ms":>8} {"count ms":>9}')
+            for text in ('punk', 'cool cat', '"cool cat"', 'tag7',
+                         'nothing'):
+                for name, fn in paths:
+                    queryset = fn(collections, text).order_by('-rank', '-id')
+                    self.run(text, name, queryset, options)
+            if search.has_vectors(connection.alias):
+                self.rename(tags[7])
+
+    def run(self, text, name, queryset, options):
+        page_timings, _ = measure(
+            lambda: list(queryset[:options['page_size']]), options['repeat'],
+        )
+        count_timings, _ = measure(queryset.count, options['repeat'])
+        self.stdout.write(
+            f'{text:>22} {name:>10} {queryset.count():>8} '
+            f'{percentile(page_timings, 50):>8.2f} '
+            f'{percentile(count_timings, 50):>9.2f}'
+        )
+
+    # Times renaming a Tag, which rebuilds the vectors of its Collections
+    def rename(self, pk):
+        tag = Tag.objects.get(pk=pk)
+        holders = tag.collection_count
+        started = time.perf_counter()
+        tag.name = 'renamed'
+        tag.save()
+        elapsed = (time.perf_counter() - started) * 1000
+        found = search.vector_search(Collection.objects.all(), 'renamed')
+        self.stdout.write(
+            f'Renaming a Tag held by {holders} Collections took '
+            f'{elapsed:.1f} ms, {found.count()} found by the new name'
+        )
+
+    # Creates `rows` Collections titled from WORDS, holding 3 Tags each out
+    # of `tags`, and returns the User and the Tag ids
+    def seed(self, rows, tags):
+        user = bench_user()
+        tag_ids = [tag.pk for tag in Tag.objects.bulk_create(
+            Tag(user=user, name=f'tag{i}') for i in range(tags)
+        )]
+        if connection.vendor == 'postgresql':
+            # Millions of rows are generated by the database itself
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'INSERT INTO base_collection (user_id, title, '
+                    'items_in_collection, floor_price, link, '
+                    'image_derivatives, version, modified) '
+                    'SELECT %s, initcap((%s::text[])[1 + i %% %s] || '
+                    "' ' || (%s::text[])[1 + (i / 7) %% %s] || ' ' || i), "
+                    "i %% 10000, (i %% 4000) / 4.0, 'https://example.com/' "
+                    "|| i, '{}', 1, now() "
+                    'FROM generate_series(1, %s) AS i',
+                    [user.pk, list(WORDS), len(WORDS), list(WORDS),
+                     len(WORDS), rows],
+                )
+                cursor.execute(
+                    'INSERT INTO base_collection_tags (collection_id, tag_id) '
+                    'SELECT c.id, (%s::bigint[])[1 + (c.id + j * 37) %% %s] '
+                    'FROM base_collection c, generate_series(0, 2) AS j '
+                    'WHERE c.user_id = %s',
+                    [tag_ids, tags, user.pk],
+                )
+                # Statistics for the plans of the vector rebuild
+                for table in ('base_tag', 'base_collection_tags',
+                              'base_collection'):
+                    cursor.execute(f'ANALYZE {table}')
+            Tag.objects.recount_usage()
+            return user, tag_ids
+        collections = Collection.objects.bulk_create(
+            (
+                Collection(
+                    user=user,
+                    title=(f'{WORDS[i % len(WORDS)]} '
+                           f'{WORDS[i // 7 % len(WORDS)]} {i}').title(),
+                    items_in_collection=i % 10000,
+                    floor_price=Decimal(i % 4000) / 4,
+                    link=f'https://example.com/{i}',
+                )
+                for i in range(1, rows + 1)
+            ),
+            batch_size=5000,
+        )
+        Collection.tags.through.objects.bulk_create(
+            (
+                Collection.tags.through(
+                    collection_id=collection.pk,
+                    tag_id=tag_ids[(collection.pk + j * 37) % tags],
+                )
+                for collection in collections for j in range(3)
+            ),
+            batch_size=10000,
+        )
+        Tag.objects.recount_usage()
+        return user, tag_ids
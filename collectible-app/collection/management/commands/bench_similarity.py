@@ -0,0 +1,76 @@
+import random
+import time
+from django.core.management.base import BaseCommand
+from base.similarity import MultiIndexHash, popcount
+from collection.management.commands._bench import percentile
+
+
+# Returns the resident set size of the process in MiB
+def rss_mib():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+# Django command that times searches of the multi-index hash over synthetic
+# perceptual hashes against a linear scan, and checks they find the same
+# matches
+class Command(BaseCommand):
+    help = 'Benchmarks the image similarity index.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hashes', type=int, default=1_000_000)
+        parser.add_argument('--queries', type=int, default=1000)
+        parser.add_argument('--scans', type=int, default=10,
+                            help='Queries also answered by a linear scan.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        hashes = [rng.getrandbits(64) for _ in range(options['hashes'])]
+        before = rss_mib()
+        start = time.perf_counter()
+        index = MultiIndexHash()
+        for key, value in enumerate(hashes):
+            index.add(key, value)
+        self.stdout.write(
+            f'Indexed {len(index)} hashes in '
+            f'{time.perf_counter() - start:.1f}s, '
+            f'{rss_mib() - before:.0f} MiB'
+        )
+
+        self.stdout.write(f'{"distance":>8} {"index p50 ms":>13} '
+                          f'{"index p99 ms":>13} {"scan p50 ms":>12} '
+                          f'{"matches":>8}')
+        for distance in (2, 6, 10):
+            # Queries near a random indexed hash, so each has matches
+            queries = []
+            for _ in range(options['queries']):
+                value = rng.choice(hashes)
+                for bit in rng.sample(range(64), rng.randint(0, distance)):
+                    value ^= 1 << bit
+                queries.append(value)
+            timings, matches = [], 0
+            for value in queries:
+                start = time.perf_counter()
+                found = index.search(value, distance)
+                timings.append((time.perf_counter() - start) * 1000)
+                matches += len(found)
+            scans = []
+            for value in queries[:options['scans']]:
+                start = time.perf_counter()
+                expected = sorted(
+                    (popcount(value ^ other), key)
+                    for key, other in enumerate(hashes)
+                    if popcount(value ^ other) <= distance
+                )
+                scans.append((time.perf_counter() - start) * 1000)
+                assert index.search(value, distance) == expected
+            self.stdout.write(
+                f'{distance:>8} {percentile(timings, 50):>13.3f} '
+                f'{percentile(timings, 99):>13.3f} '
+                f'{percentile(scans, 50):>12.1f} '
+                f'{matches / len(queries):>8.2f}'
+            )
@@ -0,0 +1,140 @@
+import time
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count, Sum
+from rest_framework.test import force_authenticate
+from base.models import Collection, Portfolio, Tag, TagPortfolio, worth
+from collection import views
+from collection.management.commands._bench import (
+    bench_factory, bench_user, measure, percentile, rolled_back,
+)
+
+
+# Django command that compares computing a User's portfolio statistics from
+# the Collections and their Tags on every request with reading them from
+# the summaries, and times rebuilding the summaries and keeping them in
+# step with a save
+class Command(BaseCommand):
+    help = 'Benchmarks the portfolio statistics.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000)
+        parser.add_argument('--tags', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=10)
+
+    def handle(self, *args, **options):
+        with rolled_back():
+            started = time.perf_counter()
+            user = self.seed(options['rows'], options['tags'])
+            self.stdout.write(
+                f'Seeded {options["rows"]} Collections in '
+                f'{time.perf_counter() - started:.1f} s'
+            )
+            started = time.perf_counter()
+            Portfolio.objects.rebuild()
+            TagPortfolio.objects.rebuild()
+            self.stdout.write(
+                f'Rebuilt the summaries in '
+                f'{time.perf_counter() - started:.1f} s'
+            )
+
+            def on_demand():
+                collections = Collection.objects.filter(user=user)
+                collections.aggregate(
+                    collection_count=Count('*'),
+                    items=Sum('items_in_collection'),
+                    value=Sum(worth()),
+                )
+                list(Collection.tags.through.objects.filter(
+                    collection__user=user,
+                ).values('tag_id').annotate(
+                    collection_count=Count('*'),
+                    items=Sum('collection__items_in_collection'),
+                    value=Sum(worth('collection__')),
+                ).order_by('-value')[:views.PortfolioViewSet.max_tags])
+
+            self.stdout.write(f'{"path":>10} {"p50 ms":>8} {"p99 ms":>8} '
+                              f'{"queries":>8}')
+            for name, fn in (('on demand', on_demand),
+                             ('summary', self.summary_read(user))):
+                timings, queries = measure(fn, options['repeat'])
+                self.stdout.write(
+                    f'{name:>10} {percentile(timings, 50):>8.2f} '
+                    f'{percentile(timings, 99):>8.2f} {queries:>8.1f}'
+                )
+            collection = Collection.objects.filter(user=user).first()
+
+            def save():
+                collection.floor_price += 1
+                collection.save()
+
+            timings, queries = measure(save, options['repeat'])
+            self.stdout.write(
+                f'Changing the floor price of a Collection took '
+                f'{percentile(timings, 50):.2f} ms, {queries:.0f} queries'
+            )
+
+    # Returns a function reading the statistics through PortfolioViewSet
+    def summary_read(self, user):
+        view = views.PortfolioViewSet.as_view({'get': 'list'})
+        factory = bench_factory()
+
+        def read():
+            request = factory.get('/')
+            force_authenticate(request, user=user)
+            view(request)
+        return read
+
+    # Creates `rows` Collections holding 3 Tags each out of `tags`, and
+    # returns their User
+    def seed(self, rows, tags):
+        user = bench_user()
+        tag_ids = [tag.pk for tag in Tag.objects.bulk_create(
+            Tag(user=user, name=f'tag{i}') for i in range(tags)
+        )]
+        if connection.vendor == 'postgresql':
+            # Millions of rows are generated by the database itself
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'INSERT INTO base_collection (user_id, title, '
+                    'items_in_collection, floor_price, link, '
+                    'image_derivatives, version, modified) '
+                    "SELECT %s, 'Collection ' || i, i %% 10000, "
+                    "(i %% 4000) / 4.0, '', '{}', 1, now() "
+                    'FROM generate_series(1, %s) AS i',
+                    [user.pk, rows],
+                )
+                cursor.execute(
+                    'INSERT INTO base_collection_tags (collection_id, tag_id) '
+                    'SELECT c.id, (%s::bigint[])[1 + (c.id + j * 37) %% %s] '
+                    'FROM base_collection c, generate_series(0, 2) AS j '
+                    'WHERE c.user_id = %s',
+                    [tag_ids, tags, user.pk],
+                )
+                for table in ('base_collection', 'base_collection_tags'):
+                    cursor.execute(f'ANALYZE {table}')
+            return user
+        collections = Collection.objects.bulk_create(
+            (
+                Collection(
+                    user=user,
+                    title=f'Collection {i}',
+                    items_in_collection=i % 10000,
+                    floor_price=Decimal(i % 4000) / 4,
+                )
+                for i in range(1, rows + 1)
+            ),
+            batch_size=5000,
+        )
+        Collection.tags.through.objects.bulk_create(
+            (
+                Collection.tags.through(
+                    collection_id=collection.pk,
+                    tag_id=tag_ids[(collection.pk + j * 37) % tags],
+                )
+                for collection in collections for j in range(3)
+            ),
+            batch_size=10000,
+        )
+        return user
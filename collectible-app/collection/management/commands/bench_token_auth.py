@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from collection import views
+from collection.management.commands._bench import (
+    bench_factory, bench_user, measure, percentile, rolled_back,
+)
+from user.authentication import (CachedTokenAuthentication,
+                                 reset_token_cache)
+
+
+# Django command that compares queries per request and latency of the Tag
+# list with plain and cached token authentication
+class Command(BaseCommand):
+    help = 'Benchmarks TokenAuthentication against the cached version.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=500)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'{"authentication":>26} {"queries":>8} '
+                          f'{"p50 ms":>8} {"p99 ms":>8}')
+        for auth in (TokenAuthentication, CachedTokenAuthentication):
+            reset_token_cache()
+            with rolled_back():
+                timings, queries = self.run_auth(auth, options['repeat'])
+            self.stdout.write(
+                f'{auth.__name__:>26} {queries:>8.2f} '
+                f'{percentile(timings, 50):>8.3f} '
+                f'{percentile(timings, 99):>8.3f}'
+            )
+        reset_token_cache()
+
+    # Times authenticated Tag list requests made with `auth`
+    def run_auth(self, auth, repeat):
+        user = bench_user()
+        token = Token.objects.create(user=user)
+        view = views.TagViewSet.as_view(
+            {'get': 'list'}, authentication_classes=(auth,),
+        )
+        factory = bench_factory()
+
+        def get():
+            request = factory.get(
+                '/', HTTP_AUTHORIZATION=f'Token {token.key}',
+            )
+            response = view(request)
+            assert response.status_code == 200, response.data
+
+        return measure(get, repeat)
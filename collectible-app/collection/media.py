@@ -0,0 +1,182 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_safe
+
+DEFAULTS = {
+    'BACKEND': 'django',
+    'ACCEL_PREFIX': '/protected-media/',
+    'IMMUTABLE_MAX_AGE': 365 * 24 * 60 * 60,
+}
+
+# Files whose name is never reused for other content: images stored under
+# their SHA-256, earlier uploads named by collection_image_file_path, and
+# the derivatives of either
+IMMUTABLE_PATH = re.compile(
+    r'^uploads/collection/([0-9a-f]{2}/[0-9a-f]{64}|[0-9a-f]{8}-[0-9a-f]{4}-'
+    r'[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})(_\w+)?\.(?i:jpe?g|png|webp|gif)$'
+)
+
+# Content types files are shown inline with. Anything else, such as HTML or
+# SVG a browser would run scripts from, is sent as a download.
+INLINE_TYPES = ('image/jpeg', 'image/png', 'image/webp', 'image/gif')
+
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+# Returns the MEDIA_SERVING setting merged over the defaults
+def get_options():
+    return {**DEFAULTS, **getattr(settings, 'MEDIA_SERVING', {})}
+
+
+# Reads at most `length` bytes of a file from `start`, so a range can be
+# streamed by FileResponse without sending what follows it
+class _FileRange:
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+# Parses a single byte range against a file of `size` bytes, returning
+# (start, end) inclusive, None when the header does not apply, or False
+# when the range cannot be satisfied. Multiple ranges are answered with the
+# whole file, which RFC 9110 allows.
+def parse_range(header, size):
+    match = RANGE.match(header.replace(' ', ''))
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+# Serves a file from MEDIA_ROOT. The response carries a strong ETag and
+# Last-Modified, and upload names that are never reused are cached as
+# immutable. Only images are shown inline, anything else is sent as a
+# download. The bytes themselves are handed to the front end server with
+# X-Accel-Redirect or X-Sendfile where one is configured. Otherwise they go
+# out through FileResponse, which the WSGI server can send with sendfile,
+# with single byte ranges supported.
+@require_safe
+def serve_media(request, path):
+    return serve_file(request, path)
+
+
+# Answers a request for the file at `path` under MEDIA_ROOT, with the given
+# Cache-Control or the one its name calls for
+def serve_file(request, path, cache_control=None):
+    options = get_options()
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404('Not found')
+    try:
+        stat = os.stat(full_path)
+    except (FileNotFoundError, NotADirectoryError):
+        raise Http404('Not found')
+    if not os.path.isfile(full_path):
+        raise Http404('Not found')
+
+    etag = quote_etag(f'{stat.st_size:x}-{stat.st_mtime_ns:x}')
+    response = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=int(stat.st_mtime),
+    )
+    content_type = mimetypes.guess_type(full_path)[0]
+    inline = content_type in INLINE_TYPES
+    if response is None:
+        response = _file_response(
+            request, options, path, full_path, stat, etag,
+            content_type if inline else 'application/octet-stream',
+        )
+    if not inline:
+        response['Content-Disposition'] = 'attachment'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    if cache_control is None:
+        if IMMUTABLE_PATH.match(path):
+            cache_control = immutable(options)
+        else:
+            cache_control = 'public, no-cache'
+    response['Cache-Control'] = cache_control
+    return response
+
+
+# Returns the Cache-Control of files whose name is never reused
+def immutable(options=None):
+    options = options or get_options()
+    return f'public, max-age={options["IMMUTABLE_MAX_AGE"]}, immutable'
+
+
+# Builds the response that carries the bytes of the file
+def _file_response(request, options, path, full_path, stat, etag,
+                   content_type):
+    backend = options['BACKEND']
+    if backend == 'x-accel-redirect':
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = quote(options['ACCEL_PREFIX'] + path)
+        return response
+    if backend == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = full_path
+        return response
+
+    byte_range = None
+    header = request.META.get('HTTP_RANGE')
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if header and (if_range is None or if_range == etag):
+        byte_range = parse_range(header, stat.st_size)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{stat.st_size}'
+        return response
+
+    file = open(full_path, 'rb')
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        if end == stat.st_size - 1:
+            # Left as the real file so sendfile still applies
+            file.seek(start)
+            response = FileResponse(file, content_type=content_type)
+        else:
+            response = FileResponse(
+                _FileRange(file, start, length),
+                content_type=content_type,
+            )
+        response.status_code = 206
+        response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+        response['Content-Length'] = length
+    response['Accept-Ranges'] = 'bytes'
+    return response
@@ -0,0 +1,162 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+# Paginates a queryset by seeking past the last row of the previous page.
+# The cursor holds the ordering values of that row, so every page is a
+# single indexed range scan no matter how deep it is, and rows inserted
+# while a client is paging never shift or repeat the results.
+class KeysetPagination(BasePagination):
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    ordering = ('-id',)
+    invalid_cursor_message = _('Invalid cursor')
+
+    # Uses the viewset's ordering, always ending on the unique id
+    def get_ordering(self, view):
+        ordering = tuple(getattr(view, 'ordering', None) or self.ordering)
+        if ordering[-1].lstrip('-') not in ('id', 'pk'):
+            descending = ordering[-1].startswith('-')
+            ordering += ('-id' if descending else 'id',)
+        return ordering
+
+    # Returns the requested page size, capped at max_page_size
+    def get_page_size(self, request):
+        default = api_settings.PAGE_SIZE or 100
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return default
+        if size <= 0:
+            return default
+        return min(size, self.max_page_size)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(view)
+        position, reverse = self.decode_cursor(request)
+
+        ordering = self.ordering
+        if reverse:
+            ordering = tuple(_invert(field) for field in ordering)
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            try:
+                queryset = queryset.filter(self._seek(ordering, position))
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+            self.has_next = position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+        self.page = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self._position(self.page[-1]), False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self._position(self.page[0]), True)
+
+    # Builds the page URL for a cursor positioned at the given row values
+    def encode_cursor(self, position, reverse):
+        payload = json.dumps({'p': position, 'r': int(reverse)}, default=str)
+        cursor = urlsafe_b64encode(payload.encode()).decode()
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, cursor,
+        )
+
+    # Returns the (position, reverse) pair stored in the request's cursor
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None, False
+        try:
+            payload = json.loads(urlsafe_b64decode(cursor.encode()).decode())
+            position = payload['p']
+            reverse = bool(payload['r'])
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or \
+                len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    # Reads the ordering values from a model instance or a values() row
+    def _position(self, row):
+        position = []
+        for field in self.ordering:
+            name = field.lstrip('-')
+            if isinstance(row, dict):
+                position.append(row[name])
+            else:
+                position.append(getattr(row, name))
+        return position
+
+    # Builds the filter that selects the rows after `position` in `ordering`
+    # as (a < x) OR (a = x AND b < y) OR ..., which the database can answer
+    # with a range scan on a matching composite index. The OR alone is
+    # checked row by row from the start of the index, so it is also bounded
+    # by a <= x, which the scan can start from.
+    def _seek(self, ordering, position):
+        first = ordering[0]
+        bound = 'lte' if first.startswith('-') else 'gte'
+        seek = Q()
+        for i, field in enumerate(ordering):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition = Q(**{f'{name}__{lookup}': position[i]})
+            for prior, value in zip(ordering[:i], position[:i]):
+                condition &= Q(**{prior.lstrip('-'): value})
+            seek |= condition
+        if len(ordering) > 1:
+            seek &= Q(**{f'{first.lstrip("-")}__{bound}': position[0]})
+        return seek
+
+
+# Flips the direction of an ordering field
+def _invert(field):
+    return field[1:] if field.startswith('-') else f'-{field}'
@@ -0,0 +1,217 @@
+import hashlib
+import io
+import os
+import re
+import threading
+import time
+import uuid
+from django.conf import settings
+from django.core.files import locks
+from django.http import Http404
+from django.views.decorators.http import require_safe
+from PIL import Image, ImageOps
+from collection.media import immutable, serve_file
+
+DEFAULTS = {
+    # Boxes images may be resized to fit, as (width, height)
+    'SIZES': ((64, 64), (128, 128), (320, 320), (640, 640), (1280, 1280)),
+    # Directory under MEDIA_ROOT holding the resized copies
+    'CACHE_DIR': 'cache/resize',
+    # Total size of the cache, and the share of it kept when it is trimmed
+    'MAX_BYTES': 512 * 2 ** 20,
+    'TRIM_TO': 0.8,
+    # Seconds between marking the same copy as recently used
+    'TOUCH_INTERVAL': 60,
+    'QUALITY': 80,
+}
+
+# Files written by base.models.collection_image_file_path, stored by their
+# content or under a uuid, so a resized copy never goes out of date
+SOURCE_PATH = re.compile(
+    r'^uploads/collection/(?:[0-9a-f]{2}/[0-9a-f]{64}|[0-9a-f]{8}-[0-9a-f]{4}-'
+    r'[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})\.\w+$'
+)
+
+# Formats of the resized copies by extension
+FORMATS = {'webp': 'WEBP', 'png': 'PNG', 'jpg': 'JPEG'}
+
+# Lock files each copy is rendered under, picked by the hash of its name,
+# so the directory of locks stays the same size however many copies exist
+LOCK_STRIPES = 256
+
+
+# Returns the IMAGE_RESIZE setting merged over the defaults
+def get_options():
+    return {**DEFAULTS, **getattr(settings, 'IMAGE_RESIZE', {})}
+
+
+# Keeps the resized copies on disk under a total size. Each copy's access
+# time is set when it is served, at most once per TOUCH_INTERVAL, and once
+# the copies written by this process take the cache over MAX_BYTES the
+# least recently used are deleted until it is down to TRIM_TO of it. The
+# size of the cache is counted again from disk at every trim, so copies
+# written by other processes are accounted for there.
+class ResizeCache:
+    def __init__(self, options):
+        self.options = options
+        self.root = os.path.join(settings.MEDIA_ROOT, options['CACHE_DIR'])
+        self.lock = threading.Lock()
+        self.size = None
+
+    # Returns the MEDIA_ROOT relative name of a copy
+    def name(self, width, height, path, extension):
+        stem = os.path.splitext(path)[0]
+        return (f'{self.options["CACHE_DIR"]}/{width}x{height}/'
+                f'{stem}.{extension}')
+
+    # Marks a copy as used now, keeping its modification time and so the
+    # ETag it is served with
+    def touch(self, full_path):
+        try:
+            stat = os.stat(full_path)
+        except FileNotFoundError:
+            return False
+        now = time.time()
+        if now - stat.st_atime >= self.options['TOUCH_INTERVAL']:
+            os.utime(full_path, ns=(time.time_ns(), stat.st_mtime_ns))
+        return True
+
+    # Returns a lock file that serializes the rendering of `name` across
+    # threads and processes
+    def lock_file(self, name):
+        stripe = int(hashlib.sha1(name.encode()).hexdigest()[:8], 16)
+        directory = os.path.join(self.root, '.locks')
+        os.makedirs(directory, exist_ok=True)
+        return open(
+            os.path.join(directory, f'{stripe % LOCK_STRIPES:02x}'), 'ab',
+        )
+
+    # Writes a copy under a temporary name and renames it into place
+    def write(self, full_path, content):
+        directory, filename = os.path.split(full_path)
+        os.makedirs(directory, exist_ok=True)
+        partial = os.path.join(directory, f'.{uuid.uuid4().hex}.{filename}')
+        with open(partial, 'wb') as f:
+            f.write(content)
+        os.replace(partial, full_path)
+        self.added(len(content))
+
+    # Counts a new copy in, trimming the cache if it has grown too large
+    def added(self, size):
+        with self.lock:
+            if self.size is None:
+                self.size = sum(size for _, _, size in self.entries())
+            else:
+                self.size += size
+            if self.size > self.options['MAX_BYTES']:
+                self.size = self.trim()
+
+    # Yields (access time, path, size) of every copy in the cache
+    def entries(self):
+        pending = [self.root]
+        while pending:
+            try:
+                with os.scandir(pending.pop()) as scan:
+                    for entry in scan:
+                        if entry.name.startswith('.'):
+                            continue
+                        if entry.is_dir(follow_symlinks=False):
+                            pending.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            stat = entry.stat(follow_symlinks=False)
+                            yield stat.st_atime, entry.path, stat.st_size
+            except FileNotFoundError:
+                continue
+
+    # Deletes the least recently used copies until the cache is down to
+    # TRIM_TO of MAX_BYTES, returning the size left
+    def trim(self):
+        entries = sorted(self.entries())
+        total = sum(size for _, _, size in entries)
+        target = self.options['MAX_BYTES'] * self.options['TRIM_TO']
+        for _, path, size in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        return total
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+# Returns the process-wide cache for the current settings
+def get_cache():
+    options = get_options()
+    key = (settings.MEDIA_ROOT, repr(sorted(options.items())))
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = _caches[key] = ResizeCache(options)
+    return cache
+
+
+# Returns an image scaled down to fit a box and encoded by the extension.
+# Images smaller than the box are not scaled up.
+def render(source, width, height, extension, quality):
+    image_format = FORMATS[extension]
+    with open(source, 'rb') as f, Image.open(f) as original:
+        original.draft('RGB', (width, height))
+        image = ImageOps.exif_transpose(original)
+        alpha = image_format != 'JPEG' and \
+            image.mode in ('RGBA', 'LA', 'P')
+        image = image.convert('RGBA' if alpha else 'RGB')
+        image.thumbnail((width, height), Image.Resampling.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, image_format, quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+# Serves a Collection image scaled down to fit one of the allowed boxes.
+# The copy is rendered on first request and kept in a disk cache bounded
+# in size. Concurrent requests for a copy that is not there yet wait for
+# the one rendering it, across threads and processes. WebP is sent to
+# clients that accept it, otherwise PNG for PNG and GIF images and JPEG for
+# the rest.
+@require_safe
+def serve_resized(request, width, height, path):
+    options = get_options()
+    if (width, height) not in {tuple(size) for size in options['SIZES']}:
+        raise Http404('Not found')
+    if not SOURCE_PATH.match(path):
+        raise Http404('Not found')
+    source = os.path.join(settings.MEDIA_ROOT, path)
+    if not os.path.isfile(source):
+        raise Http404('Not found')
+
+    if 'image/webp' in request.META.get('HTTP_ACCEPT', ''):
+        extension = 'webp'
+    elif path.lower().endswith(('.png', '.gif')):
+        extension = 'png'
+    else:
+        extension = 'jpg'
+    cache = get_cache()
+    name = cache.name(width, height, path, extension)
+    full_path = os.path.join(settings.MEDIA_ROOT, name)
+    if not cache.touch(full_path):
+        with cache.lock_file(name) as lock:
+            locks.lock(lock, locks.LOCK_EX)
+            try:
+                # Rendered by whoever held the lock before
+                if not os.path.exists(full_path):
+                    try:
+                        content = render(source, width, height,
+                                         extension, options['QUALITY'])
+                    except (OSError, ValueError,
+                            Image.DecompressionBombError):
+                        raise Http404('Not found')
+                    cache.write(full_path, content)
+            finally:
+                locks.unlock(lock)
+    response = serve_file(request, name, cache_control=immutable())
+    response['Vary'] = 'Accept'
+    return response
@@ -1,54 +1,264 @@
+from django.contrib.postgres.expressions import ArraySubquery
+from django.db import connections, transaction
+from django.db.models import OuterRef
+from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
-from base.models import Tag, Item, Collection
+from base.models import Tag, Item, Collection, Portfolio, TagPortfolio
+from collection.fields import (DerivativesField, ImageUploadField,
+                               UserPrimaryKeyRelatedField)
+
+
+# Lets a read-only list be rendered straight from .values() rows, without
+# building a model instance or running the field machinery for each row.
+# Subclasses name the columns to read and turn the rows into exactly what
+# to_representation would give for the same objects, in the same key order.
+class ValuesSerializerMixin:
+    values_fields = ()
+
+    # Returns the queryset reading the rows values_representation needs,
+    # and any `extra` columns the caller wants alongside them
+    @classmethod
+    def values_queryset(cls, queryset, *extra):
+        return queryset.prefetch_related(None).values(
+            *cls.values_fields, *extra,
+        )
+
+    # Returns the representation of a page of rows
+    def values_representation(self, rows):
+        return rows
+
+
+# Serializes objects whose names are unique for each User
+class UserNamedSerializer(ValuesSerializerMixin,
+                          serializers.ModelSerializer):
+    values_fields = ('id', 'name', 'collection_count')
+
+    # Rejects a name the User already has, unless the view upserts by name
+    def validate_name(self, value):
+        request = self.context.get('request')
+        if request is None or self.context.get('upsert'):
+            return value
+        existing = self.Meta.model.objects.filter(
+            user=request.user,
+            name=value,
+        )
+        if self.instance is not None:
+            existing = existing.exclude(pk=self.instance.pk)
+        if existing.exists():
+            raise serializers.ValidationError(
+                _('You already have one with this name.'),
+                code='unique',
+            )
+        return value
 
 
 # Serializes a Tag
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(UserNamedSerializer):
     class Meta:
         model = Tag
-        fields = ('id', 'name')
-        read_only_fields = ('id',)
+        fields = ('id', 'name', 'collection_count')
+        read_only_fields = ('id', 'collection_count')
         order_by = ['-id']
 
 
 # Serializes an Item
-class ItemSerializer(serializers.ModelSerializer):
+class ItemSerializer(UserNamedSerializer):
     class Meta:
         model = Item
-        fields = ('id', 'name')
-        read_only_fields = ('id',)
+        fields = ('id', 'name', 'collection_count')
+        read_only_fields = ('id', 'collection_count')
         order_by = ['-id']
 
 
 # Serializes a Collection
-class CollectionSerializer(serializers.ModelSerializer):
-    items = serializers.PrimaryKeyRelatedField(
+class CollectionSerializer(ValuesSerializerMixin,
+                           serializers.ModelSerializer):
+    items = UserPrimaryKeyRelatedField(
         many=True,
         queryset=Item.objects.all(),
     )
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = UserPrimaryKeyRelatedField(
         many=True,
         queryset=Tag.objects.all(),
     )
+    image_derivatives = DerivativesField()
 
     class Meta:
         model = Collection
         fields = ('id', 'title', 'items', 'tags', 'items_in_collection',
-                  'floor_price', 'link')
+                  'floor_price', 'link', 'image_derivatives')
         read_only_fields = ('id',)
         order_by = ['-id']
 
+    m2m_fields = ('items', 'tags')
+    values_fields = ('id', 'title', 'items_in_collection', 'floor_price',
+                     'link', 'image_derivatives')
+
+    # Reads the ids of each row's Items and Tags along with it on
+    # PostgreSQL, as ordered arrays from a subquery on the link tables, so
+    # a page is a single query. Elsewhere they are read per page by
+    # values_representation.
+    @classmethod
+    def values_queryset(cls, queryset, *extra):
+        queryset = super().values_queryset(queryset, *extra)
+        if connections[queryset.db].vendor != 'postgresql':
+            return queryset
+        return queryset.annotate(**{
+            f'{name}_ids': ArraySubquery(
+                through.objects.filter(
+                    **{source: OuterRef('pk')}
+                ).order_by(target).values(target)
+            )
+            for name, through, source, target in cls._links()
+        })
+
+    # Builds each row's representation in the order of Meta.fields
+    def values_representation(self, rows):
+        links = {}
+        if rows and 'items_ids' not in rows[0]:
+            links = self._read_links([row['id'] for row in rows])
+        decimal = self.fields['floor_price']
+        derivatives = self.fields['image_derivatives']
+        data = []
+        for row in rows:
+            pk = row['id']
+            if links:
+                items = links['items'].get(pk, [])
+                tags = links['tags'].get(pk, [])
+            else:
+                items, tags = row['items_ids'], row['tags_ids']
+            data.append({
+                'id': pk,
+                'title': row['title'],
+                'items': items,
+                'tags': tags,
+                'items_in_collection': row['items_in_collection'],
+                'floor_price': decimal.to_representation(row['floor_price']),
+                'link': row['link'],
+                'image_derivatives': derivatives.to_representation(
+                    row['image_derivatives'],
+                ),
+            })
+        return data
+
+    # Returns {name: {Collection id: [ids]}} of the Items and Tags of the
+    # given Collections, with one query per relation
+    def _read_links(self, pks):
+        links = {}
+        for name, through, source, target in self._links():
+            ids = links[name] = {}
+            rows = through.objects.filter(**{f'{source}__in': pks}).order_by(
+                target,
+            ).values_list(source, target)
+            for pk, target_id in rows:
+                ids.setdefault(pk, []).append(target_id)
+        return links
+
+    # Yields (name, link model, Collection column, target column) of the
+    # many-to-many fields
+    @classmethod
+    def _links(cls):
+        for name in cls.m2m_fields:
+            field = cls.Meta.model._meta.get_field(name)
+            through = field.remote_field.through
+            yield (
+                name,
+                through,
+                field.m2m_column_name(),
+                field.m2m_reverse_name(),
+            )
+
+    # Creates a Collection and links its Items and Tags
+    def create(self, validated_data):
+        relations = self._pop_relations(validated_data)
+        with transaction.atomic():
+            instance = super().create(validated_data)
+            self._write_relations(instance, relations, created=True)
+        return instance
+
+    # Updates a Collection, only touching the links that actually change
+    def update(self, instance, validated_data):
+        relations = self._pop_relations(validated_data)
+        with transaction.atomic():
+            instance = super().update(instance, validated_data)
+            self._write_relations(instance, relations)
+        return instance
+
+    # Removes the submitted many-to-many values from validated_data
+    def _pop_relations(self, validated_data):
+        return {
+            name: validated_data.pop(name)
+            for name in self.m2m_fields
+            if name in validated_data
+        }
+
+    # Applies the difference between the stored and submitted relations with
+    # one bulk delete and one bulk insert, so the cost follows the size of
+    # the change rather than the size of the Collection. Relations that were
+    # not submitted, as in most PATCH requests, are left alone.
+    def _write_relations(self, instance, relations, created=False):
+        for name, objs in relations.items():
+            manager = getattr(instance, name)
+            wanted = {obj.pk for obj in objs}
+            current = set()
+            if not created:
+                links = manager.through.objects.filter(
+                    **{manager.source_field_name: instance}
+                )
+                current = set(links.values_list(
+                    f'{manager.target_field_name}_id', flat=True,
+                ))
+            removed = current - wanted
+            added = wanted - current
+            if removed:
+                manager.remove(*removed)
+            if added:
+                manager.add(*added)
+
+
+# Serializes the Tags and Items shown inside a Collection, without their
+# usage counts, which change without the Collection changing
+class TagNameSerializer(TagSerializer):
+    class Meta(TagSerializer.Meta):
+        fields = ('id', 'name')
+
+
+class ItemNameSerializer(ItemSerializer):
+    class Meta(ItemSerializer.Meta):
+        fields = ('id', 'name')
+
 
 # Serializes a Collection's details
 class CollectionDetailSerializer(CollectionSerializer):
-    items = ItemSerializer(many=True, read_only=True)
-    tags = TagSerializer(many=True, read_only=True)
+    items = ItemNameSerializer(many=True, read_only=True)
+    tags = TagNameSerializer(many=True, read_only=True)
 
 
 # Serializes uploaded images to Collections
 class CollectionImageSerializer(serializers.ModelSerializer):
+    image = ImageUploadField(required=False, allow_null=True)
+    image_derivatives = DerivativesField()
+
     class Meta:
         model = Collection
-        fields = ('id', 'image')
+        fields = ('id', 'image', 'image_derivatives')
         read_only_fields = ('id',)
         order_by = ['-id']
+
+
+# Serializes the sums over the Collections holding a Tag
+class TagPortfolioSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(source='tag_id')
+    name = serializers.CharField(source='tag.name')
+
+    class Meta:
+        model = TagPortfolio
+        fields = ('id', 'name', 'collection_count', 'items_in_collections',
+                  'value')
+
+
+# Serializes the sums over a User's Collections
+class PortfolioSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Portfolio
+        fields = ('collection_count', 'items_in_collections', 'value')
@@ -0,0 +1,32 @@
+import re
+import unittest
+from contextlib import contextmanager
+
+
+# Reads a Vm* figure of this process from /proc, in bytes
+def _vm(name):
+    with open('/proc/self/status') as f:
+        match = re.search(rf'^{name}:\s+(\d+) kB', f.read(), re.MULTILINE)
+    return int(match.group(1)) * 1024
+
+
+# Mixin for TestCases that checks how far a block grows the resident set
+class PeakMemoryMixin:
+    # Fails if the peak RSS reached in the wrapped block is more than
+    # `limit` bytes above the RSS it started from. Linux resets the peak
+    # when 5 is written to clear_refs, elsewhere the test is skipped.
+    @contextmanager
+    def assertPeakMemory(self, limit):
+        try:
+            with open('/proc/self/clear_refs', 'w') as f:
+                f.write('5')
+        except OSError:
+            raise unittest.SkipTest('Peak RSS cannot be reset here')
+        start = _vm('VmRSS')
+        yield
+        growth = _vm('VmHWM') - start
+        if growth > limit:
+            self.fail(
+                f'Peak RSS grew by {growth >> 20} MiB, '
+                f'limit is {limit >> 20} MiB'
+            )
@@ -0,0 +1,35 @@
+from contextlib import contextmanager
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+# Mixin for TestCases that checks an endpoint stays within a query budget
+class QueryBudgetMixin:
+    # Fails if the wrapped block runs more than `budget` queries
+    @contextmanager
+    def assertQueryBudget(self, budget):
+        with CaptureQueriesContext(connection) as ctx:
+            yield ctx
+        executed = len(ctx.captured_queries)
+        if executed > budget:
+            queries = '\n'.join(
+                f'{i}. {q["sql"]}'
+                for i, q in enumerate(ctx.captured_queries, start=1)
+            )
+            self.fail(
+                f'{executed} queries executed, budget is {budget}:\n{queries}'
+            )
+
+    # Runs `request` once per size produced by `seed` and checks every run
+    # costs the same number of queries and stays within the budget
+    def assertConstantQueries(self, budget, seed, request, sizes=(1, 25)):
+        counts = []
+        for size in sizes:
+            seed(size)
+            with self.assertQueryBudget(budget) as ctx:
+                request()
+            counts.append(len(ctx.captured_queries))
+        self.assertEqual(
+            len(set(counts)), 1,
+            f'Query count grows with the number of rows: {counts}',
+        )
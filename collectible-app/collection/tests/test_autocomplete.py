@@ -0,0 +1,138 @@
+from django.contrib.auth import get_user_model as gum
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from base.models import Collection, Item, Tag
+from collection.autocomplete import (database_matches, get_autocompleter,
+                                     has_trigrams, reset_autocompleter)
+
+TAGS_URL = reverse('collection:tag-autocomplete')
+ITEMS_URL = reverse('collection:item-autocomplete')
+
+
+# Tests autocompleting Tag and Item names
+class AutocompleteTests(TestCase):
+    def setUp(self):
+        reset_autocompleter()
+        self.addCleanup(reset_autocompleter)
+        self.client = APIClient()
+        self.user = gum().objects.create_user(
+            'loremipsum@gmail.com',
+            'Tbin5041',
+        )
+        self.client.force_authenticate(self.user)
+        self.tags = {
+            name: Tag.objects.create(user=self.user, name=name)
+            for name in ('Ape', 'Apex', 'Apple', 'Bored Ape', 'Pixel')
+        }
+        for title, names in (('First', ('Ape', 'Apple')),
+                             ('Second', ('Ape',))):
+            collection = Collection.objects.create(
+                user=self.user,
+                title=title,
+                items_in_collection=1,
+                floor_price='1.00',
+            )
+            collection.tags.add(*(self.tags[name] for name in names))
+
+    # Returns the names the autocomplete lists
+    def names(self, text, url=TAGS_URL, **params):
+        res = self.client.get(url, {'q': text, **params})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [row['name'] for row in res.data]
+
+    # Tests names starting with the text come most used first, the same
+    # from the database as from memory
+    def test_prefix_by_usage(self):
+        cold = self.names('ap')
+        self.assertEqual(cold, ['Ape', 'Apple', 'Apex'])
+        self.assertEqual(self.names('AP'), cold)
+        self.assertEqual(get_autocompleter().stats()['users'], 1)
+        self.assertEqual(self.names('ap'), cold)
+        self.assertEqual(self.names('ap', limit=2), ['Ape', 'Apple'])
+        res = self.client.get(TAGS_URL, {'q': 'ape'})
+        self.assertEqual(res.data[0], {
+            'id': self.tags['Ape'].id, 'name': 'Ape', 'collection_count': 2,
+        })
+
+    # Tests names close to the text follow those starting with it
+    def test_fuzzy_matches(self):
+        self.names('x')
+        self.assertEqual(self.names('ape'), ['Ape', 'Apex', 'Bored Ape'])
+        self.assertEqual(self.names('appel'), ['Apple'])
+        self.assertEqual(self.names('pixle'), ['Pixel'])
+        self.assertEqual(self.names('zzz'), [])
+
+    # Tests names held in memory cost reading the list version only
+    def test_warm_reads_version(self):
+        self.names('ap')
+        self.names('ap')
+        with self.assertNumQueries(1):
+            self.names('ape')
+        stats = get_autocompleter().stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 2))
+
+    # Tests the names held in memory follow created, renamed and deleted
+    # names and their usage
+    def test_follows_writes(self):
+        self.names('ap')
+        self.names('ap')
+        Tag.objects.create(user=self.user, name='Apricot')
+        self.assertIn('Apricot', self.names('apr'))
+        self.tags['Apex'].name = 'Vertex'
+        self.tags['Apex'].save()
+        self.assertEqual(self.names('ap'), ['Ape', 'Apple', 'Apricot'])
+        self.tags['Apple'].delete()
+        self.assertEqual(self.names('ap'), ['Ape', 'Apricot'])
+        apricot = Tag.objects.get(name='Apricot')
+        Collection.objects.get(title='First').tags.add(apricot)
+        Collection.objects.get(title='Second').tags.set([apricot])
+        self.assertEqual(self.names('ap'), ['Apricot', 'Ape'])
+
+    # Tests Items are autocompleted from their own names, and other Users'
+    # names are never listed
+    def test_items_and_users(self):
+        Item.objects.create(user=self.user, name='Apron')
+        other = gum().objects.create_user('other@gmail.com', 'Tbin5041')
+        Tag.objects.create(user=other, name='Apology')
+        for _ in range(2):
+            self.assertEqual(self.names('ap', url=ITEMS_URL), ['Apron'])
+            self.assertNotIn('Apology', self.names('ap'))
+
+    # Tests Users with more names than are held in memory are answered
+    # from the database
+    @override_settings(AUTOCOMPLETE={'MAX_NAMES': 2})
+    def test_too_many_names(self):
+        reset_autocompleter()
+        for _ in range(3):
+            self.assertEqual(self.names('ap'), ['Ape', 'Apple', 'Apex'])
+        self.assertEqual(get_autocompleter().stats()['users'], 0)
+
+    # Tests a missing or overly long text and bad limits are answered with
+    # a 400
+    def test_invalid_params(self):
+        for params in ({}, {'q': ' '}, {'q': 'a' * 101}):
+            res = self.client.get(TAGS_URL, params)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('q', res.data)
+        for limit in ('0', '51', 'many'):
+            res = self.client.get(TAGS_URL, {'q': 'ap', 'limit': limit})
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('limit', res.data)
+
+    # Tests close names are found through the trigram index
+    def test_trigram_plan(self):
+        if not has_trigrams(connection.alias):
+            self.skipTest('pg_trgm is not installed')
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        self.assertEqual(
+            [row['name'] for row in database_matches(
+                Tag, self.user, 'appel', 10, 3,
+            )],
+            ['Apple'],
+        )
+        plan = Tag.objects.filter(name__istartswith='ap').explain()
+        self.assertIn('base_tag_name_trgm_idx', plan)
@@ -1,11 +1,14 @@
+from decimal import Decimal
 import tempfile
 import os
+from unittest.mock import patch
 from PIL import Image
 from django.contrib.auth import get_user_model as gum
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient
+from base import similarity
 from base.models import Collection, Tag, Item
 from collection.serializers import CollectionSerializer, \
                                    CollectionDetailSerializer
@@ -18,6 +21,11 @@ def image_upload_url(collection_id):
     return reverse('collection:collection-upload-image', args=[collection_id])
 
 
+# Returns the URL listing Collections with images similar to a Collection's
+def similar_url(collection_id):
+    return reverse('collection:collection-similar', args=[collection_id])
+
+
 # Returns a Collection's detail URL
 def detail_url(collection_id):
     return reverse('collection:collection-detail', args=[collection_id])
@@ -70,10 +78,10 @@ class PrivateCollectionAPITests(TestCase):
         sample_collection(user=self.user)
         sample_collection(user=self.user, title='mumopins')
         res = self.client.get(COLLECTIONS_URL)
-        collections = Collection.objects.all()
+        collections = Collection.objects.all().order_by('-id')
         serializer = CollectionSerializer(collections, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     # Test that a User can only retrieve their own Collections
     def test_collections_limited_to_user(self):
@@ -88,8 +96,8 @@ class PrivateCollectionAPITests(TestCase):
         serializer = CollectionSerializer(collections, many=True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'], serializer.data)
 
     # Tests viewing a Collections details
     def test_view_collection_detail(self):
@@ -150,6 +158,68 @@ class PrivateCollectionAPITests(TestCase):
         self.assertIn(item1, items)
         self.assertIn(item2, items)
 
+    # Tests that another User's Tags cannot be attached to a Collection
+    def test_create_collection_with_foreign_tag(self):
+        user2 = gum().objects.create_user(
+            'oremlipsum@gmail.com',
+            'Tbin5041',
+        )
+        tag = sample_tag(user=self.user, name='Pins')
+        foreign_tag = sample_tag(user=user2, name='NFTs')
+        collection = {
+            'title': 'Dead Avatar Project',
+            'tags': [tag.id, foreign_tag.id],
+            'items_in_collection': 10000,
+            'floor_price': 0.50,
+        }
+        res = self.client.post(COLLECTIONS_URL, collection)
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn(str(foreign_tag.id), str(res.data['tags']))
+        self.assertFalse(Collection.objects.exists())
+
+    # Tests that every invalid Item id is reported in one error
+    def test_create_collection_reports_all_missing_items(self):
+        item = sample_item(user=self.user)
+        collection = {
+            'title': 'Dead Avatar Project',
+            'items': [item.id, 9998, 9999],
+            'items_in_collection': 10000,
+            'floor_price': 0.50,
+        }
+        res = self.client.post(COLLECTIONS_URL, collection)
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(res.data['items']), 1)
+        self.assertIn('9998, 9999', str(res.data['items'][0]))
+
+    # Tests ids that are not whole numbers are rejected rather than
+    # truncated or read as 1, and ids no row can have as missing
+    def test_create_collection_rejects_non_integer_ids(self):
+        tag = sample_tag(user=self.user, name='Pins')
+        payload = {
+            'title': 'Dead Avatar Project',
+            'items': [],
+            'items_in_collection': 10000,
+            'floor_price': 0.50,
+        }
+        for value in (tag.id + 0.5, float(tag.id), True, f'{tag.id}.5',
+                      [tag.id], f' {tag.id} ', '1_0', '-1'):
+            res = self.client.post(COLLECTIONS_URL, {
+                **payload, 'tags': [value],
+            }, format='json')
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('Incorrect type', str(res.data['tags']))
+        for value in (2 ** 70, str(2 ** 70)):
+            res = self.client.post(COLLECTIONS_URL, {
+                **payload, 'tags': [value],
+            }, format='json')
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn(str(2 ** 70), str(res.data['tags']))
+        self.assertFalse(Collection.objects.exists())
+        res = self.client.post(COLLECTIONS_URL, {
+            **payload, 'tags': [str(tag.id)],
+        }, format='json')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
     # Tests updating a Collection with the patch(partial) update
     def test_partial_update_collection(self):
         collection = sample_collection(user=self.user)
@@ -213,6 +283,109 @@ class CollectionImageUploadTests(TestCase):
         self.assertIn('image', res.data)
         self.assertTrue(os.path.exists(self.collection.image.path))
 
+    # Posts a PNG of the given size to the Collection's upload URL
+    def upload(self, size=(1000, 600)):
+        with tempfile.NamedTemporaryFile(suffix='.png') as ntf:
+            Image.new('RGB', size).save(ntf, format='PNG')
+            ntf.seek(0)
+            return self.client.post(
+                image_upload_url(self.collection.id),
+                {'image': ntf},
+                format='multipart',
+            )
+
+    # Tests the derivatives are generated after the upload is committed
+    # and then listed with the Collection
+    @override_settings(
+        MEDIA_ROOT=tempfile.mkdtemp(),
+        IMAGE_DERIVATIVES={'WORKERS': 0},
+    )
+    def test_upload_image_generates_derivatives(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.upload()
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['image_derivatives'], {})
+
+        self.collection.refresh_from_db()
+        derivatives = self.collection.image_derivatives
+        self.assertEqual(set(derivatives), {'thumb', 'small', 'medium'})
+        res = self.client.get(detail_url(self.collection.id))
+        thumb = res.data['image_derivatives']['thumb']
+        self.assertEqual(set(thumb), {'webp', 'jpg'})
+        self.assertTrue(thumb['webp'].startswith('http://testserver/'))
+
+    # Tests the upload only queues the derivatives on the worker pool
+    @override_settings(IMAGE_DERIVATIVES={'WORKERS': 2})
+    @patch('base.derivatives.get_executor')
+    def test_upload_image_queues_derivatives(self, get_executor):
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.upload((10, 10))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.collection.refresh_from_db()
+        get_executor.return_value.submit.assert_called_once()
+        args = get_executor.return_value.submit.call_args[0]
+        self.assertEqual(args[1:], (self.collection.image.name,))
+        self.assertEqual(self.collection.image_derivatives, {})
+
+    # Tests a request without an image keeps the image and its derivatives,
+    # and a null one clears both, without queueing any work
+    @override_settings(IMAGE_DERIVATIVES={'WORKERS': 2})
+    @patch('base.derivatives.get_executor')
+    def test_upload_without_image(self, get_executor):
+        derivatives = {'thumb': {'webp': 'thumb.webp'}}
+        Collection.objects.filter(pk=self.collection.pk).update(
+            image='uploads/collection/sample.png',
+            image_derivatives=derivatives,
+            image_hash=42,
+        )
+        url = image_upload_url(self.collection.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.post(url, {}, format='json')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.collection.refresh_from_db()
+        self.assertEqual(self.collection.image_derivatives, derivatives)
+        self.assertEqual(self.collection.image_hash, 42)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.post(url, {'image': None}, format='json')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.collection.refresh_from_db()
+        self.assertFalse(self.collection.image)
+        self.assertEqual(self.collection.image_derivatives, {})
+        self.assertIsNone(self.collection.image_hash)
+        get_executor.assert_not_called()
+
+    # Tests Collections of any User with a similar image are listed once
+    # the image has been hashed
+    @override_settings(
+        MEDIA_ROOT=tempfile.mkdtemp(),
+        IMAGE_DERIVATIVES={'WORKERS': 0},
+        IMAGE_SIMILARITY={'REFRESH': 0, 'MAX_DISTANCE': 12},
+    )
+    def test_similar_collections(self):
+        similarity.reset_index()
+        self.addCleanup(similarity.reset_index)
+        url = similar_url(self.collection.id)
+        self.assertEqual(self.client.get(url).data, [])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.upload((300, 200))
+        self.collection.refresh_from_db()
+        image_hash = self.collection.image_hash
+        other = gum().objects.create_user('other@gmail.com', 'Tbin5041')
+        copy = sample_collection(user=other, image_hash=image_hash)
+        sample_collection(user=self.user, image_hash=~image_hash)
+
+        res = self.client.get(url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            res.data, [{'id': copy.id, 'distance': 0, 'own': False}],
+        )
+        for distance in ('13', '-1', 'near'):
+            res = self.client.get(url, {'distance': distance})
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        res = self.client.get(similar_url(copy.id))
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
     # Tests that an invalid image cannot be accepted
     def test_upload_image_bad_request(self):
         url = image_upload_url(self.collection.id)
@@ -238,9 +411,9 @@ class CollectionImageUploadTests(TestCase):
         serializer1 = CollectionSerializer(collection1)
         serializer2 = CollectionSerializer(collection2)
         serializer3 = CollectionSerializer(collection3)
-        self.assertIn(serializer1.data, res.data)
-        self.assertIn(serializer2.data, res.data)
-        self.assertNotIn(serializer3.data, res.data)
+        self.assertIn(serializer1.data, res.data['results'])
+        self.assertIn(serializer2.data, res.data['results'])
+        self.assertNotIn(serializer3.data, res.data['results'])
 
     # Tests returning Collections with specific Items
     def test_filter_collection_by_items(self):
@@ -261,6 +434,128 @@ class CollectionImageUploadTests(TestCase):
         serializer1 = CollectionSerializer(collection1)
         serializer2 = CollectionSerializer(collection2)
         serializer3 = CollectionSerializer(collection3)
-        self.assertIn(serializer1.data, res.data)
-        self.assertIn(serializer2.data, res.data)
-        self.assertNotIn(serializer3.data, res.data)
+        self.assertIn(serializer1.data, res.data['results'])
+        self.assertIn(serializer2.data, res.data['results'])
+        self.assertNotIn(serializer3.data, res.data['results'])
+
+    # Tests Collections holding several of the Tags asked for are listed
+    # once, and ?tags_mode=all keeps those holding every one of them
+    def test_filter_collection_by_tags_mode(self):
+        both = sample_collection(user=self.user, title='bayc')
+        one = sample_collection(user=self.user, title='mayc')
+        sample_collection(user=self.user, title='comissions')
+        tag1 = sample_tag(user=self.user, name='bad')
+        tag2 = sample_tag(user=self.user, name='good')
+        both.tags.add(tag1, tag2)
+        one.tags.add(tag1)
+        ids = f'{tag1.id},{tag2.id},{tag2.id}'
+        res = self.client.get(COLLECTIONS_URL, {'tags': ids})
+        self.assertEqual(
+            [row['id'] for row in res.data['results']], [one.id, both.id],
+        )
+        res = self.client.get(
+            COLLECTIONS_URL, {'tags': ids, 'tags_mode': 'all'},
+        )
+        self.assertEqual(
+            [row['id'] for row in res.data['results']], [both.id],
+        )
+
+    # Tests ?items_mode=all combines with a Tag filter
+    def test_filter_collection_by_items_mode(self):
+        both = sample_collection(user=self.user, title='bayc')
+        one = sample_collection(user=self.user, title='mayc')
+        item1 = sample_item(user=self.user, name='boredape111')
+        item2 = sample_item(user=self.user, name='DeadAvatar222')
+        tag = sample_tag(user=self.user)
+        both.items.add(item1, item2)
+        one.items.add(item1, item2)
+        both.tags.add(tag)
+        res = self.client.get(COLLECTIONS_URL, {
+            'items': f'{item1.id},{item2.id}',
+            'items_mode': 'all',
+            'tags': str(tag.id),
+        })
+        self.assertEqual(
+            [row['id'] for row in res.data['results']], [both.id],
+        )
+
+    # Tests malformed filters are answered with a 400
+    def test_filter_collection_invalid(self):
+        for params in (
+            {'tags': '1,x'},
+            {'tags': '1,,2'},
+            {'items': '1.5'},
+            {'tags': '1', 'tags_mode': 'some'},
+            {'items': ','.join(map(str, range(1001)))},
+        ):
+            res = self.client.get(COLLECTIONS_URL, params)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn(list(params)[-1], res.data)
+
+    # Tests ordering by floor price pages through ties by id, with each
+    # page continuing from the cursor of the one before
+    def test_order_collections_by_floor_price(self):
+        prices = ['3.00', '1.50', '1.50', '2.25', '1.50']
+        collections = [
+            sample_collection(user=self.user, title=f'c{i}', floor_price=p)
+            for i, p in enumerate(prices)
+        ]
+        expected = [c.id for c in sorted(
+            collections, key=lambda c: (Decimal(c.floor_price), c.id),
+            reverse=True,
+        )]
+        seen = []
+        url, params = COLLECTIONS_URL, {'ordering': '-floor_price',
+                                        'floor_price_min': '1',
+                                        'page_size': 2}
+        while url:
+            res = self.client.get(url, params)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            seen += [row['id'] for row in res.data['results']]
+            url, params = res.data['next'], None
+        self.assertEqual(seen, expected)
+
+    # Tests ordering by title and by size
+    def test_order_collections_by_title_and_size(self):
+        b = sample_collection(user=self.user, title='y', items_in_collection=1)
+        a = sample_collection(user=self.user, title='x', items_in_collection=2)
+        res = self.client.get(COLLECTIONS_URL, {'ordering': 'title'})
+        self.assertEqual([r['id'] for r in res.data['results']][-2:],
+                         [a.id, b.id])
+        res = self.client.get(
+            COLLECTIONS_URL, {'ordering': 'items_in_collection'},
+        )
+        self.assertEqual([r['id'] for r in res.data['results']],
+                         [b.id, a.id, self.collection.id])
+
+    # Tests the range filters keep Collections within their bounds, both
+    # ends included
+    def test_filter_collections_by_range(self):
+        cheap = sample_collection(user=self.user, floor_price='1.00',
+                                  items_in_collection=5)
+        mid = sample_collection(user=self.user, floor_price='2.00',
+                                items_in_collection=10)
+        sample_collection(user=self.user, floor_price='3.00',
+                          items_in_collection=20)
+        res = self.client.get(COLLECTIONS_URL, {
+            'floor_price_min': '1', 'floor_price_max': '2.00',
+            'ordering': 'floor_price',
+        })
+        self.assertEqual(
+            [r['id'] for r in res.data['results']], [cheap.id, mid.id],
+        )
+        res = self.client.get(COLLECTIONS_URL, {
+            'items_min': 6, 'items_max': 10, 'floor_price_max': '2.5',
+        })
+        self.assertEqual([r['id'] for r in res.data['results']], [mid.id])
+
+    # Tests malformed bounds and unknown orderings are answered with a 400
+    def test_filter_collections_by_range_invalid(self):
+        res = self.client.get(COLLECTIONS_URL, {
+            'floor_price_min': 'cheap', 'items_max': '1.5',
+        })
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(set(res.data), {'floor_price_min', 'items_max'})
+        res = self.client.get(COLLECTIONS_URL, {'ordering': 'link'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('ordering', res.data)
@@ -0,0 +1,155 @@
+from django.contrib.auth import get_user_model as gum
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from base.models import Collection, Tag, Item
+from collection.tests.query_budget import QueryBudgetMixin
+
+COLLECTIONS_URL = reverse('collection:collection-list')
+TAGS_URL = reverse('collection:tag-list')
+ITEMS_URL = reverse('collection:item-list')
+
+
+# Returns a Collection's detail URL
+def detail_url(collection_id):
+    return reverse('collection:collection-detail', args=[collection_id])
+
+
+# Tests conditional GETs on the list and detail routes
+class ConditionalGetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = gum().objects.create_user(
+            'loremipsum@gmail.com',
+            'Tbin5041',
+        )
+        self.client.force_authenticate(self.user)
+        self.tag = Tag.objects.create(user=self.user, name='NFTs')
+        self.item = Item.objects.create(user=self.user, name='DeadAvatar001')
+        self.collection = Collection.objects.create(
+            user=self.user,
+            title='Dead Avatar Project',
+            items_in_collection=10000,
+            floor_price=0.50,
+        )
+
+    # Returns the ETag of a GET on `url`
+    def etag(self, url, params=None):
+        res = self.client.get(url, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res['ETag']
+
+    # Tests the lists are sent with validators that clients must revalidate
+    def test_list_validators(self):
+        res = self.client.get(TAGS_URL)
+        self.assertTrue(res['ETag'].startswith('"'))
+        self.assertIn('Last-Modified', res)
+        self.assertIn('no-cache', res['Cache-Control'])
+        self.assertIn('private', res['Cache-Control'])
+
+    # Tests an unchanged list is answered with 304 from the version alone
+    def test_list_not_modified(self):
+        for url in (TAGS_URL, ITEMS_URL, COLLECTIONS_URL):
+            etag = self.etag(url)
+            with self.assertQueryBudget(1) as ctx:
+                res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(res['ETag'], etag)
+            self.assertIn('base_listversion', ctx.captured_queries[0]['sql'])
+
+    # Tests If-Modified-Since is honoured when no ETag is sent
+    def test_list_not_modified_since(self):
+        last_modified = self.client.get(TAGS_URL)['Last-Modified']
+        res = self.client.get(TAGS_URL, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    # Tests each filter and page gets its own ETag
+    def test_list_etag_depends_on_query(self):
+        self.assertNotEqual(
+            self.etag(TAGS_URL),
+            self.etag(TAGS_URL, {'assigned_only': 1}),
+        )
+
+    # Tests writes through the API change the list ETag
+    def test_create_changes_list_etag(self):
+        etag = self.etag(TAGS_URL)
+        self.client.post(TAGS_URL, {'name': 'Pins'})
+        res = self.client.get(TAGS_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        etag = res['ETag']
+        self.client.post(TAGS_URL, [{'name': 'Bags'}], format='json')
+        self.assertNotEqual(self.etag(TAGS_URL), etag)
+
+    # Tests direct writes, as the admin makes them, change the ETags of the
+    # lists and of the Collection detail, including through M2M changes
+    def test_model_writes_change_etags(self):
+        tags_etag = self.etag(TAGS_URL, {'assigned_only': 1})
+        detail_etag = self.etag(detail_url(self.collection.id))
+        self.collection.tags.add(self.tag)
+        self.assertNotEqual(
+            self.etag(TAGS_URL, {'assigned_only': 1}), tags_etag,
+        )
+        self.assertNotEqual(
+            self.etag(detail_url(self.collection.id)), detail_etag,
+        )
+
+        detail_etag = self.etag(detail_url(self.collection.id))
+        self.tag.name = 'Pins'
+        self.tag.save()
+        res = self.client.get(
+            detail_url(self.collection.id),
+            HTTP_IF_NONE_MATCH=detail_etag,
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['tags'][0]['name'], 'Pins')
+
+        items_etag = self.etag(ITEMS_URL)
+        self.collection.delete()
+        self.assertNotEqual(self.etag(ITEMS_URL), items_etag)
+
+    # Tests renaming a Tag changes the ETag of the Collection list when
+    # Collections hold it, as searches match them by its name, and leaves
+    # it alone otherwise
+    def test_rename_changes_collection_list_etag(self):
+        self.collection.tags.add(self.tag)
+        params = {'search': 'NFTs'}
+        etag = self.etag(COLLECTIONS_URL, params)
+        self.item.name = 'DeadAvatar002'
+        self.item.save()
+        self.assertEqual(self.etag(COLLECTIONS_URL, params), etag)
+        self.tag.name = 'Pins'
+        self.tag.save()
+        res = self.client.get(
+            COLLECTIONS_URL, params, HTTP_IF_NONE_MATCH=etag,
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'], [])
+
+    # Tests an unchanged Collection detail is answered with 304
+    def test_detail_not_modified(self):
+        url = detail_url(self.collection.id)
+        etag = self.etag(url)
+        with self.assertQueryBudget(1):
+            res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.client.patch(url, {'title': 'bayc'})
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['ETag'], self.etag(url))
+
+    # Tests conditional requests for a missing Collection still 404
+    def test_detail_not_found(self):
+        other = gum().objects.create_user('other@gmail.com', 'Tbin5041')
+        collection = Collection.objects.create(
+            user=other,
+            title='bayc',
+            items_in_collection=5,
+            floor_price=8.67,
+        )
+        res = self.client.get(
+            detail_url(collection.id),
+            HTTP_IF_NONE_MATCH='"x"',
+        )
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
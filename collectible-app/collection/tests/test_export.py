@@ -0,0 +1,104 @@
+import csv
+import io
+import json
+from unittest.mock import patch
+from django.contrib.auth import get_user_model as gum
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from base.models import Collection, Tag, Item
+from collection.serializers import CollectionSerializer
+from collection.tests.query_budget import QueryBudgetMixin
+from collection.views import CollectionViewSet
+
+EXPORT_URL = reverse('collection:collection-export')
+
+
+# Creates and returns a sample Collection for testing
+def sample_collection(user, **params):
+    defaults = {
+        'title': 'Dead Avatar Project',
+        'items_in_collection': 10000,
+        'floor_price': 0.50,
+    }
+    defaults.update(params)
+    return Collection.objects.create(user=user, **defaults)
+
+
+# Tests the streaming Collection export
+class CollectionExportTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = gum().objects.create_user(
+            'loremipsum@gmail.com',
+            'Tbin5041',
+        )
+        self.client.force_authenticate(self.user)
+        self.tag = Tag.objects.create(user=self.user, name='NFTs')
+        self.item = Item.objects.create(user=self.user, name='DeadAvatar001')
+
+    # Returns the full body of a streaming response
+    def content(self, res):
+        return b''.join(res.streaming_content).decode()
+
+    # Tests that NDJSON rows match the list representation
+    def test_export_ndjson(self):
+        collection = sample_collection(user=self.user)
+        collection.tags.add(self.tag)
+        collection.items.add(self.item)
+        sample_collection(user=self.user, title='bayc')
+        res = self.client.get(EXPORT_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in self.content(res).splitlines()]
+        expected = CollectionSerializer(
+            Collection.objects.order_by('-id'), many=True,
+        ).data
+        self.assertEqual(rows, json.loads(json.dumps(expected)))
+
+    # Tests the CSV export with joined Item and Tag ids
+    def test_export_csv(self):
+        collection = sample_collection(user=self.user, title='Comic, Con')
+        collection.tags.add(self.tag)
+        res = self.client.get(EXPORT_URL, {'export_format': 'csv'})
+        self.assertEqual(res['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(io.StringIO(self.content(res))))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['title'], 'Comic, Con')
+        self.assertEqual(rows[0]['tags'], str(self.tag.id))
+        self.assertEqual(rows[0]['items'], '')
+
+    # Tests that the export is limited to the User and honours filters
+    def test_export_filtered(self):
+        user2 = gum().objects.create_user('oremlipsum@gmail.com', 'Tbin5041')
+        sample_collection(user=user2)
+        tagged = sample_collection(user=self.user)
+        tagged.tags.add(self.tag)
+        sample_collection(user=self.user, title='untagged')
+        res = self.client.get(EXPORT_URL, {'tags': str(self.tag.id)})
+        rows = [json.loads(line) for line in self.content(res).splitlines()]
+        self.assertEqual([row['id'] for row in rows], [tagged.id])
+
+    # Tests that an unknown format is rejected
+    def test_export_unknown_format(self):
+        res = self.client.get(EXPORT_URL, {'export_format': 'xml'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    # Tests that each chunk costs a fixed number of queries
+    @patch.object(CollectionViewSet, 'export_chunk_size', 5)
+    def test_export_queries_per_chunk(self):
+        for i in range(20):
+            collection = sample_collection(user=self.user, title=f'C{i}')
+            collection.tags.add(self.tag)
+            collection.items.add(self.item)
+        with self.assertQueryBudget(12) as ctx:
+            res = self.client.get(EXPORT_URL)
+            lines = self.content(res).splitlines()
+        self.assertEqual(len(lines), 20)
+        # One read of the Collections plus two prefetches per chunk of 5
+        selects = [
+            q for q in ctx.captured_queries
+            if 'base_collection_tags' in q['sql']
+        ]
+        self.assertEqual(len(selects), 4)
@@ -0,0 +1,154 @@
+from django.contrib.auth import get_user_model as gum
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from base.models import Collection, Item, Tag
+from collection.fragments import (Fragment, FragmentJSONRenderer,
+                                  LocalBackend, get_fragment_cache,
+                                  reset_fragment_cache)
+
+COLLECTIONS_URL = reverse('collection:collection-list')
+
+
+# Returns a Collection's detail URL
+def detail_url(collection_id):
+    return reverse('collection:collection-detail', args=[collection_id])
+
+
+# Tests Collections are rendered from cached fragments
+class FragmentCacheTests(TestCase):
+    def setUp(self):
+        reset_fragment_cache()
+        self.client = APIClient()
+        self.user = gum().objects.create_user(
+            'loremipsum@gmail.com',
+            'Tbin5041',
+        )
+        self.client.force_authenticate(self.user)
+        self.tag = Tag.objects.create(user=self.user, name='Vintage')
+        self.item = Item.objects.create(user=self.user, name='Ape')
+        self.collections = []
+        for i in range(3):
+            collection = Collection.objects.create(
+                user=self.user,
+                title=f'Collection{i}',
+                items_in_collection=10,
+                floor_price='1.50',
+            )
+            collection.tags.add(self.tag)
+            collection.items.add(self.item)
+            self.collections.append(collection)
+
+    def tearDown(self):
+        reset_fragment_cache()
+
+    # Tests a warm list reads only the version stamps and renders the same
+    # body as the cold one
+    def test_list_from_fragments(self):
+        cold = self.client.get(COLLECTIONS_URL)
+        self.assertEqual(cold.status_code, status.HTTP_200_OK)
+        with self.assertNumQueries(2):
+            warm = self.client.get(COLLECTIONS_URL)
+        self.assertEqual(warm.content, cold.content)
+        self.assertEqual(warm.data, cold.data)
+        stats = get_fragment_cache().stats()
+        self.assertEqual((stats['hits'], stats['misses']), (3, 3))
+        self.assertEqual(stats['hit_rate'], 0.5)
+
+    # Tests only the fragments missing from the cache are read and rendered
+    def test_list_reads_only_misses(self):
+        self.client.get(COLLECTIONS_URL)
+        changed = self.collections[1]
+        changed.title = 'Renamed'
+        changed.save()
+        res = self.client.get(COLLECTIONS_URL)
+        titles = [row['title'] for row in res.data['results']]
+        self.assertEqual(titles, ['Collection2', 'Renamed', 'Collection0'])
+        stats = get_fragment_cache().stats()
+        self.assertEqual((stats['hits'], stats['misses']), (2, 4))
+
+    # Tests changes to links and to the names of linked objects are never
+    # served from an older fragment
+    def test_detail_follows_versions(self):
+        url = detail_url(self.collections[0].id)
+        self.client.get(url)
+        self.tag.name = 'Modern'
+        self.tag.save()
+        res = self.client.get(url)
+        self.assertEqual(res.data['tags'][0]['name'], 'Modern')
+        self.collections[0].tags.clear()
+        res = self.client.get(url)
+        self.assertEqual(res.data['tags'], [])
+        with self.assertNumQueries(1):
+            warm = self.client.get(url)
+        self.assertEqual(warm.content, res.content)
+        self.assertEqual(warm['ETag'], res['ETag'])
+
+    # Tests the list and detail of a Collection are cached apart
+    def test_shapes(self):
+        self.client.get(COLLECTIONS_URL)
+        res = self.client.get(detail_url(self.collections[0].id))
+        self.assertEqual(res.data['tags'][0]['name'], 'Vintage')
+
+    # Tests indented JSON and the browsable API render fragments too
+    def test_indented(self):
+        self.client.get(COLLECTIONS_URL)
+        res = self.client.get(
+            COLLECTIONS_URL, HTTP_ACCEPT='application/json; indent=2',
+        )
+        self.assertIn(b'\n  "results"', res.content)
+        res = self.client.get(COLLECTIONS_URL, HTTP_ACCEPT='text/html')
+        self.assertContains(res, 'Collection2')
+
+    # Tests the shared backend is used across workers
+    @override_settings(
+        CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }},
+        FRAGMENT_CACHE={'BACKEND': 'shared'},
+    )
+    def test_shared_backend(self):
+        reset_fragment_cache()
+        cold = self.client.get(COLLECTIONS_URL)
+        reset_fragment_cache()
+        with self.assertNumQueries(2):
+            warm = self.client.get(COLLECTIONS_URL)
+        self.assertEqual(warm.content, cold.content)
+
+    # Tests the cache can be turned off
+    @override_settings(FRAGMENT_CACHE={'BACKEND': None})
+    def test_disabled(self):
+        reset_fragment_cache()
+        self.assertIsNone(get_fragment_cache())
+        res = self.client.get(COLLECTIONS_URL)
+        self.assertEqual(len(res.data['results']), 3)
+
+
+# Tests the parts of the fragment cache on their own
+class FragmentPartsTests(TestCase):
+    # Tests the local backend drops the least recently used fragments
+    def test_local_backend_bound(self):
+        backend = LocalBackend(max_bytes=3 * (1 + 100 + 200))
+        for key in 'abc':
+            backend.set_many({key: b'x' * 100})
+        backend.get_many(['a'])
+        backend.set_many({'d': b'x' * 100})
+        self.assertEqual(set(backend.get_many(list('abcd'))), set('acd'))
+        self.assertEqual(backend.evictions, 1)
+        self.assertLessEqual(backend.size, backend.max_bytes)
+
+    # Tests spliced fragments render exactly like encoded data
+    def test_renderer(self):
+        data = {'next': None, 'results': [
+            {'id': 1, 'title': 'Ünïcode', 'floor_price': '1.50'},
+            {'id': 2, 'title': None, 'tags': []},
+        ]}
+        spliced = {**data, 'results': [
+            Fragment.render(row) for row in data['results']
+        ]}
+        self.assertEqual(
+            FragmentJSONRenderer().render(spliced),
+            JSONRenderer().render(data),
+        )
@@ -1,4 +1,6 @@
 from django.contrib.auth import get_user_model as gum
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.test import TestCase
 from rest_framework import status
@@ -39,7 +41,7 @@ class PrivateItemsAPITests(TestCase):
         items = Item.objects.all().order_by('-name')
         serializer = ItemSerializer(items, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     # Tests that only the Items for the authenticated User are returned
     def test_items_limited_to_user(self):
@@ -51,8 +53,8 @@ class PrivateItemsAPITests(TestCase):
         item = Item.objects.create(user=self.user, name='DeadAvatar867')
         res = self.client.get(ITEMS_URL)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data[0]['name'], item.name)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'][0]['name'], item.name)
 
     # Tests the successful creation of an Item
     def test_create_item_successful(self):
@@ -87,11 +89,12 @@ class PrivateItemsAPITests(TestCase):
             user=self.user,
         )
         collection.items.add(item1)
+        item1.refresh_from_db()
         res = self.client.get(ITEMS_URL, {'assigned_only': 1})
         serializer1 = ItemSerializer(item1)
         serializer2 = ItemSerializer(item2)
-        self.assertIn(serializer1.data, res.data)
-        self.assertNotIn(serializer2.data, res.data)
+        self.assertIn(serializer1.data, res.data['results'])
+        self.assertNotIn(serializer2.data, res.data['results'])
 
     # Tests that filtering items by assigned will return unique items.
     def test_retrieve_item_assigned_unique(self):
@@ -118,4 +121,49 @@ class PrivateItemsAPITests(TestCase):
         )
         collection2.items.add(item)
         res = self.client.get(ITEMS_URL, {'assigned_only': 1})
-        self.assertEqual(len(res.data), 1)
+        self.assertEqual(len(res.data['results']), 1)
+
+    # Tests that a second Item with the same name is rejected
+    def test_create_item_duplicate_name(self):
+        Item.objects.create(user=self.user, name='Pins')
+        res = self.client.post(ITEMS_URL, {'name': 'Pins'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Item.objects.filter(user=self.user).count(), 1)
+
+    # Tests creating many Items in one request
+    def test_bulk_create_items(self):
+        existing = Item.objects.create(user=self.user, name='Pins')
+        payload = [{'name': 'Pins'}, {'name': 'bayc'}, {'name': 'Pins'}]
+        res = self.client.post(ITEMS_URL, payload, format='json')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([row['name'] for row in res.data],
+                         ['Pins', 'bayc', 'Pins'])
+        self.assertEqual(res.data[0]['id'], existing.id)
+        self.assertEqual(res.data[2]['id'], existing.id)
+        created = Item.objects.get(user=self.user, name='bayc')
+        self.assertEqual(res.data[1]['id'], created.id)
+        self.assertEqual(Item.objects.filter(user=self.user).count(), 2)
+
+    # Tests that bulk validation errors are reported for each element
+    def test_bulk_create_items_invalid(self):
+        payload = [{'name': 'Pins'}, {'name': ''}, {}]
+        res = self.client.post(ITEMS_URL, payload, format='json')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertNotIn(0, res.data)
+        self.assertIn('name', res.data[1])
+        self.assertIn('name', res.data[2])
+        self.assertFalse(Item.objects.filter(user=self.user).exists())
+
+    # Tests that a large bulk request runs a fixed number of queries
+    def test_bulk_create_items_query_count(self):
+        payload = [{'name': f'Item{i}'} for i in range(10000)]
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.post(ITEMS_URL, payload, format='json')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(res.data), 10000)
+        # SQLite takes at most 333 rows of three columns per INSERT, and the
+        # ids are then read back 1000 names at a time
+        self.assertLess(len(ctx.captured_queries), 50)
+        self.assertEqual(
+            Item.objects.filter(user=self.user).count(), 10000,
+        )
@@ -0,0 +1,130 @@
+from django.contrib.auth import get_user_model as gum
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from base.models import Collection, Tag, Item
+from collection.tests.query_budget import QueryBudgetMixin
+
+
+# Returns a Collection's detail URL
+def detail_url(collection_id):
+    return reverse('collection:collection-detail', args=[collection_id])
+
+
+# Tests that Collection writes only touch the links that change
+class CollectionRelationWriteTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = gum().objects.create_user(
+            'loremipsum@gmail.com',
+            'Tbin5041',
+        )
+        self.client.force_authenticate(self.user)
+        self.collection = Collection.objects.create(
+            user=self.user,
+            title='Dead Avatar Project',
+            items_in_collection=10,
+            floor_price=1.00,
+        )
+        self.tags = [
+            Tag.objects.create(user=self.user, name=f'Tag{i}')
+            for i in range(3)
+        ]
+        self.collection.tags.add(self.tags[0], self.tags[1])
+
+    # Adds Items to the Collection until it holds `count` of them
+    def grow_items(self, count):
+        existing = self.collection.items.count()
+        items = Item.objects.bulk_create(
+            Item(user=self.user, name=f'Item{i}')
+            for i in range(existing, count)
+        )
+        self.collection.items.add(*items)
+
+    # Returns the SQL run against the Collection's Item links
+    def item_link_sql(self, ctx):
+        return [
+            query['sql'] for query in ctx.captured_queries
+            if 'base_collection_items' in query['sql']
+        ]
+
+    # Tests that a PATCH without relations runs no through-table queries
+    def test_patch_skips_relations(self):
+        self.grow_items(5)
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.patch(
+                detail_url(self.collection.id),
+                {'title': 'Comic-Con 2019 Set'},
+            )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        writes = [
+            query['sql'] for query in ctx.captured_queries
+            if query['sql'].startswith(('INSERT', 'DELETE')) and
+            'base_collection_' in query['sql']
+        ]
+        self.assertEqual(writes, [])
+        self.assertEqual(self.collection.items.count(), 5)
+
+    # Tests that swapping one Tag only inserts and deletes that Tag's link
+    def test_update_applies_delta(self):
+        links = Collection.tags.through.objects.filter(
+            collection=self.collection,
+        )
+        kept = links.get(tag=self.tags[0]).id
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.patch(
+                detail_url(self.collection.id),
+                {'tags': [self.tags[0].id, self.tags[2].id]},
+                format='json',
+            )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        deletes = [
+            query['sql'] for query in ctx.captured_queries
+            if query['sql'].startswith('DELETE')
+        ]
+        self.assertEqual(len(deletes), 1)
+        self.assertEqual(links.get(tag=self.tags[0]).id, kept)
+        self.assertEqual(
+            set(self.collection.tags.values_list('id', flat=True)),
+            {self.tags[0].id, self.tags[2].id},
+        )
+
+    # Tests that resubmitting unchanged Items writes nothing to their links
+    def test_unchanged_relation_not_rewritten(self):
+        self.grow_items(20)
+        item_ids = list(self.collection.items.values_list('id', flat=True))
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.patch(
+                detail_url(self.collection.id),
+                {'items': item_ids},
+                format='json',
+            )
+        writes = [
+            sql for sql in self.item_link_sql(ctx)
+            if sql.startswith(('INSERT', 'DELETE'))
+        ]
+        self.assertEqual(writes, [])
+
+    # Tests that the cost of changing one Tag does not grow with the Items
+    def test_update_cost_independent_of_collection_size(self):
+        state = {'turn': 0}
+
+        def request():
+            state['turn'] += 1
+            tags = [self.tags[0], self.tags[1 + state['turn'] % 2]]
+            res = self.client.patch(
+                detail_url(self.collection.id),
+                {'tags': [tag.id for tag in tags]},
+                format='json',
+            )
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        # Includes an UPDATE of the usage counts and of the portfolio for
+        # the removed Tag and the same for the added Tag, and the savepoint
+        # the locked Collection is updated within
+        self.assertConstantQueries(
+            22, self.grow_items, request, sizes=(1, 50, 500),
+        )
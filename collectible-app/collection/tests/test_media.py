@@ -0,0 +1,129 @@
+import os
+import tempfile
+import uuid
+from django.test import TestCase, override_settings
+
+MEDIA_ROOT = tempfile.mkdtemp()
+CONTENT = bytes(range(256)) * 40
+
+
+# Tests serving uploaded files from MEDIA_ROOT
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ServeMediaTests(TestCase):
+    def setUp(self):
+        self.name = f'uploads/collection/{uuid.uuid4()}.png'
+        path = os.path.join(MEDIA_ROOT, self.name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(CONTENT)
+        self.addCleanup(os.remove, path)
+        self.url = f'/media/{self.name}'
+
+    # Returns the whole body of a file response
+    def content(self, res):
+        return b''.join(res.streaming_content)
+
+    # Tests a file is served whole with validators and immutable caching
+    def test_serve_file(self):
+        res = self.client.get(self.url)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.content(res), CONTENT)
+        self.assertEqual(res['Content-Type'], 'image/png')
+        self.assertEqual(int(res['Content-Length']), len(CONTENT))
+        self.assertEqual(res['Accept-Ranges'], 'bytes')
+        self.assertTrue(res['ETag'].startswith('"'))
+        self.assertIn('Last-Modified', res)
+        self.assertIn('immutable', res['Cache-Control'])
+
+    # Tests a file whose name can be reused is revalidated instead
+    def test_serve_mutable_file(self):
+        path = os.path.join(MEDIA_ROOT, 'uploads/collection/plain.png')
+        with open(path, 'wb') as f:
+            f.write(CONTENT)
+        self.addCleanup(os.remove, path)
+        res = self.client.get('/media/uploads/collection/plain.png')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res['Cache-Control'], 'public, no-cache')
+
+    # Tests files other than images are sent as downloads, never shown
+    # inline or cached as immutable
+    def test_serve_other_types_as_download(self):
+        name = f'uploads/collection/{uuid.uuid4()}.html'
+        path = os.path.join(MEDIA_ROOT, name)
+        with open(path, 'wb') as f:
+            f.write(b'<script>alert(1)</script>')
+        self.addCleanup(os.remove, path)
+        res = self.client.get(f'/media/{name}')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res['Content-Type'], 'application/octet-stream')
+        self.assertEqual(res['Content-Disposition'], 'attachment')
+        self.assertEqual(res['Cache-Control'], 'public, no-cache')
+        self.content(res)
+
+    # Tests a matching ETag is answered with 304
+    def test_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        res = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res['ETag'], etag)
+
+    # Tests byte ranges with both ends, an open end and a suffix
+    def test_ranges(self):
+        for header, start, end in (
+            ('bytes=10-19', 10, 19),
+            ('bytes=10000-', 10000, len(CONTENT) - 1),
+            ('bytes=-5', len(CONTENT) - 5, len(CONTENT) - 1),
+            ('bytes=0-99999', 0, len(CONTENT) - 1),
+        ):
+            res = self.client.get(self.url, HTTP_RANGE=header)
+            self.assertEqual(res.status_code, 206, header)
+            self.assertEqual(self.content(res), CONTENT[start:end + 1])
+            self.assertEqual(int(res['Content-Length']), end - start + 1)
+            self.assertEqual(
+                res['Content-Range'], f'bytes {start}-{end}/{len(CONTENT)}',
+            )
+
+    # Tests a range past the end of the file is refused
+    def test_range_not_satisfiable(self):
+        res = self.client.get(self.url, HTTP_RANGE='bytes=99999-')
+        self.assertEqual(res.status_code, 416)
+        self.assertEqual(res['Content-Range'], f'bytes */{len(CONTENT)}')
+
+    # Tests a range is ignored when If-Range names another version
+    def test_if_range_mismatch(self):
+        res = self.client.get(
+            self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"',
+        )
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.content(res), CONTENT)
+
+    # Tests HEAD requests and the refusal of other methods
+    def test_methods(self):
+        self.assertEqual(self.client.head(self.url).status_code, 200)
+        self.assertEqual(self.client.post(self.url).status_code, 405)
+
+    # Tests missing files, directories and paths outside MEDIA_ROOT 404
+    def test_not_found(self):
+        for url in ('/media/uploads/collection/missing.png',
+                    '/media/uploads/collection/',
+                    '/media/../settings.py'):
+            self.assertEqual(self.client.get(url).status_code, 404, url)
+
+    # Tests the file is handed to nginx with X-Accel-Redirect
+    @override_settings(MEDIA_SERVING={'BACKEND': 'x-accel-redirect'})
+    def test_x_accel_redirect(self):
+        res = self.client.get(self.url)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            res['X-Accel-Redirect'], f'/protected-media/{self.name}',
+        )
+        self.assertEqual(res.content, b'')
+        self.assertIn('ETag', res)
+
+    # Tests the file is handed to the server with X-Sendfile
+    @override_settings(MEDIA_SERVING={'BACKEND': 'x-sendfile'})
+    def test_x_sendfile(self):
+        res = self.client.get(self.url)
+        self.assertEqual(
+            res['X-Sendfile'], os.path.join(MEDIA_ROOT, self.name),
+        )
@@ -0,0 +1,111 @@
+from django.contrib.auth import get_user_model as gum
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from base.models import Collection, Tag
+from collection.tests.query_budget import QueryBudgetMixin
+
+COLLECTIONS_URL = reverse('collection:collection-list')
+TAGS_URL = reverse('collection:tag-list')
+
+
+# Tests the keyset pagination of the list endpoints
+class KeysetPaginationTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = gum().objects.create_user(
+            'loremipsum@gmail.com',
+            'Tbin5041',
+        )
+        self.client.force_authenticate(self.user)
+
+    # Creates and returns a sample Collection for testing
+    def sample_collection(self, title='Dead Avatar Project'):
+        return Collection.objects.create(
+            user=self.user,
+            title=title,
+            items_in_collection=10,
+            floor_price=1.00,
+        )
+
+    # Follows the next links from `url` and returns every page's results
+    def walk(self, url, params=None):
+        pages = []
+        res = self.client.get(url, params)
+        while True:
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            pages.append(res.data['results'])
+            if not res.data['next']:
+                return pages
+            res = self.client.get(res.data['next'])
+
+    # Tests that paging returns every Collection once in -id order
+    def test_collections_paged_by_id(self):
+        ids = [self.sample_collection(f'C{i}').id for i in range(7)]
+        pages = self.walk(COLLECTIONS_URL, {'page_size': 3})
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        returned = [row['id'] for page in pages for row in page]
+        self.assertEqual(returned, sorted(ids, reverse=True))
+
+    # Tests that Tags are paged in -name order without loss
+    def test_tags_paged_by_name(self):
+        for name in ['Pins', 'bayc', 'NFTs', 'Zines', 'Art']:
+            Tag.objects.create(user=self.user, name=name)
+        pages = self.walk(TAGS_URL, {'page_size': 2})
+        returned = [(row['name'], row['id']) for page in pages for row in page]
+        expected = list(
+            Tag.objects.order_by('-name', '-id').values_list('name', 'id')
+        )
+        self.assertEqual(returned, expected)
+
+    # Tests that rows inserted while paging do not shift later pages
+    def test_stable_under_concurrent_inserts(self):
+        ids = [self.sample_collection(f'C{i}').id for i in range(6)]
+        res = self.client.get(COLLECTIONS_URL, {'page_size': 3})
+        first = [row['id'] for row in res.data['results']]
+        self.sample_collection('Inserted')
+        res = self.client.get(res.data['next'])
+        second = [row['id'] for row in res.data['results']]
+        self.assertEqual(first + second, sorted(ids, reverse=True))
+
+    # Tests that the previous link returns the page before
+    def test_previous_link(self):
+        for i in range(6):
+            self.sample_collection(f'C{i}')
+        first = self.client.get(COLLECTIONS_URL, {'page_size': 2})
+        self.assertIsNone(first.data['previous'])
+        second = self.client.get(first.data['next'])
+        back = self.client.get(second.data['previous'])
+        self.assertEqual(back.data['results'], first.data['results'])
+
+    # Tests that the page size is capped at the maximum
+    def test_page_size_capped(self):
+        res = self.client.get(COLLECTIONS_URL, {'page_size': 10 ** 6})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIsNone(res.data['next'])
+
+    # Tests that a malformed cursor is rejected
+    def test_invalid_cursor(self):
+        for cursor in ['garbage', 'eyJwIjogWyJ4Il0sICJyIjogMH0=']:
+            res = self.client.get(COLLECTIONS_URL, {'cursor': cursor})
+            self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    # Tests that a deep page costs the same number of queries as the first
+    def test_deep_page_query_count(self):
+        for i in range(30):
+            self.sample_collection(f'C{i}')
+        pages = []
+        res = self.client.get(COLLECTIONS_URL, {'page_size': 5})
+        while res.data['next']:
+            pages.append(res.data['next'])
+            res = self.client.get(res.data['next'])
+        with self.assertQueryBudget(4) as first:
+            self.client.get(COLLECTIONS_URL, {'page_size': 5})
+        with self.assertQueryBudget(4) as last:
+            self.client.get(pages[-1])
+        self.assertEqual(
+            len(first.captured_queries), len(last.captured_queries),
+        )
+        for query in last.captured_queries:
+            self.assertNotIn('OFFSET', query['sql'].upper())
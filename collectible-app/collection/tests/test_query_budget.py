@@ -0,0 +1,159 @@
+from django.contrib.auth import get_user_model as gum
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from base.models import Collection, Tag, Item
+from collection.tests.query_budget import QueryBudgetMixin
+
+COLLECTIONS_URL = reverse('collection:collection-list')
+TAGS_URL = reverse('collection:tag-list')
+ITEMS_URL = reverse('collection:item-list')
+
+
+# Returns a Collection's detail URL
+def detail_url(collection_id):
+    return reverse('collection:collection-detail', args=[collection_id])
+
+
+# Tests that the Collection API endpoints run a fixed number of queries
+class CollectionQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = gum().objects.create_user(
+            'loremipsum@gmail.com',
+            'Tbin5041',
+        )
+        self.client.force_authenticate(self.user)
+        self.tags = [
+            Tag.objects.create(user=self.user, name=f'Tag{i}')
+            for i in range(3)
+        ]
+        self.items = [
+            Item.objects.create(user=self.user, name=f'Item{i}')
+            for i in range(3)
+        ]
+
+    # Creates Collections until the User owns `count` of them
+    def seed_collections(self, count):
+        existing = Collection.objects.filter(user=self.user).count()
+        for i in range(existing, count):
+            collection = Collection.objects.create(
+                user=self.user,
+                title=f'Collection{i}',
+                items_in_collection=10,
+                floor_price=1.00,
+            )
+            collection.tags.add(*self.tags)
+            collection.items.add(*self.items)
+
+    # Tests the Collection list stays within budget for any number of rows
+    def test_list_query_budget(self):
+        def request():
+            res = self.client.get(COLLECTIONS_URL)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        # The version stamps of the page, then the rows missing from the
+        # fragment cache with their links
+        self.assertConstantQueries(5, self.seed_collections, request)
+
+    # Tests the Collection detail stays within budget for any relation size
+    def test_retrieve_query_budget(self):
+        collection = Collection.objects.create(
+            user=self.user,
+            title='Dead Avatar Project',
+            items_in_collection=10,
+            floor_price=1.00,
+        )
+
+        def seed(count):
+            for i in range(collection.items.count(), count):
+                collection.items.add(
+                    Item.objects.create(user=self.user, name=f'Extra{i}')
+                )
+
+        def request():
+            res = self.client.get(detail_url(collection.id))
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        # The version stamp, then the Collection missing from the fragment
+        # cache with its Items and Tags
+        self.assertConstantQueries(4, seed, request)
+
+    # Tests creating a Collection stays within budget
+    def test_create_query_budget(self):
+        payload = {
+            'title': 'Dead Avatar Project',
+            'items_in_collection': 10,
+            'floor_price': 1.00,
+            'tags': [self.tags[0].id],
+            'items': [self.items[0].id],
+        }
+
+        def request():
+            res = self.client.post(COLLECTIONS_URL, payload)
+            self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+        # Includes one UPDATE of the usage counts per relation, and one
+        # upsert each of the User's and the Tags' portfolios
+        self.assertConstantQueries(20, self.seed_collections, request)
+
+    # Tests updating a Collection stays within budget
+    def test_update_query_budget(self):
+        self.seed_collections(1)
+        collection = Collection.objects.filter(user=self.user).first()
+
+        def seed(count):
+            self.seed_collections(count)
+            collection.tags.set(self.tags)
+            collection.items.set(self.items)
+        payload = {
+            'title': 'Comic-Con 2019 Set',
+            'items_in_collection': 10,
+            'floor_price': 1.00,
+            'tags': [self.tags[0].id],
+            'items': [self.items[0].id],
+        }
+
+        def request():
+            res = self.client.put(detail_url(collection.id), payload)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        # Includes one UPDATE of the usage counts per relation for the
+        # links removed and one for those added, and one of the portfolios
+        # of the removed Tags, and the savepoint the locked Collection is
+        # updated within
+        self.assertConstantQueries(22, seed, request)
+
+    # Tests the Tag and Item lists stay within budget for any number of rows
+    def test_attr_list_query_budget(self):
+        def seed(count):
+            for i in range(Tag.objects.count(), count):
+                Tag.objects.create(user=self.user, name=f'More{i}')
+                Item.objects.create(user=self.user, name=f'More{i}')
+
+        def request():
+            self.assertEqual(self.client.get(TAGS_URL).status_code, 200)
+            self.assertEqual(self.client.get(ITEMS_URL).status_code, 200)
+
+        self.assertConstantQueries(4, seed, request)
+
+    # Tests creating a Collection costs the same for any number of Tags
+    def test_create_query_budget_independent_of_relations(self):
+        def seed(count):
+            for i in range(len(self.tags), count):
+                self.tags.append(
+                    Tag.objects.create(user=self.user, name=f'More{i}')
+                )
+
+        def request():
+            payload = {
+                'title': 'Dead Avatar Project',
+                'items_in_collection': 10,
+                'floor_price': 1.00,
+                'tags': [tag.id for tag in self.tags],
+            }
+            res = self.client.post(COLLECTIONS_URL, payload)
+            self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+        self.assertConstantQueries(16, seed, request)
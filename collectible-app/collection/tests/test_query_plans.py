@@ -0,0 +1,217 @@
+from django.contrib.auth import get_user_model as gum
+from django.db import connection
+from django.test import TestCase
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from base.models import Collection, Tag, Item
+from collection import views
+from collection.pagination import KeysetPagination
+
+
+# Tests that the viewset queries are answered from an index
+class QueryPlanTests(TestCase):
+    def setUp(self):
+        self.user = gum().objects.create_user(
+            'loremipsum@gmail.com',
+            'Tbin5041',
+        )
+        tag = Tag.objects.create(user=self.user, name='Pins')
+        item = Item.objects.create(user=self.user, name='DeadAvatar001')
+        collection = Collection.objects.create(
+            user=self.user,
+            title='Dead Avatar Project',
+            items_in_collection=10,
+            floor_price=1.00,
+        )
+        collection.tags.add(tag)
+        collection.items.add(item)
+        other = gum().objects.create_user('oremlipsum@gmail.com', 'Tbin5041')
+        for user in (self.user, other):
+            Tag.objects.bulk_create(
+                Tag(user=user, name=f'Tag{i}') for i in range(500)
+            )
+            Item.objects.bulk_create(
+                Item(user=user, name=f'Item{i}') for i in range(500)
+            )
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+    # Returns the first page query `viewset` runs for the given params
+    def viewset_queryset(self, viewset, params=None):
+        request = Request(APIRequestFactory().get('/', params or {}))
+        request.user = self.user
+        view = viewset(request=request, action='list', format_kwarg=None)
+        queryset = view.get_queryset().order_by(*view.ordering)
+        return queryset[:view.paginator.get_page_size(request) + 1]
+
+    # Returns the query plan, with sequential scans and sorts disabled on
+    # PostgreSQL so a usable index, in the order asked for, is chosen even
+    # for the tiny test tables
+    def explain(self, queryset):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute('SET LOCAL enable_sort = off')
+        return queryset.explain()
+
+    # Returns the name of the index behind the per-User unique name
+    # constraint, which SQLite builds as an automatic index
+    def unique_name_index(self, model):
+        table = model._meta.db_table
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute(f'PRAGMA index_list({table})')
+                indexes = {row[1]: row[2] for row in cursor.fetchall()}
+                for name, unique in indexes.items():
+                    cursor.execute(f'PRAGMA index_info({name})')
+                    columns = [row[2] for row in cursor.fetchall()]
+                    if unique and columns == ['user_id', 'name']:
+                        return name
+            constraints = connection.introspection.get_constraints(
+                cursor, table,
+            )
+        for name, constraint in constraints.items():
+            if constraint['unique'] and \
+                    constraint['columns'] == ['user_id', 'name']:
+                return name
+        self.fail(f'No unique (user, name) index on {table}')
+
+    # Checks that `queryset` reads every table through an index, including
+    # each of the named indexes
+    def assertUsesIndexes(self, queryset, *indexes):
+        plan = self.explain(queryset)
+        for index in indexes:
+            self.assertIn(index, plan)
+        if connection.vendor == 'postgresql':
+            self.assertNotIn('Seq Scan', plan)
+        else:
+            for line in plan.splitlines():
+                if ' SCAN ' in f' {line}' or 'SEARCH' in line:
+                    self.assertIn('INDEX', line, plan)
+
+    # Tests the Tag list uses the per-User unique name index
+    def test_tag_list_plan(self):
+        self.assertUsesIndexes(
+            self.viewset_queryset(views.TagViewSet),
+            self.unique_name_index(Tag),
+        )
+
+    # Tests the Item list uses the per-User unique name index
+    def test_item_list_plan(self):
+        self.assertUsesIndexes(
+            self.viewset_queryset(views.ItemViewSet),
+            self.unique_name_index(Item),
+        )
+
+    # Returns the index expected to serve the list of a model's rows in use.
+    # SQLite, without statistics, reads the usage index instead of the
+    # partial one.
+    def assigned_index(self, model):
+        name = model._meta.model_name
+        if connection.vendor == 'postgresql':
+            return f'base_{name}_assigned_idx'
+        return f'base_{name}_usage_idx'
+
+    # Tests the assigned Tags filter reads the index of Tags in use
+    def test_assigned_tags_plan(self):
+        self.assertUsesIndexes(
+            self.viewset_queryset(views.TagViewSet, {'assigned_only': 1}),
+            self.assigned_index(Tag),
+        )
+
+    # Tests the assigned Items filter reads the index of Items in use
+    def test_assigned_items_plan(self):
+        self.assertUsesIndexes(
+            self.viewset_queryset(views.ItemViewSet, {'assigned_only': 1}),
+            self.assigned_index(Item),
+        )
+
+    # Tests the Tag and Item lists ordered by usage read the usage index
+    def test_usage_ordering_plan(self):
+        for viewset, index in ((views.TagViewSet, 'base_tag_usage_idx'),
+                               (views.ItemViewSet, 'base_item_usage_idx')):
+            self.assertUsesIndexes(
+                self.viewset_queryset(viewset, {'ordering': '-usage'}),
+                index,
+            )
+
+    # Tests the Collection list uses the per-User id index
+    def test_collection_list_plan(self):
+        self.assertUsesIndexes(
+            self.viewset_queryset(views.CollectionViewSet),
+            'base_collection_user_id_idx',
+        )
+
+    # Tests each Collection ordering, with and without a range filter on
+    # its field, is read from the matching per-User index
+    def test_collection_ordering_plan(self):
+        for ordering, params, index in (
+            ('-floor_price', {'floor_price_min': '1.00'},
+             'base_collection_price_idx'),
+            ('items_in_collection', {'items_max': '20'},
+             'base_collection_size_idx'),
+            ('-title', {}, 'base_collection_title_idx'),
+        ):
+            for direction in ('', '-'):
+                ordering = direction + ordering.lstrip('-')
+                for filters in ({}, params):
+                    self.assertUsesIndexes(
+                        self.viewset_queryset(
+                            views.CollectionViewSet,
+                            {'ordering': ordering, **filters},
+                        ),
+                        index,
+                    )
+
+    # Tests a page after a cursor starts the index scan at the cursor
+    def test_collection_seek_plan(self):
+        ordering = views.CollectionViewSet.orderings['-floor_price']
+        queryset = Collection.objects.filter(user=self.user).order_by(
+            *ordering,
+        ).filter(KeysetPagination()._seek(ordering, ['1.00', 1]))
+        plan = self.explain(queryset[:101])
+        self.assertUsesIndexes(queryset[:101], 'base_collection_price_idx')
+        self.assertRegex(plan, r'\(user_id = \d+\) AND \(floor_price <=|'
+                               r'user_id=\? AND floor_price<')
+
+    # Tests the Tag and Item filters, in both modes, read the links through
+    # an index. Which indexes "all" takes depends on the database, as the
+    # grouped links may be read before or after the Collections.
+    def test_collection_filter_plan(self):
+        tags = Tag.objects.values_list('id', flat=True)[:100]
+        items = Item.objects.values_list('id', flat=True)[:100]
+        for mode, indexes in (
+            ('any', ('base_collection_user_id_idx',)),
+            ('all', ()),
+        ):
+            self.assertUsesIndexes(
+                self.viewset_queryset(
+                    views.CollectionViewSet,
+                    {
+                        'tags': ','.join(str(pk) for pk in tags),
+                        'items': ','.join(str(pk) for pk in items),
+                        'tags_mode': mode,
+                        'items_mode': mode,
+                    },
+                ),
+                *indexes,
+            )
+
+    # Tests looking up the Collections of a Tag uses the reverse index
+    def test_tag_collections_plan(self):
+        tag = Tag.objects.get(name='Pins')
+        through = Collection.tags.through.objects.filter(tag=tag)
+        self.assertUsesIndexes(
+            through.values_list('collection_id', flat=True),
+            'base_collection_tags_tag_idx',
+        )
+
+    # Tests looking up the Collections of an Item uses the reverse index
+    def test_item_collections_plan(self):
+        item = Item.objects.get(name='DeadAvatar001')
+        through = Collection.items.through.objects.filter(item=item)
+        self.assertUsesIndexes(
+            through.values_list('collection_id', flat=True),
+            'base_collection_items_item_idx',
+        )
@@ -0,0 +1,112 @@
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from unittest.mock import patch
+from django.test import RequestFactory, TestCase, override_settings
+from PIL import Image
+from collection import resize
+
+
+# Tests serving Collection images resized on request
+class ResizeTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        media = override_settings(MEDIA_ROOT=self.root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.name = self.sample_image('JPEG', 'jpg')
+
+    # Writes an 800x400 image where collection_image_file_path would
+    def sample_image(self, image_format, extension):
+        name = f'uploads/collection/{uuid.uuid4()}.{extension}'
+        path = os.path.join(self.root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        Image.new('RGB', (800, 400), 'red').save(path, image_format)
+        return name
+
+    def get(self, size, name=None, **headers):
+        return self.client.get(
+            f'/media/resize/{size}/{name or self.name}', **headers,
+        )
+
+    # Returns the decoded image of a response
+    def image(self, res):
+        return Image.open(io.BytesIO(b''.join(res.streaming_content)))
+
+    # Tests a copy is rendered to fit the box once and then served from
+    # the cache, as WebP to clients that accept it
+    def test_serve_resized(self):
+        with patch('collection.resize.render', wraps=resize.render) as r:
+            res = self.get('320x320', HTTP_ACCEPT='image/webp,*/*')
+            again = self.get('320x320', HTTP_ACCEPT='image/webp,*/*')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(r.call_count, 1)
+        image = self.image(res)
+        self.assertEqual((image.format, image.size), ('WEBP', (320, 160)))
+        self.assertEqual(res['Content-Type'], 'image/webp')
+        self.assertEqual(res['Vary'], 'Accept')
+        self.assertIn('immutable', res['Cache-Control'])
+        self.assertEqual(again['ETag'], res['ETag'])
+
+    # Tests clients without WebP get the format of the original
+    def test_serve_resized_fallback_formats(self):
+        self.assertEqual(self.image(self.get('64x64')).format, 'JPEG')
+        png = self.sample_image('PNG', 'png')
+        self.assertEqual(self.image(self.get('64x64', png)).format, 'PNG')
+
+    # Tests only allowed sizes of uploaded originals are served
+    def test_serve_resized_not_found(self):
+        self.assertEqual(self.get('300x300').status_code, 404)
+        self.assertEqual(self.get('64x64', 'uploads/x.jpg').status_code, 404)
+        missing = f'uploads/collection/{uuid.uuid4()}.jpg'
+        self.assertEqual(self.get('64x64', missing).status_code, 404)
+        res = self.client.get('/media/resize/64x64/../../etc/passwd')
+        self.assertEqual(res.status_code, 404)
+
+    # Tests concurrent requests for the same copy render it once
+    def test_concurrent_requests_coalesce(self):
+        factory = RequestFactory()
+        statuses = []
+        render = resize.render
+
+        def slow_render(*args):
+            time.sleep(0.2)
+            return render(*args)
+
+        def request():
+            res = resize.serve_resized(
+                factory.get('/'), 128, 128, self.name,
+            )
+            statuses.append(res.status_code)
+            res.close()
+
+        with patch('collection.resize.render', side_effect=slow_render) as r:
+            threads = [threading.Thread(target=request) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(r.call_count, 1)
+        self.assertEqual(statuses, [200] * 8)
+
+    # Tests the least recently used copies are deleted once the cache goes
+    # over its size, and served copies keep their modification time
+    def test_cache_evicts_least_recently_used(self):
+        cache = resize.ResizeCache({**resize.DEFAULTS, 'MAX_BYTES': 250,
+                                    'TRIM_TO': 0.8, 'TOUCH_INTERVAL': 0})
+        paths = [os.path.join(cache.root, f'{i}.webp') for i in range(3)]
+        for i, path in enumerate(paths[:2]):
+            cache.write(path, b'x' * 100)
+            os.utime(path, (1000 + i, 1000))
+        self.assertTrue(cache.touch(paths[0]))
+        self.assertEqual(os.stat(paths[0]).st_mtime, 1000)
+        cache.write(paths[2], b'x' * 100)
+        self.assertEqual(
+            [os.path.exists(path) for path in paths], [True, False, True],
+        )
+        self.assertEqual(cache.size, 200)
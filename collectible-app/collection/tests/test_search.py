@@ -0,0 +1,109 @@
+from django.contrib.auth import get_user_model as gum
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from base.models import Collection, Item, Tag
+from base.search import search
+
+COLLECTIONS_URL = reverse('collection:collection-list')
+
+
+# Tests searching Collections by their title, link and linked names
+class CollectionSearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = gum().objects.create_user(
+            'loremipsum@gmail.com',
+            'Tbin5041',
+        )
+        self.client.force_authenticate(self.user)
+        self.tag = Tag.objects.create(user=self.user, name='Vintage')
+        self.item = Item.objects.create(user=self.user, name='Skull')
+        self.avatar = self.collection('Dead Avatar Project', 'deadavatar.io')
+        self.apes = self.collection('Bored Apes', 'boredapes.io')
+        self.apes.tags.add(self.tag)
+        self.apes.items.add(self.item)
+        self.pins = self.collection('Pins', 'pins.io')
+        self.pins.tags.add(self.tag)
+
+    def collection(self, title, link):
+        return Collection.objects.create(
+            user=self.user,
+            title=title,
+            items_in_collection=10,
+            floor_price='1.00',
+            link=link,
+        )
+
+    # Returns the ids of the Collections a search lists
+    def search_ids(self, text, **params):
+        res = self.client.get(COLLECTIONS_URL, {'search': text, **params})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [row['id'] for row in res.data['results']]
+
+    # Tests titles, links and the names of Tags and Items are searched,
+    # with every word required
+    def test_search_fields(self):
+        self.assertEqual(self.search_ids('avatar'), [self.avatar.id])
+        self.assertEqual(self.search_ids('boredapes.io'), [self.apes.id])
+        self.assertEqual(self.search_ids('skull'), [self.apes.id])
+        self.assertEqual(self.search_ids('vintage bored'), [self.apes.id])
+        self.assertEqual(self.search_ids('nothing'), [])
+
+    # Tests title matches rank above matches of linked names, each
+    # Collection listed once
+    def test_search_ranked(self):
+        tagged = Tag.objects.create(user=self.user, name='Pins')
+        self.apes.tags.add(tagged)
+        self.apes.items.add(Item.objects.create(user=self.user, name='Pins'))
+        self.assertEqual(self.search_ids('pins'), [self.pins.id, self.apes.id])
+
+    # Tests the results follow renames, removed links and deleted Tags
+    def test_search_follows_changes(self):
+        self.tag.name = 'Modern'
+        self.tag.save()
+        self.assertEqual(self.search_ids('vintage'), [])
+        self.assertEqual(self.search_ids('modern'),
+                         [self.pins.id, self.apes.id])
+        self.pins.tags.clear()
+        self.assertEqual(self.search_ids('modern'), [self.apes.id])
+        self.tag.delete()
+        self.assertEqual(self.search_ids('modern'), [])
+        self.item.collection_set.clear()
+        self.assertEqual(self.search_ids('skull'), [])
+        self.avatar.title = 'Living Avatar'
+        self.avatar.save()
+        self.assertEqual(self.search_ids('living'), [self.avatar.id])
+
+    # Tests ranked results page through the keyset cursor, and another
+    # ordering can be asked for
+    def test_search_pages(self):
+        seen = []
+        url, params = COLLECTIONS_URL, {'search': 'vintage', 'page_size': 1}
+        while url:
+            res = self.client.get(url, params)
+            seen += [row['id'] for row in res.data['results']]
+            url, params = res.data['next'], None
+        self.assertEqual(seen, [self.pins.id, self.apes.id])
+        self.assertEqual(self.search_ids('vintage', ordering='title'),
+                         [self.apes.id, self.pins.id])
+
+    # Tests overly long searches are answered with a 400
+    def test_search_too_long(self):
+        res = self.client.get(COLLECTIONS_URL, {'search': 'a' * 201})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('search', res.data)
+
+    # Tests the stored vector of a Collection is read through its GIN index
+    def test_search_plan(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest('Search vectors are only kept on PostgreSQL')
+        self.assertTrue(
+            Collection.objects.filter(search_vector__isnull=False).exists()
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = search(Collection.objects.all(), 'avatar').explain()
+        self.assertIn('base_collection_search_idx', plan)
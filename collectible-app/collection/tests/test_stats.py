@@ -0,0 +1,154 @@
+from decimal import Decimal
+from django.contrib.auth import get_user_model as gum
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from base.models import Collection, Portfolio, Tag, TagPortfolio
+
+STATS_URL = reverse('collection:stats-list')
+
+
+# Tests the portfolio statistics of a User's Collections
+class PortfolioStatsTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = gum().objects.create_user(
+            'loremipsum@gmail.com',
+            'Tbin5041',
+        )
+        self.client.force_authenticate(self.user)
+        self.vintage = Tag.objects.create(user=self.user, name='Vintage')
+        self.modern = Tag.objects.create(user=self.user, name='Modern')
+        self.apes = self.collection('Bored Apes', 10, '2.50')
+        self.apes.tags.add(self.vintage, self.modern)
+        self.punks = self.collection('Punks', 4, '10.00')
+        self.punks.tags.add(self.modern)
+        self.collection('Pins', 3, '1.00')
+
+    def collection(self, title, items, floor_price):
+        return Collection.objects.create(
+            user=self.user,
+            title=title,
+            items_in_collection=items,
+            floor_price=floor_price,
+        )
+
+    def stats(self):
+        res = self.client.get(STATS_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.data
+
+    # Checks the statistics kept along the way match those rebuilt from
+    # the Collections
+    def assertMatchesRebuild(self):
+        kept = self.stats()
+        Portfolio.objects.rebuild()
+        TagPortfolio.objects.rebuild()
+        self.assertEqual(kept, self.stats())
+        return kept
+
+    # Tests the totals and the breakdown by Tag, worth most first
+    def test_stats(self):
+        with self.assertNumQueries(2):
+            data = self.stats()
+        self.assertEqual(data, {
+            'collection_count': 3,
+            'items_in_collections': 17,
+            'value': '68.00',
+            'tags': [
+                {'id': self.modern.id, 'name': 'Modern',
+                 'collection_count': 2, 'items_in_collections': 14,
+                 'value': '65.00'},
+                {'id': self.vintage.id, 'name': 'Vintage',
+                 'collection_count': 1, 'items_in_collections': 10,
+                 'value': '25.00'},
+            ],
+        })
+        self.assertMatchesRebuild()
+
+    # Tests the statistics follow changes to Collections and their Tags,
+    # from either side of the relation
+    def test_stats_follow_changes(self):
+        self.apes.floor_price = Decimal('3.00')
+        self.apes.save()
+        punks = Collection.objects.get(pk=self.punks.pk)
+        punks.items_in_collection = 5
+        punks.save()
+        self.assertEqual(self.assertMatchesRebuild()['value'], '83.00')
+        self.apes.tags.remove(self.modern)
+        self.vintage.collection_set.add(self.punks)
+        self.assertEqual(
+            [row['value'] for row in self.assertMatchesRebuild()['tags']],
+            ['80.00', '50.00'],
+        )
+        self.modern.collection_set.clear()
+        self.vintage.collection_set.remove(self.apes)
+        data = self.assertMatchesRebuild()
+        self.assertEqual([row['name'] for row in data['tags']], ['Vintage'])
+        Collection.objects.filter(pk=self.punks.pk).delete()
+        self.vintage.delete()
+        self.assertEqual(self.assertMatchesRebuild(), {
+            'collection_count': 2,
+            'items_in_collections': 13,
+            'value': '33.00',
+            'tags': [],
+        })
+
+    # Tests Collections created and updated through the API are counted
+    def test_stats_through_api(self):
+        res = self.client.post(
+            reverse('collection:collection-list'),
+            {'title': 'Azuki', 'items_in_collection': 2,
+             'floor_price': '5.00', 'tags': [self.vintage.id]},
+        )
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.client.patch(
+            reverse('collection:collection-detail', args=[res.data['id']]),
+            {'floor_price': '6.00'},
+        )
+        data = self.assertMatchesRebuild()
+        self.assertEqual(data['value'], '80.00')
+        self.assertEqual(data['tags'][1]['value'], '37.00')
+
+    # Tests a User without Collections gets empty statistics, and never
+    # those of other Users
+    def test_stats_empty(self):
+        other = gum().objects.create_user('other@gmail.com', 'Tbin5041')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.stats(), {
+            'collection_count': 0,
+            'items_in_collections': 0,
+            'value': '0.00',
+            'tags': [],
+        })
+
+    # Tests Collections taken out of a summary never leave a negative count,
+    # whether the summary existed yet or not
+    def test_counts_stay_positive(self):
+        other = gum().objects.create_user('other@gmail.com', 'Tbin5041')
+        taken = (-2, -3, Decimal('-4.00'))
+        Portfolio.objects.add({self.user.pk: (-5, 0, 0), other.pk: taken})
+        self.assertEqual(
+            list(Portfolio.objects.order_by('pk').values_list(
+                'collection_count', 'items_in_collections', 'value',
+            )),
+            [(0, 17, Decimal('68.00')), (0, -3, Decimal('-4.00'))],
+        )
+
+    # Tests Collections are updated and deleted through the API while their
+    # row is locked, so concurrent writes add up in the statistics
+    def test_writes_lock_collection(self):
+        if not connection.features.has_select_for_update:
+            self.skipTest('Rows cannot be locked')
+        url = reverse('collection:collection-detail', args=[self.punks.id])
+        for method, data in (('patch', {'floor_price': '6.00'}),
+                             ('delete', None)):
+            with CaptureQueriesContext(connection) as queries:
+                getattr(self.client, method)(url, data)
+            self.assertTrue(any(
+                'FOR UPDATE' in query['sql'] for query in queries
+            ))
+        self.assertEqual(self.assertMatchesRebuild()['value'], '28.00')
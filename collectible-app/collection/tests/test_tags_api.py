@@ -1,4 +1,6 @@
 from django.contrib.auth import get_user_model as gum
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.test import TestCase
 from rest_framework import status
@@ -41,7 +43,7 @@ class PrivateTagsAPITests(TestCase):
         tags = Tag.objects.all().order_by('-name')
         serializer = TagSerializer(tags, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     # Tests that the Tags returned are for the authenticated User
     def test_tags_limited_to_user(self):
@@ -50,8 +52,8 @@ class PrivateTagsAPITests(TestCase):
         tag = Tag.objects.create(user=self.user, name='Warhammer')
         res = self.client.get(TAGS_URL)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data[0]['name'], tag.name)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'][0]['name'], tag.name)
 
     # Tests creation of a new Tag
     def test_create_tag_successful(self):
@@ -81,11 +83,12 @@ class PrivateTagsAPITests(TestCase):
             user=self.user,
         )
         collection.tags.add(tag1)
+        tag1.refresh_from_db()
         res = self.client.get(TAGS_URL, {'assigned_only': 1})
         serializer1 = TagSerializer(tag1)
         serializer2 = TagSerializer(tag2)
-        self.assertIn(serializer1.data, res.data)
-        self.assertNotIn(serializer2.data, res.data)
+        self.assertIn(serializer1.data, res.data['results'])
+        self.assertNotIn(serializer2.data, res.data['results'])
 
     # Tests that filtering Tags by assigned will return unique items
     def test_retrieve_tags_assigned_unique(self):
@@ -106,4 +109,81 @@ class PrivateTagsAPITests(TestCase):
         )
         collection2.tags.add(tag)
         res = self.client.get(TAGS_URL, {'assigned_only': 1})
-        self.assertEqual(len(res.data), 1)
+        self.assertEqual(len(res.data['results']), 1)
+
+    # Tests ordering Tags by the number of Collections using them
+    def test_retrieve_tags_ordered_by_usage(self):
+        tags = [Tag.objects.create(user=self.user, name=name)
+                for name in ('Favorite', 'Owned', 'Pins')]
+        for i in range(3):
+            collection = Collection.objects.create(
+                title=f'Pin Collection {i}',
+                items_in_collection=10,
+                floor_price=50.00,
+                user=self.user,
+            )
+            collection.tags.add(*tags[i:])
+        res = self.client.get(TAGS_URL, {'ordering': '-usage'})
+        self.assertEqual(
+            [(row['name'], row['collection_count'])
+             for row in res.data['results']],
+            [('Pins', 3), ('Owned', 2), ('Favorite', 1)],
+        )
+        res = self.client.get(TAGS_URL, {'ordering': 'usage',
+                                         'page_size': 2})
+        self.assertEqual([row['name'] for row in res.data['results']],
+                         ['Favorite', 'Owned'])
+        res = self.client.get(res.data['next'])
+        self.assertEqual([row['name'] for row in res.data['results']],
+                         ['Pins'])
+
+    # Tests an unknown ordering is rejected
+    def test_retrieve_tags_unknown_ordering(self):
+        res = self.client.get(TAGS_URL, {'ordering': 'popularity'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('ordering', res.data)
+
+    # Tests that a second Tag with the same name is rejected
+    def test_create_tag_duplicate_name(self):
+        Tag.objects.create(user=self.user, name='Pins')
+        res = self.client.post(TAGS_URL, {'name': 'Pins'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 1)
+
+    # Tests creating many Tags in one request
+    def test_bulk_create_tags(self):
+        existing = Tag.objects.create(user=self.user, name='Pins')
+        payload = [{'name': 'Pins'}, {'name': 'bayc'}, {'name': 'Pins'}]
+        res = self.client.post(TAGS_URL, payload, format='json')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([row['name'] for row in res.data],
+                         ['Pins', 'bayc', 'Pins'])
+        self.assertEqual(res.data[0]['id'], existing.id)
+        self.assertEqual(res.data[2]['id'], existing.id)
+        created = Tag.objects.get(user=self.user, name='bayc')
+        self.assertEqual(res.data[1]['id'], created.id)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+
+    # Tests that bulk validation errors are reported for each element
+    def test_bulk_create_tags_invalid(self):
+        payload = [{'name': 'Pins'}, {'name': ''}, {}]
+        res = self.client.post(TAGS_URL, payload, format='json')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertNotIn(0, res.data)
+        self.assertIn('name', res.data[1])
+        self.assertIn('name', res.data[2])
+        self.assertFalse(Tag.objects.filter(user=self.user).exists())
+
+    # Tests that a large bulk request runs a fixed number of queries
+    def test_bulk_create_tags_query_count(self):
+        payload = [{'name': f'Tag{i}'} for i in range(10000)]
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.post(TAGS_URL, payload, format='json')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(res.data), 10000)
+        # SQLite takes at most 333 rows of three columns per INSERT, and the
+        # ids are then read back 1000 names at a time
+        self.assertLess(len(ctx.captured_queries), 50)
+        self.assertEqual(
+            Tag.objects.filter(user=self.user).count(), 10000,
+        )
@@ -0,0 +1,230 @@
+import hashlib
+import io
+import os
+import tempfile
+from unittest.mock import patch
+from django.contrib.auth import get_user_model as gum
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient
+from base import derivatives
+from base.models import Collection, StoredImage
+from collection.tests.memory import PeakMemoryMixin
+from collection.uploads import ImageUploadHandler, UploadTooLarge
+
+MiB = 2 ** 20
+
+
+# Returns a Collection's image upload URL
+def image_upload_url(collection_id):
+    return reverse('collection:collection-upload-image', args=[collection_id])
+
+
+# Returns an image of the given size encoded in `image_format`. Flat colour
+# keeps even huge images small once encoded.
+def encoded_image(size, image_format='PNG', mode='RGB'):
+    buffer = io.BytesIO()
+    Image.new(mode, size).save(buffer, image_format)
+    return buffer.getvalue()
+
+
+# Tests the limits and the memory use of image uploads
+class ImageUploadTests(PeakMemoryMixin, TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = gum().objects.create_user(
+            'loremipsum@gmail.com',
+            'Tbin5041',
+        )
+        self.client.force_authenticate(self.user)
+        self.collection = Collection.objects.create(
+            user=self.user,
+            title='Dead Avatar Project',
+            items_in_collection=10000,
+            floor_price=0.50,
+        )
+
+    def tearDown(self):
+        self.collection.refresh_from_db()
+        self.collection.image.delete()
+
+    # Posts `content` as the Collection's image
+    def upload(self, content, name='image.png'):
+        return self.client.post(
+            image_upload_url(self.collection.id),
+            {'image': SimpleUploadedFile(name, content)},
+            format='multipart',
+        )
+
+    # Tests a valid JPEG is accepted
+    def test_upload_jpeg(self):
+        res = self.upload(encoded_image((640, 480), 'JPEG'), 'image.jpg')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    # Tests an image is stored with the extension of its format, whatever
+    # name it was sent with, and served as an image
+    def test_upload_named_by_format(self):
+        content = encoded_image((10, 10)) + b'<script>alert(1)</script>'
+        res = self.upload(content, 'x.html')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.collection.refresh_from_db()
+        name = self.collection.image.name
+        self.assertTrue(name.endswith('.png'), name)
+        res = self.client.get(f'/media/{name}')
+        self.assertEqual(res['Content-Type'], 'image/png')
+        b''.join(res.streaming_content)
+
+    # Tests an image with too many pixels is turned away from its header,
+    # without its pixels ever being decoded
+    def test_upload_too_many_pixels(self):
+        content = encoded_image((8000, 7000), mode='1')
+        with self.assertPeakMemory(16 * MiB):
+            res = self.upload(content)
+        self.assertEqual(
+            res.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        )
+        self.assertIn('56000000', res.data['detail'])
+
+    # Tests a large image within the limits is validated at reduced scale
+    def test_upload_large_jpeg_memory(self):
+        content = encoded_image((6000, 6000), 'JPEG')
+        with self.assertPeakMemory(32 * MiB):
+            res = self.upload(content, 'image.jpg')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    # Tests derivatives of a large JPEG are decoded at reduced scale
+    def test_derivatives_large_jpeg_memory(self):
+        content = encoded_image((6000, 6000), 'JPEG')
+        self.collection.image.save('image.jpg', io.BytesIO(content))
+        with self.assertPeakMemory(32 * MiB):
+            derivatives.render_derivatives(self.collection.image.name)
+
+    # Tests a body announcing more than MAX_BYTES is refused unread
+    @override_settings(IMAGE_UPLOADS={'MAX_BYTES': MiB})
+    def test_upload_too_many_bytes(self):
+        res = self.upload(b'\0' * (2 * MiB))
+        self.assertEqual(
+            res.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        )
+
+    # Tests files in formats that are not allowed are refused
+    def test_upload_format_not_allowed(self):
+        res = self.upload(encoded_image((10, 10), 'BMP'), 'image.bmp')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('image', res.data)
+
+    # Tests a truncated image is refused
+    def test_upload_truncated_image(self):
+        content = encoded_image((640, 480), 'JPEG')
+        res = self.upload(content[:len(content) // 2], 'image.jpg')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('image', res.data)
+
+
+# Tests uploads of content that is already stored
+@override_settings(
+    MEDIA_ROOT=tempfile.mkdtemp(),
+    IMAGE_DERIVATIVES={'WORKERS': 0},
+)
+class DuplicateUploadTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = gum().objects.create_user(
+            'loremipsum@gmail.com',
+            'Tbin5041',
+        )
+        self.client.force_authenticate(self.user)
+        self.collections = [
+            Collection.objects.create(
+                user=self.user,
+                title=f'Collection{i}',
+                items_in_collection=10,
+                floor_price=1.00,
+            )
+            for i in range(2)
+        ]
+        self.content = encoded_image((400, 300), 'JPEG')
+
+    # Uploads the same image to the i-th Collection
+    def upload(self, i):
+        return self.client.post(
+            image_upload_url(self.collections[i].id),
+            {'image': SimpleUploadedFile('image.jpg', self.content)},
+            format='multipart',
+        )
+
+    # Tests a second upload of the same bytes shares the stored file, is
+    # not decoded again and gets the derivatives generated for the first
+    @patch('base.derivatives.render_derivatives',
+           wraps=derivatives.render_derivatives)
+    def test_duplicate_upload_short_circuits(self, render):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.upload(0)
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(render.call_count, 1)
+
+        with patch('collection.fields.verify_image') as verify, \
+                self.captureOnCommitCallbacks(execute=True):
+            second = self.upload(1)
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        verify.assert_not_called()
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(second.data['image'], first.data['image'])
+        self.assertIn('thumb', second.data['image_derivatives'])
+
+        digest = hashlib.sha256(self.content).hexdigest()
+        stored = StoredImage.objects.get(sha256=digest)
+        self.assertEqual(stored.references, 2)
+        self.assertIn('thumb', stored.derivatives)
+
+
+# Tests ImageUploadHandler on its own, fed one chunk at a time
+class ImageUploadHandlerTests(TestCase):
+    # Returns a handler that has started receiving a file
+    def handler(self, **limits):
+        handler = ImageUploadHandler(limits={
+            'MAX_BYTES': MiB, 'MAX_PIXELS': 10 ** 6, 'FORMATS': ('PNG',),
+            **limits,
+        })
+        handler.new_file('image', 'image.png', 'image/png', None)
+        return handler
+
+    # Feeds `content` to the handler in its chunk size
+    def feed(self, handler, content):
+        size = handler.chunk_size
+        for start in range(0, len(content), size):
+            handler.receive_data_chunk(content[start:start + size], start)
+        return handler.file_complete(len(content))
+
+    # Tests the header is read once and kept on the uploaded file
+    def test_image_info(self):
+        content = encoded_image((300, 200))
+        file = self.feed(self.handler(), content)
+        self.assertEqual(file.image_info, ('PNG', (300, 200)))
+        self.assertEqual(file.sha256, hashlib.sha256(content).hexdigest())
+        file.close()
+
+    # Tests a stream going over MAX_BYTES is stopped and its file removed
+    def test_stops_at_max_bytes(self):
+        handler = self.handler(MAX_BYTES=256 * 1024)
+        content = encoded_image((300, 200)) + b'\0' * MiB
+        path = None
+        with self.assertRaises(UploadTooLarge):
+            for start in range(0, len(content), handler.chunk_size):
+                path = handler.file.temporary_file_path()
+                handler.receive_data_chunk(
+                    content[start:start + handler.chunk_size], start,
+                )
+        self.assertLessEqual(handler.received, 256 * 1024 + 64 * 1024)
+        self.assertFalse(os.path.exists(path))
+
+    # Tests bytes that are not an image are refused once the header limit
+    # is reached, keyed by the field name
+    def test_not_an_image(self):
+        with self.assertRaises(ValidationError) as ctx:
+            self.feed(self.handler(), b'\1' * (512 * 1024))
+        self.assertIn('image', ctx.exception.detail)
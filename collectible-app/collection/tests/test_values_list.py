@@ -0,0 +1,84 @@
+from decimal import Decimal
+from django.contrib.auth import get_user_model as gum
+from django.db.models import Prefetch
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from base.models import Collection, Item, Tag
+from collection.fields import DerivativesField
+from collection.serializers import CollectionSerializer, TagSerializer
+
+COLLECTIONS_URL = reverse('collection:collection-list')
+TAGS_URL = reverse('collection:tag-list')
+
+
+# Tests lists rendered from .values() rows match ModelSerializer exactly
+class ValuesListTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = gum().objects.create_user(
+            'loremipsum@gmail.com',
+            'Tbin5041',
+        )
+        self.client.force_authenticate(self.user)
+        items = [Item.objects.create(user=self.user, name=f'Item{i}')
+                 for i in range(4)]
+        tags = [Tag.objects.create(user=self.user, name=f'Tag{i}')
+                for i in range(3)]
+        for i, price in enumerate(('0.50', '12', '999999.99')):
+            collection = Collection.objects.create(
+                user=self.user,
+                title=f'Collection "{i}" ✓',
+                items_in_collection=i,
+                floor_price=Decimal(price),
+                link='https://example.com/?a=1&b=2' if i else '',
+                image_derivatives={'thumb': {
+                    'webp': f'uploads/collection/{i}_thumb.webp',
+                    'jpg': f'uploads/collection/{i}_thumb.jpg',
+                }} if i % 2 else {},
+            )
+            collection.items.add(*items[i:][::-1])
+            collection.tags.add(*tags[:i])
+
+    # Renders the first page of a list the way ListModelMixin would
+    def expected(self, serializer_class, queryset, request):
+        data = serializer_class(
+            queryset, many=True, context={'request': request},
+        ).data
+        return JSONRenderer().render({
+            'next': None, 'previous': None, 'results': data,
+        })
+
+    # Tests the Collection list is byte for byte what ModelSerializer gives
+    def test_collection_list_matches(self):
+        res = self.client.get(COLLECTIONS_URL, HTTP_ACCEPT='application/json')
+        collections = Collection.objects.order_by('-id').prefetch_related(
+            Prefetch('items', queryset=Item.objects.order_by('id')),
+            Prefetch('tags', queryset=Tag.objects.order_by('id')),
+        )
+        self.assertEqual(
+            res.content,
+            self.expected(CollectionSerializer, collections, res.wsgi_request),
+        )
+
+    # Tests the Tag list is byte for byte what ModelSerializer gives
+    def test_tag_list_matches(self):
+        res = self.client.get(TAGS_URL, HTTP_ACCEPT='application/json')
+        tags = Tag.objects.order_by('-name', '-id')
+        self.assertEqual(
+            res.content,
+            self.expected(TagSerializer, tags, res.wsgi_request),
+        )
+
+    # Tests derivative URLs built from the shared prefix match the ones
+    # built one at a time
+    def test_derivative_urls(self):
+        field = DerivativesField()
+        request = RequestFactory().get('/')
+        field._context = {'request': request}
+        value = {'thumb': {'webp': 'uploads/collection/a b_thumb.webp'}}
+        self.assertEqual(
+            field.to_representation(value)['thumb']['webp'],
+            field._url('uploads/collection/a b_thumb.webp'),
+        )
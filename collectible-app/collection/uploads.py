@@ -0,0 +1,175 @@
+import hashlib
+import io
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.utils.translation import gettext_lazy as _
+from PIL import Image
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+DEFAULTS = {
+    'MAX_BYTES': 20 * 2 ** 20,
+    'MAX_PIXELS': 40_000_000,
+    'FORMATS': ('JPEG', 'PNG', 'WEBP', 'GIF'),
+}
+
+# Extensions images are stored with, by the format their header shows, so
+# the name a client sends never decides how a file is served
+EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'WEBP': '.webp', 'GIF': '.gif'}
+
+INVALID_IMAGE = _(
+    'Upload a valid image. The file you uploaded was either not an image '
+    'or a corrupted image.'
+)
+
+
+# Returns the IMAGE_UPLOADS setting merged over the defaults
+def get_limits():
+    return {**DEFAULTS, **getattr(settings, 'IMAGE_UPLOADS', {})}
+
+
+# Raised when an upload is over the byte or pixel limits
+class UploadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = _('The uploaded image is too large.')
+    default_code = 'upload_too_large'
+
+
+# Reads the format and size of an image from its header alone, without
+# decoding any pixels. Returns None if `data` is too short to tell yet.
+def inspect_header(data, limits):
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image_format, size = image.format, image.size
+    except Image.DecompressionBombError:
+        raise UploadTooLarge(
+            _('Images can have at most {max} pixels.').format(
+                max=limits['MAX_PIXELS'],
+            )
+        )
+    except (OSError, SyntaxError, ValueError, EOFError):
+        return None
+    check_image(image_format, size, limits)
+    return image_format, size
+
+
+# Returns the extension of an image format, falling back to the first one
+# Pillow registers for formats added to FORMATS
+def format_extension(image_format):
+    if image_format in EXTENSIONS:
+        return EXTENSIONS[image_format]
+    for extension, name in Image.registered_extensions().items():
+        if name == image_format:
+            return extension
+    return ''
+
+
+# Rejects an image whose format or pixel count is not allowed
+def check_image(image_format, size, limits):
+    if image_format not in limits['FORMATS']:
+        raise ValidationError(
+            _('Images must be one of {formats}.').format(
+                formats=', '.join(limits['FORMATS']),
+            )
+        )
+    width, height = size
+    if width * height > limits['MAX_PIXELS']:
+        raise UploadTooLarge(
+            _('Images can have at most {max} pixels, this one has '
+              '{pixels}.').format(
+                max=limits['MAX_PIXELS'], pixels=width * height,
+            )
+        )
+
+
+# Checks that an image decodes, as cheaply as the format allows. JPEGs are
+# decoded at 1/8 scale through draft mode, other formats are only walked
+# through by verify(), so no full size bitmap is ever allocated.
+def verify_image(file):
+    file.seek(0)
+    try:
+        with Image.open(file) as image:
+            if image.format == 'JPEG':
+                image.draft('RGB', (1, 1))
+                image.load()
+            else:
+                image.verify()
+    except (OSError, SyntaxError, ValueError, EOFError,
+            Image.DecompressionBombError):
+        raise ValidationError(INVALID_IMAGE)
+    finally:
+        file.seek(0)
+
+
+# Streams uploaded files to a temporary file in fixed chunks and rejects
+# them as soon as they go over MAX_BYTES, or as soon as their header shows
+# a format or pixel count that is not allowed, before the rest of the body
+# is read. What the header showed is kept on the file as `image_info`, and
+# the SHA-256 of the content, hashed chunk by chunk on the way in, as
+# `sha256`, so neither validation nor storage has to read it again.
+class ImageUploadHandler(TemporaryFileUploadHandler):
+    chunk_size = 64 * 2 ** 10
+    # Longest header read while trying to identify the image
+    max_header_bytes = 256 * 2 ** 10
+    # Room left in the body for the multipart boundaries and other fields
+    max_overhead_bytes = 64 * 2 ** 10
+
+    def __init__(self, request=None, limits=None):
+        super().__init__(request)
+        self.limits = limits or get_limits()
+
+    # Turns away a body that announces it is too large before reading it
+    def handle_raw_input(self, input_data, META, content_length, boundary,
+                         encoding=None):
+        if content_length > self.limits['MAX_BYTES'] + \
+                self.max_overhead_bytes:
+            raise UploadTooLarge(self._too_many_bytes())
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+        self.header = b''
+        self.info = None
+        self.hasher = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        try:
+            if self.received > self.limits['MAX_BYTES']:
+                raise UploadTooLarge(self._too_many_bytes())
+            if self.info is None:
+                self._inspect(raw_data, final=False)
+        except UploadTooLarge:
+            self.upload_interrupted()
+            raise
+        except ValidationError as exc:
+            self.upload_interrupted()
+            raise ValidationError({self.field_name: exc.detail})
+        self.hasher.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        try:
+            if self.info is None:
+                self._inspect(b'', final=True)
+        except ValidationError as exc:
+            self.upload_interrupted()
+            raise ValidationError({self.field_name: exc.detail})
+        file = super().file_complete(file_size)
+        file.image_info = self.info
+        file.sha256 = self.hasher.hexdigest()
+        return file
+
+    # Tries to read the header from the bytes received so far
+    def _inspect(self, raw_data, final):
+        self.header += raw_data[:self.max_header_bytes - len(self.header)]
+        self.info = inspect_header(self.header, self.limits)
+        if self.info is not None:
+            self.header = b''
+        elif final or len(self.header) >= self.max_header_bytes:
+            raise ValidationError(INVALID_IMAGE)
+
+    def _too_many_bytes(self):
+        return _('Images can be at most {max} bytes.').format(
+            max=self.limits['MAX_BYTES'],
+        )
@@ -7,6 +7,7 @@ router = DefaultRouter()
 router.register('tags', views.TagViewSet)
 router.register('items', views.ItemViewSet)
 router.register('collections', views.CollectionViewSet)
+router.register('stats', views.PortfolioViewSet, basename='stats')
 
 app_name = 'collection'
 
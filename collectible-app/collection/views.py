@@ -1,35 +1,161 @@
+import csv
+import json
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef, Prefetch
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from rest_framework import viewsets, mixins, status
-from rest_framework.authentication import TokenAuthentication
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework import fields, viewsets, mixins, status
 from rest_framework.permissions import IsAuthenticated
-from base.models import Tag, Item, Collection
+from base import search, similarity
+from base.derivatives import queue_derivatives
+from base.models import Tag, Item, Collection, Portfolio, TagPortfolio
 from collection import serializers
+from collection.autocomplete import get_autocompleter
+from collection.conditional import ConditionalListMixin
+from collection.fragments import FragmentListMixin, FragmentRetrieveMixin
+from collection.pagination import KeysetPagination
+from collection.uploads import ImageUploadHandler
+from user.authentication import CachedTokenAuthentication
+
+
+# Lists through the serializer's values_representation when it has one,
+# reading plain rows instead of model instances
+class ValuesListMixin:
+    def list(self, request, *args, **kwargs):
+        serializer_class = self.get_serializer_class()
+        if not hasattr(serializer_class, 'values_representation'):
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        # Annotations the list is ordered by, which the keyset cursor reads
+        queryset = serializer_class.values_queryset(queryset, *(
+            field.lstrip('-') for field in self.ordering
+            if field.lstrip('-') in queryset.query.annotations
+        ))
+        page = self.paginate_queryset(queryset)
+        serializer = serializer_class(context=self.get_serializer_context())
+        if page is not None:
+            return self.get_paginated_response(
+                serializer.values_representation(page),
+            )
+        return Response(serializer.values_representation(list(queryset)))
+
+
+# Lets clients pick one of the viewset's `orderings` with ?ordering=. Each
+# ends on the id, so KeysetPagination can continue from any row, and each
+# is served by an index over the same columns.
+class OrderingMixin:
+    orderings = {}
+
+    # Sets self.ordering from ?ordering=, answering unknown ones with a 400
+    def select_ordering(self):
+        ordering = self.request.query_params.get('ordering')
+        if ordering:
+            if ordering not in self.orderings:
+                raise ValidationError({'ordering': [
+                    f'Expected one of {", ".join(sorted(self.orderings))}.'
+                ]})
+            self.ordering = self.orderings[ordering]
+        return self.ordering
 
 
 # A basic viewset for Collection attributes
-class BaseCollectionAttrViewset(viewsets.GenericViewSet,
+class BaseCollectionAttrViewset(OrderingMixin,
+                                ConditionalListMixin,
+                                ValuesListMixin,
+                                viewsets.GenericViewSet,
                                 mixins.ListModelMixin,
                                 mixins.CreateModelMixin):
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    pagination_class = KeysetPagination
+    ordering = ('-name', '-id')
+    # Orderings clients may ask for with ?ordering=
+    orderings = {
+        'usage': ('collection_count', 'id'),
+        '-usage': ('-collection_count', '-id'),
+    }
+    bulk_max_size = 10000
+    max_autocomplete_length = 100
 
-    # Returns objects for the currently authenticated User only
+    # Returns objects for the currently authenticated User only. Objects in
+    # use are found from their collection_count, so the filter reads an
+    # index instead of joining the links.
     def get_queryset(self):
         assigned_only = bool(
             int(self.request.query_params.get('assigned_only', 0))
         )
+        ordering = self.select_ordering()
         queryset = self.queryset
         if assigned_only:
-            queryset = queryset.filter(collection__isnull=False)
+            queryset = queryset.filter(collection_count__gt=0)
         return queryset.filter(
             user=self.request.user
-            ).order_by('-name').distinct()
+            ).order_by(*ordering)
 
     # Creates a new object
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+    # Creates one object, or upserts many by name when the body is a list
+    def create(self, request, *args, **kwargs):
+        if not isinstance(request.data, list):
+            return super().create(request, *args, **kwargs)
+        if len(request.data) > self.bulk_max_size:
+            return Response(
+                {'detail': f'At most {self.bulk_max_size} objects can be '
+                           f'created per request.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        context = self.get_serializer_context()
+        context['upsert'] = True
+        serializer = self.get_serializer_class()(
+            data=request.data,
+            many=True,
+            context=context,
+        )
+        serializer.is_valid(raise_exception=True)
+        names = [row['name'] for row in serializer.validated_data]
+        with transaction.atomic():
+            ids = self.queryset.model.objects.upsert_names(
+                request.user,
+                names,
+            )
+        return Response(
+            [{'id': ids[name], 'name': name} for name in names],
+            status=status.HTTP_201_CREATED,
+        )
+
+    @action(methods=['GET'], detail=False)
+    # Lists up to ?limit= of the User's names starting like ?q=, most used
+    # first, followed by names close to it, from an index of the names held
+    # in memory once the User is typing
+    def autocomplete(self, request):
+        autocompleter = get_autocompleter()
+        max_limit = autocompleter.options['MAX_LIMIT']
+        text = request.query_params.get('q', '').strip()
+        errors = {}
+        if not 0 < len(text) <= self.max_autocomplete_length:
+            errors['q'] = [f'Expected from 1 to '
+                           f'{self.max_autocomplete_length} characters.']
+        try:
+            limit = int(request.query_params.get(
+                'limit', autocompleter.options['LIMIT'],
+            ))
+        except ValueError:
+            limit = 0
+        if not 0 < limit <= max_limit:
+            errors['limit'] = [f'Expected a whole number from 1 to '
+                               f'{max_limit}.']
+        if errors:
+            raise ValidationError(errors)
+        return Response(autocompleter.complete(
+            self.queryset.model, request.user, text, limit,
+        ))
+
 
 # Manages Tags in the database
 class TagViewSet(BaseCollectionAttrViewset):
@@ -43,29 +169,187 @@ class ItemViewSet(BaseCollectionAttrViewset):
     serializer_class = serializers.ItemSerializer
 
 
+# Serves the statistics of the User's Collections from their portfolio
+# summaries: the totals from one row, and the breakdown by Tag, worth most
+# first, from an index on the summaries of the Tags
+class PortfolioViewSet(viewsets.GenericViewSet):
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+    queryset = Portfolio.objects.all()
+    serializer_class = serializers.PortfolioSerializer
+    max_tags = 50
+
+    def list(self, request):
+        portfolio = self.queryset.filter(user=request.user).first()
+        data = self.get_serializer(
+            portfolio or Portfolio(user=request.user),
+        ).data
+        tags = TagPortfolio.objects.filter(
+            user=request.user, collection_count__gt=0,
+        ).select_related('tag').order_by('-value', '-tag')[:self.max_tags]
+        data['tags'] = serializers.TagPortfolioSerializer(
+            tags, many=True,
+        ).data
+        return Response(data)
+
+
 # Manages Collections in the database
-class CollectionViewSet(viewsets.ModelViewSet):
+class CollectionViewSet(OrderingMixin,
+                        ConditionalListMixin,
+                        FragmentListMixin,
+                        ValuesListMixin,
+                        FragmentRetrieveMixin,
+                        viewsets.ModelViewSet):
     serializer_class = serializers.CollectionSerializer
-    queryset = Collection.objects.all()
-    authentication_classes = (TokenAuthentication,)
+    # The search vector is only ever read by the database
+    queryset = Collection.objects.defer('search_vector')
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    pagination_class = KeysetPagination
+    ordering = ('-id',)
+    # Orderings clients may ask for with ?ordering=, each served by one of
+    # the per-User indexes of Collection in either direction
+    orderings = {
+        'id': ('id',),
+        '-id': ('-id',),
+        'floor_price': ('floor_price', 'id'),
+        '-floor_price': ('-floor_price', '-id'),
+        'items_in_collection': ('items_in_collection', 'id'),
+        '-items_in_collection': ('-items_in_collection', '-id'),
+        'title': ('title', 'id'),
+        '-title': ('-title', '-id'),
+    }
+    # Range filters as {prefix: (model field, parser)}, taken from
+    # ?<prefix>_min= and ?<prefix>_max=
+    range_filters = {
+        'floor_price': (
+            'floor_price',
+            fields.DecimalField(max_digits=8, decimal_places=2),
+        ),
+        'items': ('items_in_collection', fields.IntegerField()),
+    }
+    # Ordering of ?search= results when no other ordering is asked for,
+    # best matches first
+    search_ordering = ('-rank', '-id')
+    max_search_length = 200
+    # Many-to-many fields the list can be filtered on, and how many ids
+    # each filter takes
+    m2m_filters = ('tags', 'items')
+    max_filter_ids = 1000
+    export_chunk_size = 2000
+    export_fields = ('id', 'title', 'items', 'tags', 'items_in_collection',
+                     'floor_price', 'link')
+    # Actions whose Collection stays locked from when it is read until the
+    # write commits, so the size and floor price its portfolios are moved
+    # on from are those being replaced rather than a concurrent write's
+    locking_actions = ('update', 'partial_update', 'destroy')
 
-    # Converts a list of string IDs to a list of integers
-    def _params_to_ints(self, qs):
-        return [int(str_id) for str_id in qs.split(',')]
+    # Converts the comma separated ids of a query parameter to a list of
+    # distinct integers, answering malformed ones with a 400
+    def _params_to_ints(self, qs, param='ids'):
+        try:
+            ids = list(dict.fromkeys(int(str_id) for str_id in qs.split(',')))
+        except ValueError:
+            raise ValidationError({param: [
+                'Expected a comma separated list of ids.'
+            ]})
+        if len(ids) > self.max_filter_ids:
+            raise ValidationError({param: [
+                f'At most {self.max_filter_ids} ids can be given.'
+            ]})
+        return ids
 
-    # Retrieves the Collection list for the authenticated User
+    # Retrieves the Collection list for the authenticated User, filtered by
+    # ?search=, the range filters and to the Collections holding any or all
+    # of the ?tags= and ?items= given, as ?tags_mode= and ?items_mode= say
     def get_queryset(self):
-        tags = self.request.query_params.get('tags')
-        items = self.request.query_params.get('items')
-        queryset = self.queryset
-        if tags:
-            tag_ids = self._params_to_ints(tags)
-            queryset = queryset.filter(tags__id__in=tag_ids)
-        if items:
-            item_ids = self._params_to_ints(items)
-            queryset = queryset.filter(items__id__in=item_ids)
-        return queryset.filter(user=self.request.user)
+        queryset = self._filter_ranges(self.queryset)
+        text = self.request.query_params.get('search', '').strip()
+        if text:
+            if len(text) > self.max_search_length:
+                raise ValidationError({'search': [
+                    f'At most {self.max_search_length} characters can be '
+                    f'searched for.'
+                ]})
+            queryset = search.search(queryset, text)
+            self.ordering = self.search_ordering
+        ordering = self.select_ordering()
+        for name in self.m2m_filters:
+            param = self.request.query_params.get(name)
+            if not param:
+                continue
+            mode = self.request.query_params.get(f'{name}_mode', 'any')
+            if mode not in ('any', 'all'):
+                raise ValidationError({f'{name}_mode': [
+                    'Expected "any" or "all".'
+                ]})
+            ids = self._params_to_ints(param, name)
+            queryset = self._filter_links(queryset, name, ids, mode)
+        queryset = self._prefetch_for_action(queryset)
+        if self.action in self.locking_actions:
+            queryset = queryset.select_for_update()
+        return queryset.filter(user=self.request.user).order_by(*ordering)
+
+    # Applies the ?<prefix>_min= and ?<prefix>_max= bounds of the range
+    # filters, both inclusive, answering malformed ones with a 400
+    def _filter_ranges(self, queryset):
+        bounds = {}
+        errors = {}
+        for prefix, (name, parser) in self.range_filters.items():
+            for suffix, lookup in (('min', 'gte'), ('max', 'lte')):
+                param = f'{prefix}_{suffix}'
+                value = self.request.query_params.get(param)
+                if value in (None, ''):
+                    continue
+                try:
+                    bounds[f'{name}__{lookup}'] = \
+                        parser.run_validation(value)
+                except ValidationError as error:
+                    errors[param] = error.detail
+        if errors:
+            raise ValidationError(errors)
+        return queryset.filter(**bounds)
+
+    # Filters on the links of a many-to-many field with a subquery on its
+    # link table rather than a join, so each Collection comes back once
+    # however many of the ids it holds. "any" is an EXISTS, which the
+    # database answers from the first matching link; "all" groups the
+    # matching links by Collection once and keeps those holding every id,
+    # which unlike a per-row count costs the same whether the page fills
+    # early or the whole list has to be read.
+    def _filter_links(self, queryset, name, ids, mode):
+        field = Collection._meta.get_field(name)
+        column = field.m2m_column_name()
+        links = field.remote_field.through.objects.filter(**{
+            f'{field.m2m_reverse_name()}__in': ids,
+        }).order_by()
+        if mode == 'any':
+            return queryset.filter(Exists(links.filter(**{
+                column: OuterRef('pk'),
+            })))
+        return queryset.filter(pk__in=links.values(column).annotate(
+            matched=Count('*'),
+        ).filter(matched=len(ids)).values(column))
+
+    # Prefetches only the relations the current action serializes, so the
+    # number of queries does not grow with the number of Collections
+    def _prefetch_for_action(self, queryset):
+        if self.action in ('list', 'export'):
+            # Ordered like the ids read by values_queryset for the list
+            return queryset.prefetch_related(
+                Prefetch('items',
+                         queryset=Item.objects.only('id').order_by('id')),
+                Prefetch('tags',
+                         queryset=Tag.objects.only('id').order_by('id')),
+            )
+        if self.action == 'retrieve':
+            return queryset.prefetch_related(
+                Prefetch('items', queryset=Item.objects.only('id', 'name')),
+                Prefetch('tags', queryset=Tag.objects.only('id', 'name')),
+            )
+        # update() discards the prefetch cache before rendering, and the
+        # other actions never read the relations, so nothing is prefetched
+        return queryset
 
     # Returns the appropriate serializer class
     def get_serializer_class(self):
@@ -79,17 +363,45 @@ class CollectionViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+    # Updates a Collection within the transaction holding its lock
+    def update(self, request, *args, **kwargs):
+        with transaction.atomic():
+            return super().update(request, *args, **kwargs)
+
+    # Deletes a Collection within the transaction holding its lock
+    def destroy(self, request, *args, **kwargs):
+        with transaction.atomic():
+            return super().destroy(request, *args, **kwargs)
+
     @action(methods=['POST'], detail=True, url_path='upload-image')
-    # Uploads an image to a Collection
+    # Uploads an image to a Collection, or clears it when null. Derivatives
+    # of a new image are generated on a worker after the response is sent,
+    # and show up in image_derivatives once they are ready.
     def upload_image(self, request, pk=None):
         collection = self.get_object()
+        # Only read the body once the Collection is known to exist, and
+        # stream it through the limits of ImageUploadHandler
+        request.upload_handlers = [ImageUploadHandler(request._request)]
         serializer = self.get_serializer(
             collection,
             data=request.data,
         )
 
         if serializer.is_valid():
-            serializer.save()
+            outdated = {}
+            if 'image' in serializer.validated_data:
+                # What was made of the old image goes with it, whether it
+                # is replaced or cleared
+                outdated = {'image_derivatives': {}, 'image_hash': None}
+            with transaction.atomic():
+                # Saved over the row as it is now rather than as it was
+                # before the body was read, locked until the commit
+                serializer.instance = get_object_or_404(
+                    self.get_queryset().select_for_update(), pk=collection.pk,
+                )
+                collection = serializer.save(**outdated)
+                if outdated and collection.image:
+                    queue_derivatives(collection)
             return Response(
                 serializer.data,
                 status=status.HTTP_200_OK,
@@ -98,3 +410,82 @@ class CollectionViewSet(viewsets.ModelViewSet):
             serializer.errors,
             status=status.HTTP_400_BAD_REQUEST,
         )
+
+    @action(methods=['GET'], detail=True)
+    # Lists the Collections of any User whose image looks like this one's,
+    # within the Hamming distance between perceptual hashes given by
+    # ?distance=, closest first. Collections whose image has not been
+    # hashed yet have no matches.
+    def similar(self, request, pk=None):
+        collection = self.get_object()
+        options = similarity.get_options()
+        try:
+            distance = int(
+                request.query_params.get('distance', options['DISTANCE'])
+            )
+        except ValueError:
+            distance = -1
+        if not 0 <= distance <= options['MAX_DISTANCE']:
+            return Response(
+                {'distance': [f'Expected a whole number from 0 to '
+                              f'{options["MAX_DISTANCE"]}.']},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        matches = similarity.similar_collections(collection, distance)
+        return Response([
+            {'id': pk, 'distance': apart, 'own': user_id == request.user.id}
+            for apart, pk, user_id in matches
+        ])
+
+    @action(methods=['GET'], detail=False, url_path='export')
+    # Streams every matching Collection as NDJSON or CSV. Rows are read with
+    # a server-side cursor and their Items and Tags are prefetched one chunk
+    # at a time, so memory use stays flat however many Collections there are.
+    def export(self, request):
+        export_format = request.query_params.get('export_format', 'ndjson')
+        if export_format not in ('ndjson', 'csv'):
+            return Response(
+                {'export_format': ['Expected "ndjson" or "csv".']},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        queryset = self.filter_queryset(self.get_queryset())
+        rows = queryset.iterator(chunk_size=self.export_chunk_size)
+        serializer = self.get_serializer()
+        if export_format == 'csv':
+            content = self._export_csv(serializer, rows)
+            content_type = 'text/csv'
+        else:
+            content = self._export_ndjson(serializer, rows)
+            content_type = 'application/x-ndjson'
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = (
+            f'attachment; filename="collections.{export_format}"'
+        )
+        return response
+
+    # Yields one JSON document per line
+    def _export_ndjson(self, serializer, rows):
+        for row in rows:
+            yield json.dumps(
+                serializer.to_representation(row),
+                cls=JSONEncoder,
+            ) + '\n'
+
+    # Yields a header line and then one CSV line per Collection, with the
+    # Item and Tag ids separated by "|"
+    def _export_csv(self, serializer, rows):
+        line = _EchoBuffer()
+        writer = csv.writer(line)
+        yield writer.writerow(self.export_fields)
+        for row in rows:
+            data = serializer.to_representation(row)
+            for name in ('items', 'tags'):
+                data[name] = '|'.join(str(pk) for pk in data[name])
+            yield writer.writerow([data[name] for name in self.export_fields])
+
+
+# File-like object whose write() hands the written line straight back, so a
+# csv.writer can produce lines for a streaming response
+class _EchoBuffer:
+    def write(self, value):
+        return value
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class UserConfig(AppConfig):
     name = 'user'
+
+    # Connects the signal handlers that keep the token cache fresh
+    def ready(self):
+        from user import signals  # noqa: F401
@@ -0,0 +1,192 @@
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.authentication import TokenAuthentication
+
+
+# Caches token key -> (User, Token) lookups in a bounded per-process LRU
+# with a TTL, and optionally in a shared Django cache behind it. Entries are
+# dropped by the signal handlers in user.signals as soon as a Token or its
+# User changes. Every process has to hear of that too, so the shared tier
+# also keeps when each token was last revoked, and an entry of either tier
+# is only served if it was read from the database after that. Without a
+# shared tier other processes only see the change once their own entry
+# expires, so LOCAL_TTL then defaults to a second.
+class TokenCache:
+    def __init__(self, max_entries=10000, local_ttl=60, shared_cache=None,
+                 shared_ttl=300):
+        self.max_entries = max_entries
+        self.local_ttl = local_ttl
+        self.shared_cache = shared_cache
+        self.shared_ttl = shared_ttl
+        # Revocations outlive every entry read before them, including a
+        # local copy of a shared entry made just before it expired
+        self.revoked_ttl = shared_ttl + local_ttl + 60
+        self._entries = OrderedDict()
+        self._keys_by_user = {}
+        self._lock = threading.Lock()
+
+    # Builds the cache from the TOKEN_AUTH_CACHE setting
+    @classmethod
+    def from_settings(cls):
+        options = getattr(settings, 'TOKEN_AUTH_CACHE', {})
+        shared_cache = options.get('SHARED_CACHE')
+        return cls(
+            max_entries=options.get('MAX_ENTRIES', 10000),
+            local_ttl=options.get('LOCAL_TTL', 60 if shared_cache else 1),
+            shared_cache=shared_cache,
+            shared_ttl=options.get('SHARED_TTL', 300),
+        )
+
+    # Returns the (User, Token) cached for `key`, or None
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= now:
+                self._forget(key)
+                entry = None
+        if entry is not None:
+            _, user, token, loaded = entry
+            if not self._revoked_since(key, loaded):
+                with self._lock:
+                    if key in self._entries:
+                        self._entries.move_to_end(key)
+                return user, token
+            with self._lock:
+                self._forget(key)
+            return None
+        if self.shared_cache is None:
+            return None
+        cached = caches[self.shared_cache].get(self._shared_key(key))
+        if cached is None or self._revoked_since(key, cached[2]):
+            return None
+        self._store_local(key, *cached)
+        return cached[:2]
+
+    # Caches the (User, Token) pair for `key` in every tier, as read from
+    # the database at `loaded`, a time.time() taken before the read
+    def set(self, key, user, token, loaded=None):
+        loaded = time.time() if loaded is None else loaded
+        self._store_local(key, user, token, loaded)
+        if self.shared_cache is not None:
+            caches[self.shared_cache].set(
+                self._shared_key(key), (user, token, loaded),
+                self.shared_ttl,
+            )
+
+    # Drops `key` from every tier
+    def delete(self, key):
+        with self._lock:
+            self._forget(key)
+        self._revoke([key])
+
+    # Drops every cached key of a User, including `keys` the User holds
+    # in the database that this process never cached itself
+    def delete_user(self, user_id, keys=()):
+        with self._lock:
+            keys = set(keys) | self._keys_by_user.get(user_id, set())
+            for key in keys:
+                self._forget(key)
+        self._revoke(keys)
+
+    # Empties the local tier
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_user.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    # Removes keys from the shared tier and marks them as revoked now, so
+    # other processes drop their own entries of them on the next lookup
+    def _revoke(self, keys):
+        if self.shared_cache is None or not keys:
+            return
+        cache = caches[self.shared_cache]
+        cache.delete_many([self._shared_key(key) for key in keys])
+        now = time.time()
+        cache.set_many(
+            {self._revoked_key(key): now for key in keys},
+            self.revoked_ttl,
+        )
+
+    # Tells whether `key` was revoked after an entry of it was read
+    def _revoked_since(self, key, loaded):
+        if self.shared_cache is None:
+            return False
+        revoked = caches[self.shared_cache].get(self._revoked_key(key))
+        return revoked is not None and revoked >= loaded
+
+    def _store_local(self, key, user, token, loaded):
+        if self.local_ttl <= 0 or self.max_entries <= 0:
+            return
+        with self._lock:
+            self._forget(key)
+            self._entries[key] = (
+                time.monotonic() + self.local_ttl, user, token, loaded,
+            )
+            self._keys_by_user.setdefault(user.pk, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._forget(next(iter(self._entries)))
+
+    # Removes `key` from the local tier; the caller holds the lock
+    def _forget(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        user_keys = self._keys_by_user.get(entry[1].pk)
+        if user_keys is not None:
+            user_keys.discard(key)
+            if not user_keys:
+                del self._keys_by_user[entry[1].pk]
+
+    # Hashes the token so raw keys are never written to the shared cache
+    def _shared_key(self, key):
+        return 'auth-token:' + self._digest(key)
+
+    def _revoked_key(self, key):
+        return 'auth-token-revoked:' + self._digest(key)
+
+    def _digest(self, key):
+        return hashlib.sha256(key.encode()).hexdigest()
+
+
+_token_cache = None
+
+
+# Returns the process-wide TokenCache, creating it on first use
+def get_token_cache():
+    global _token_cache
+    if _token_cache is None:
+        _token_cache = TokenCache.from_settings()
+    return _token_cache
+
+
+# Drops the process-wide TokenCache so it is rebuilt from settings
+def reset_token_cache():
+    global _token_cache
+    _token_cache = None
+
+
+# Token authentication that only goes to the database on a cache miss
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        cache = get_token_cache()
+        cached = cache.get(key)
+        if cached is None:
+            # Taken before the read, so a revocation made while it runs
+            # still outdates the entry
+            loaded = time.time()
+            user, token = super().authenticate_credentials(key)
+            cache.set(key, user, token, loaded)
+            cached = (user, token)
+        user, token = cached
+        # Each request gets its own copy, so changes made while handling
+        # one request never leak into another through the cache
+        return copy.copy(user), token
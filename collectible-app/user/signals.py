@@ -0,0 +1,25 @@
+from django.contrib.auth import get_user_model as gum
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+from user.authentication import get_token_cache
+
+
+# Drops a cached Token as soon as it is saved again or deleted
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def invalidate_token(sender, instance, **kwargs):
+    get_token_cache().delete(instance.key)
+
+
+# Drops the cached Tokens of a User who was changed or deleted, so that a
+# deactivated User or a changed password takes effect on the next request
+@receiver(post_save, sender=gum())
+@receiver(post_delete, sender=gum())
+def invalidate_user_tokens(sender, instance, created=False, **kwargs):
+    if created:
+        return
+    keys = Token.objects.filter(user_id=instance.pk).values_list(
+        'key', flat=True,
+    )
+    get_token_cache().delete_user(instance.pk, keys)
@@ -0,0 +1,153 @@
+import time
+from unittest.mock import patch
+from django.contrib.auth import get_user_model as gum
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from user.authentication import (TokenCache, get_token_cache,
+                                 reset_token_cache)
+
+
+ME_URL = reverse('user:me')
+TAGS_URL = reverse('collection:tag-list')
+
+
+# Tests the cached token authentication
+class CachedTokenAuthenticationTests(TestCase):
+    def setUp(self):
+        reset_token_cache()
+        self.user = gum().objects.create_user(
+            email='loremipsum@gmail.com',
+            password='Tbin5041',
+            name='Lonestar',
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def tearDown(self):
+        reset_token_cache()
+
+    # Tests that a cached token is authenticated without a token query
+    def test_cached_token_skips_database(self):
+        self.assertEqual(self.client.get(ME_URL).status_code, 200)
+        with self.assertNumQueries(0):
+            res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['email'], self.user.email)
+
+    # Tests that deleting a token stops it from authenticating
+    def test_deleted_token_rejected(self):
+        self.client.get(ME_URL)
+        self.token.delete()
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    # Tests that deactivating a User stops their cached token at once
+    def test_deactivated_user_rejected(self):
+        self.client.get(ME_URL)
+        self.user.is_active = False
+        self.user.save()
+        res = self.client.get(TAGS_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    # Tests that changes made through the me endpoint are seen right away
+    def test_profile_update_refreshes_cache(self):
+        self.client.get(ME_URL)
+        self.client.patch(ME_URL, {'name': 'Cody Bentsen'})
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.data['name'], 'Cody Bentsen')
+
+    # Tests that a token issued after a delete replaces the cached one
+    def test_regenerated_token(self):
+        self.client.get(ME_URL)
+        old_key = self.token.key
+        self.token.delete()
+        new_token = Token.objects.create(user=self.user)
+        self.assertIsNone(get_token_cache().get(old_key))
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {new_token.key}')
+        self.assertEqual(self.client.get(ME_URL).status_code, 200)
+
+    # Tests the shared tier is used when the local tier has no entry
+    @override_settings(
+        CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }},
+        TOKEN_AUTH_CACHE={'SHARED_CACHE': 'default', 'LOCAL_TTL': 60},
+    )
+    def test_shared_tier(self):
+        reset_token_cache()
+        self.client.get(ME_URL)
+        get_token_cache().clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(ME_URL).status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        get_token_cache().clear()
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+# Tests the TokenCache bounds
+class TokenCacheTests(TestCase):
+    def setUp(self):
+        self.user = gum().objects.create_user(
+            email='loremipsum@gmail.com',
+            password='Tbin5041',
+        )
+
+    # Tests that the least recently used entry is evicted first
+    def test_lru_eviction(self):
+        cache = TokenCache(max_entries=2)
+        cache.set('a', self.user, None)
+        cache.set('b', self.user, None)
+        cache.get('a')
+        cache.set('c', self.user, None)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('a'))
+
+    # Tests that entries expire after the TTL
+    @patch('user.authentication.time.monotonic')
+    def test_ttl_expiry(self, monotonic):
+        monotonic.return_value = 100
+        cache = TokenCache(local_ttl=10)
+        cache.set('a', self.user, None)
+        monotonic.return_value = 109
+        self.assertIsNotNone(cache.get('a'))
+        monotonic.return_value = 111
+        self.assertIsNone(cache.get('a'))
+
+    # Tests dropping every entry of a User
+    def test_delete_user(self):
+        cache = TokenCache()
+        cache.set('a', self.user, None)
+        cache.set('b', self.user, None)
+        cache.delete_user(self.user.pk)
+        self.assertEqual(len(cache), 0)
+
+    # Tests a token revoked by another process is turned away by this one,
+    # including when it was read from the database before the revocation
+    # and cached after it
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }})
+    def test_revoked_in_other_process(self):
+        mine = TokenCache(shared_cache='default')
+        other = TokenCache(shared_cache='default')
+        mine.set('a', self.user, None)
+        mine.set('b', self.user, None)
+        loaded = time.time()
+        other.delete_user(self.user.pk, ['a', 'b'])
+        self.assertIsNone(mine.get('a'))
+        mine.set('b', self.user, None, loaded)
+        self.assertIsNone(mine.get('b'))
+        mine.set('b', self.user, None)
+        self.assertIsNotNone(mine.get('b'))
+
+    # Tests entries live a second in each process without a shared cache
+    @override_settings(TOKEN_AUTH_CACHE={})
+    def test_local_ttl_without_shared_cache(self):
+        self.assertEqual(TokenCache.from_settings().local_ttl, 1)